@@ -28,5 +28,5 @@ np.random.seed(1234567890)
 gr = sisl.geom.graphene(orthogonal=True)
 H = sisl.Hamiltonian(gr)
 H.construct([(0.1, 1.44), (0., -2.7)])
-H.repeat(N, 0).repeat(N, 1)
+H.repeat((N, N, 1))
 H.finalize()
@@ -28,5 +28,5 @@ np.random.seed(1234567890)
 gr = sisl.geom.graphene(orthogonal=True)
 H = sisl.Hamiltonian(gr)
 H.construct([(0.1, 1.44), (0., -2.7)])
-H = H.tile(N, 0).tile(N, 1)
+H = H.tile((N, N, 1))
 H.finalize()
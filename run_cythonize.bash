@@ -4,6 +4,7 @@ files="
 _math_small.pyx
 _indices.pyx
 _supercell.pyx
+physics/_density.pyx
 "
 
 for file in $files
@@ -0,0 +1,87 @@
+""" Least recently used cache of arrays with a memory limit """
+from __future__ import print_function, division
+
+import os
+from collections import OrderedDict
+
+
+__all__ = ['LRUCache', 'cache_bytes_env']
+
+
+def cache_bytes_env(name, default=256):
+    """ Memory limit (in bytes) of a cache from the environment variable `name` (in MB)
+
+    Parameters
+    ----------
+    name : str
+       name of the environment variable holding the memory limit in MB
+    default : float, optional
+       memory limit (in MB) if `name` is not defined
+    """
+    return int(float(os.environ.get(name, default)) * 1024 ** 2)
+
+
+class LRUCache(object):
+    """ Least recently used cache of values with a memory limit
+
+    When adding a value would exceed `max_bytes` the least recently used values
+    are discarded. Values larger than `max_bytes` are never stored.
+
+    Parameters
+    ----------
+    max_bytes : int
+       maximum memory used by the cached values
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._values = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+        """ Remove all values from the cache """
+        self._values = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Return the value stored for `key`, or ``None`` if it is not cached """
+        entry = self._values.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Move to the end (most recently used)
+        self._values[key] = entry
+        return entry[0]
+
+    def add(self, key, value, nbytes=None):
+        """ Store `value` for `key`, the least recently used values are discarded if needed
+
+        Parameters
+        ----------
+        key : hashable
+           the key of the value
+        value : object
+           the value to store
+        nbytes : int, optional
+           memory used by `value`, defaults to ``value.nbytes``
+        """
+        if nbytes is None:
+            nbytes = value.nbytes
+        if nbytes > self.max_bytes:
+            return
+        old = self._values.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        while self.nbytes + nbytes > self.max_bytes:
+            _, (_, n) = self._values.popitem(last=False)
+            self.nbytes -= n
+        self._values[key] = (value, nbytes)
+        self.nbytes += nbytes
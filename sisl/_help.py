@@ -1,13 +1,16 @@
 from __future__ import print_function, division
 
+import os
 import sys
 import collections
+from multiprocessing import cpu_count
 
 import numpy as np
 
 __all__ = ['array_fill_repeat']
 __all__ += ['isndarray', 'isiterable']
 __all__ += ['get_dtype', 'dtype_complex_to_real']
+__all__ += ['num_threads']
 
 # Wrappers typically used
 __all__ += ['_str', '_range', '_zip', '_map']
@@ -139,3 +142,12 @@ def dtype_complex_to_real(dtype):
     elif dtype == np.complex64:
         return np.float32
     return dtype
+
+
+def num_threads():
+    """ Number of threads used in threaded routines (grid projections, interpolations)
+
+    Defaults to the number of cores, but may be controlled with the environment
+    variable ``SISL_NUM_THREADS``.
+    """
+    return max(1, int(os.environ.get('SISL_NUM_THREADS', cpu_count())))
@@ -24,9 +24,10 @@ from .utils import angle, direction
 from .utils import lstranges, strmap, array_arange
 from .utils.mathematics import fnorm
 from .quaternion import Quaternion
-from .supercell import SuperCell, SuperCellChild
+from .supercell import SuperCell, SuperCellChild, _reps_per_axis
 from .atom import Atom, Atoms
 from .shape import Shape, Sphere, Cube
+from .sparse import SparseCSR
 from .sparse_geometry import SparseAtom
 
 __all__ = ['Geometry', 'sgeom']
@@ -969,16 +970,19 @@ class Geometry(SuperCellChild):
         atom = np.delete(_a.arangei(self.na), atom)
         return self.sub(atom)
 
-    def tile(self, reps, axis):
+    def tile(self, reps, axis=None):
         """ Tile the geometry to create a bigger one
 
         The atomic indices are retained for the base structure.
 
         Parameters
         ----------
-        reps  : int
-           number of tiles (repetitions)
-        axis  : int
+        reps  : int or array_like of int
+           number of tiles (repetitions). If `axis` is ``None`` this should
+           be the number of tiles along each of the 3 lattice vectors in which case
+           the tiling is performed in one go (equivalent to successive tilings along
+           the first, second and third lattice vector).
+        axis  : int, optional
            direction of tiling, 0, 1, 2 according to the cell-direction
 
         Examples
@@ -1000,34 +1004,38 @@ class Geometry(SuperCellChild):
          [0.5  1.   0. ]
          [1.   1.   0. ]
          [1.5  1.   0. ]]
+        >>> g == geom.tile((2, 2, 1))
+        True
 
         See Also
         --------
         repeat : equivalent but different ordering of final structure
         cut : opposite method of this
         """
-        if reps < 1:
-            raise ValueError(self.__class__.__name__ + '.tile() requires a repetition above 0')
+        reps = _reps_per_axis(reps, axis)
+        ntile = reps.prod()
 
-        sc = self.sc.tile(reps, axis)
+        sc = self.sc.tile(reps)
 
         # Our first repetition *must* be with
         # the former coordinate
-        xyz = np.tile(self.xyz, (reps, 1))
+        xyz = np.tile(self.xyz, (ntile, 1))
         # We may use broadcasting rules instead of repeating stuff
-        xyz.shape = (reps, self.na, 3)
-        nr = _a.arangei(reps)
-        nr.shape = (reps, 1)
+        # The tiles are ordered with the first lattice vector running fastest
+        xyz.shape = (reps[2], reps[1], reps[0], self.na, 3)
         for i in range(3):
+            if reps[i] == 1:
+                continue
+            nr = _a.arangei(reps[i]).reshape([-1] + [1] * (2 + i))
             # Correct the unit-cell offsets along `i`
-            xyz[:, :, i] += nr * self.cell[axis, i]
+            xyz[...] += nr * self.cell[i, :]
         xyz.shape = (-1, 3)
 
         # Create the geometry and return it (note the smaller atoms array
         # will also expand via tiling)
-        return self.__class__(xyz, atom=self.atom.tile(reps), sc=sc)
+        return self.__class__(xyz, atom=self.atom.tile(ntile), sc=sc)
 
-    def repeat(self, reps, axis):
+    def repeat(self, reps, axis=None):
         """ Create a repeated geometry
 
         The atomic indices are *NOT* retained for the base structure.
@@ -1052,9 +1060,12 @@ class Geometry(SuperCellChild):
 
         Parameters
         ----------
-        reps  : int
-           number of repetitions
-        axis  : int
+        reps  : int or array_like of int
+           number of repetitions. If `axis` is ``None`` this should
+           be the number of repetitions along each of the 3 lattice vectors in which case
+           the repetition is performed in one go (equivalent to successive repetitions along
+           the first, second and third lattice vector).
+        axis  : int, optional
            direction of repetition, 0, 1, 2 according to the cell-direction
 
         Examples
@@ -1076,30 +1087,34 @@ class Geometry(SuperCellChild):
          [0.5  1.   0. ]
          [1.5  0.   0. ]
          [1.5  1.   0. ]]
+        >>> g == geom.repeat((2, 2, 1))
+        True
 
         See Also
         --------
         tile : equivalent but different ordering of final structure
         """
-        if reps < 1:
-            raise ValueError(self.__class__.__name__ + '.repeat() requires a repetition above 0')
+        reps = _reps_per_axis(reps, axis)
+        nrep = reps.prod()
 
-        sc = self.sc.repeat(reps, axis)
+        sc = self.sc.repeat(reps)
 
         # Our first repetition *must* be with
         # the former coordinate
-        xyz = np.repeat(self.xyz, reps, axis=0)
+        xyz = np.repeat(self.xyz, nrep, axis=0)
         # We may use broadcasting rules instead of repeating stuff
-        xyz.shape = (self.na, reps, 3)
-        nr = _a.arangei(reps)
-        nr.shape = (1, reps)
+        # The repetitions are ordered with the last lattice vector running fastest
+        xyz.shape = (self.na, reps[0], reps[1], reps[2], 3)
         for i in range(3):
+            if reps[i] == 1:
+                continue
+            nr = _a.arangei(reps[i]).reshape([-1] + [1] * (3 - i))
             # Correct the unit-cell offsets along `i`
-            xyz[:, :, i] += nr * self.cell[axis, i]
+            xyz[...] += nr * self.cell[i, :]
         xyz.shape = (-1, 3)
 
         # Create the geometry and return it
-        return self.__class__(xyz, atom=self.atom.repeat(reps), sc=sc)
+        return self.__class__(xyz, atom=self.atom.repeat(nrep), sc=sc)
 
     def __mul__(self, m):
         """ Implement easy repeat function
@@ -1168,10 +1183,7 @@ class Geometry(SuperCellChild):
 
         if len(m) == 1:
             #  r
-            m = m[0]
-            g = self.copy()
-            for i in range(3):
-                g = getattr(g, method)(m, i)
+            g = getattr(self, method)([m[0]] * 3)
 
         elif len(m) == 2:
             #  (r, axis)
@@ -1179,9 +1191,7 @@ class Geometry(SuperCellChild):
 
         elif len(m) == 3:
             #  (r, r, r)
-            g = self.copy()
-            for i in range(3):
-                g = getattr(g, method)(m[i], i)
+            g = getattr(self, method)(m)
 
         else:
             raise ValueError('Multiplying a geometry has received a wrong argument')
@@ -2497,6 +2507,176 @@ class Geometry(SuperCellChild):
     # but ``close`` is shorten and retains meaning
     close_all = close
 
+    def close_many(self, centers, R=None, idx=None,
+                   ret_xyz=False, ret_rij=False, chunk=2 ** 22):
+        """ Indices of atoms in the entire supercell within a given radius from many centres
+
+        This is the batched equivalent of `close`. The neighbours of all
+        centres are searched in a single pass using a cell-list (binning)
+        of all supercell images, and the results are returned in a
+        compressed (CSR-like) format.
+
+        The neighbour indices are supercell indices, i.e. an atom in
+        supercell ``isc`` has index ``isc * na + ia`` (see `close`).
+        For each centre the indices are sorted in ascending order, hence
+        ``idx[ptr[i]:ptr[i+1]]`` is equivalent to ``close(centers[i], R)``.
+
+        Parameters
+        ----------
+        centers : array_like of int or float
+            Either a list of atomic indices or a list of coordinates (shape ``(n, 3)``).
+        R : float, optional
+            The radius to search within, defaults to `maxR`. Only a single radius is
+            allowed.
+        idx : array_like of int, optional
+            List of atoms (in the unit-cell) that will be considered as neighbours.
+        ret_xyz : bool, optional
+            If true this method will also return the coordinates of the neighbours.
+        ret_rij : bool, optional
+            If true this method will also return the distances from the centres
+            to the neighbours.
+        chunk : int, optional
+            maximum number of candidate pairs handled at once, this limits the
+            memory usage for large geometries.
+
+        Returns
+        -------
+        ptr : numpy.ndarray(np.int32)
+            offsets for each centre, length ``len(centers) + 1``
+        idx : numpy.ndarray(np.int32)
+            supercell indices of the neighbours, the neighbours of centre ``i``
+            are ``idx[ptr[i]:ptr[i+1]]``
+        xyz : numpy.ndarray(np.float64)
+            coordinates of the neighbours (only if `ret_xyz` is true)
+        rij : numpy.ndarray(np.float64)
+            distances to the neighbours (only if `ret_rij` is true)
+
+        See Also
+        --------
+        close : neighbour search for a single centre
+        """
+        if R is None:
+            R = self.maxR()
+        R = _a.asarrayd(R).ravel()
+        if len(R) != 1:
+            raise ValueError(self.__class__.__name__ + '.close_many only accepts a single radius.')
+        R = R[0]
+
+        # Convert centres to coordinates
+        centers = np.asarray(centers)
+        if centers.dtype.kind in 'iu':
+            cxyz = self.xyz[centers.ravel(), :]
+        else:
+            cxyz = _a.asarrayd(centers).reshape(-1, 3)
+        nc = len(cxyz)
+
+        if idx is None:
+            idx = _a.arangei(self.na)
+        else:
+            idx = _a.asarrayi(idx).ravel()
+        axyz = self.xyz[idx, :]
+
+        def _ret(ptr, jdx, xyz, rij):
+            ret = [ptr, jdx]
+            if ret_xyz:
+                ret.append(xyz)
+            if ret_rij:
+                ret.append(rij)
+            return ret
+
+        if nc == 0 or len(idx) == 0 or R < 0.:
+            return _ret(_a.zerosi([nc + 1]), _a.emptyi([0]),
+                        _a.emptyd([0, 3]), _a.emptyd([0]))
+
+        # Only supercell images that are within the bounding box of the
+        # centres (extended by R) are considered
+        cmin = cxyz.min(0) - R
+        cmax = cxyz.max(0) + R
+        sxyz = []
+        sidx = []
+        for s in range(self.n_s):
+            xyz = axyz + self.sc.sc_off[s, :].dot(self.cell).reshape(1, 3)
+            i = np.logical_and((xyz >= cmin).all(1), (xyz <= cmax).all(1)).nonzero()[0]
+            sxyz.append(xyz[i, :])
+            sidx.append(idx[i] + self.na * s)
+        sxyz = np.concatenate(sxyz)
+        sidx = np.concatenate(sidx).astype(np.int32)
+        del axyz
+
+        # Bin all atoms in cubes of side-length R (at least), neighbours of a centre
+        # are then only found in the 27 neighbouring bins.
+        # The bin-size is bounded below to ensure the bin-indices fit in int64
+        extent = cmax - cmin
+        size = max(R, extent.max() / 2 ** 20, 1e-8)
+        nbin = np.floor(extent / size).astype(np.int64) + 1
+
+        def bin_ijk(xyz):
+            return np.clip(np.floor((xyz - cmin) / size).astype(np.int64), 0, nbin - 1)
+
+        def bin_lin(ijk):
+            return (ijk[..., 0] * nbin[1] + ijk[..., 1]) * nbin[2] + ijk[..., 2]
+
+        # Sort atoms according to their bins
+        abin = bin_lin(bin_ijk(sxyz))
+        i = np.argsort(abin, kind='mergesort')
+        sxyz = sxyz[i, :]
+        sidx = sidx[i]
+        abin, start, count = np.unique(abin[i], return_index=True, return_counts=True)
+        del i
+
+        # Find the candidate ranges for all centres (nc, 27)
+        off = _a.arrayi(list(product([-1, 0, 1], repeat=3))).astype(np.int64)
+        cijk = bin_ijk(cxyz)[:, None, :] + off[None, :, :]
+        cbin = bin_lin(cijk)
+        ib = np.searchsorted(abin, cbin).clip(0, len(abin) - 1)
+        valid = np.logical_and(abin[ib] == cbin,
+                               np.logical_and(cijk >= 0, cijk < nbin).all(2))
+        cstart = np.where(valid, start[ib], 0)
+        ccount = np.where(valid, count[ib], 0)
+        del cijk, cbin, ib, valid
+
+        # Number of candidates per centre
+        ncand = ccount.sum(1)
+        cum = np.cumsum(ncand)
+
+        nnz = _a.zerosi([nc])
+        jdx = []
+        xyz = []
+        rij = []
+        c0 = 0
+        while c0 < nc:
+            # Find the number of centres that fit in the chunk (at least one)
+            base = cum[c0] - ncand[c0]
+            c1 = max(c0 + 1, np.searchsorted(cum, base + chunk, side='right'))
+
+            n = ccount[c0:c1].ravel()
+            cand = array_arange(cstart[c0:c1].ravel(), n=n)
+            icent = np.repeat(_a.arangei(c1 - c0), ncand[c0:c1])
+            dxyz = sxyz[cand, :] - cxyz[c0 + icent, :]
+            i, d = indices_in_sphere_with_dist(dxyz, R)
+            del dxyz
+
+            # Sort by centre and supercell index
+            j = sidx[cand[i]]
+            icent = icent[i]
+            s = np.lexsort((j, icent))
+            nnz[c0:c1] = np.bincount(icent, minlength=c1 - c0)
+            jdx.append(j[s])
+            if ret_xyz:
+                xyz.append(sxyz[cand[i[s]], :])
+            if ret_rij:
+                rij.append(d[s])
+            c0 = c1
+
+        ptr = _a.zerosi([nc + 1])
+        _a.cumsumi(nnz, out=ptr[1:])
+
+        if ret_xyz:
+            xyz = np.concatenate(xyz)
+        if ret_rij:
+            rij = np.concatenate(rij)
+        return _ret(ptr, np.concatenate(jdx).astype(np.int32), xyz, rij)
+
     def a2o(self, ia, all=False):
         """
         Returns an orbital index of the first orbital of said atom.
@@ -2530,8 +2710,6 @@ class Geometry(SuperCellChild):
     def o2a(self, io, uniq=False):
         """ Atomic index corresponding to the orbital indicies.
 
-        This is a particurlaly slow algorithm due to for-loops.
-
         Note that this will preserve the super-cell offsets.
 
         Parameters
@@ -2542,17 +2720,17 @@ class Geometry(SuperCellChild):
              If True only return the unique atoms.
         """
         if isinstance(io, Integral):
+            a = np.searchsorted(self.lasto, io % self.no) + (io // self.no) * self.na
             if uniq:
-                return np.unique(np.argmax(io % self.no <= self.lasto) + (io // self.no) * self.na)
-            return np.argmax(io % self.no <= self.lasto) + (io // self.no) * self.na
+                return np.unique(a)
+            return a
 
-        a = _a.asarrayi(io).ravel() % self.no
-        # Use b-casting rules
-        a.shape = (-1, 1)
-        a = np.argmax(a <= self.lasto, axis=1)
+        io = _a.asarrayi(io).ravel()
+        # lasto is sorted, so the atom is the first with lasto >= io
+        a = np.searchsorted(self.lasto, io % self.no) + (io // self.no) * self.na
         if uniq:
-            return np.unique(a + (io // self.no) * self.na)
-        return a + (io // self.no) * self.na
+            return np.unique(a)
+        return a
 
     def sc2uc(self, atom, uniq=False):
         """ Returns atom from super-cell indices to unit-cell indices, possibly removing dublicates
@@ -2735,10 +2913,9 @@ class Geometry(SuperCellChild):
         dtype : numpy.dtype, numpy.float64
            the data-type of the sparse matrix
         na_iR : int, 1000
-           number of atoms within the sphere for speeding
-           up the `iter_block` loop.
+           not used, kept for backwards compatibility
         method : str, optional
-           see `iter_block` for details
+           not used, kept for backwards compatibility
 
         Returns
         -------
@@ -2747,28 +2924,25 @@ class Geometry(SuperCellChild):
 
         See Also
         --------
-        iter_block : the method for looping the atoms
+        close_many : the method for finding all atoms within a radius
         distance : create a list of distances
         """
-        rij = SparseAtom(self, nnzpr=20, dtype=dtype)
-
-        # Get R
-        R = (0.1, self.maxR())
-        iR = self.iR(na_iR)
-
-        # Do the loop
-        for ias, idxs in self.iter_block(iR=iR, method=method):
-
-            # Get all the indexed atoms...
-            # This speeds up the searching for
-            # coordinates...
-            idxs_xyz = self[idxs, :]
-
-            # Loop the atoms inside
-            for ia in ias:
-                idx, r = self.close(ia, R=R, idx=idxs, idx_xyz=idxs_xyz, ret_rij=True)
-                rij[ia, idx[1]] = r[1]
-
+        # All distances are found in a single pass
+        ptr, idx, r = self.close_many(_a.arangei(self.na), R=self.maxR(), ret_rij=True)
+
+        # Remove self-interactions (and atoms on top of each other)
+        keep = r > 0.1
+        if not keep.all():
+            ia = np.repeat(_a.arangei(self.na), np.diff(ptr))
+            _a.cumsumi(np.bincount(ia[keep], minlength=self.na), out=ptr[1:])
+            del ia
+            idx = idx[keep]
+            r = r[keep]
+        del keep
+
+        rij = SparseAtom(self, nnzpr=1, dtype=dtype)
+        rij._csr = SparseCSR((r.astype(dtype, copy=False), idx, ptr),
+                             shape=(self.na, self.na_s), dtype=dtype)
         return rij
 
     def distance(self, atom=None, R=None, tol=0.1, method='average'):
@@ -2884,13 +3058,19 @@ class Geometry(SuperCellChild):
         # First create the initial lists of shell atoms
         # The inner shell will never be used, because it should correspond
         # to the atom it-self.
-        shells = [[] for i in range(len(dR) - 1)]
-
-        for a in atom:
-            _, r = self.close(a, R=dR, ret_rij=True)
-
-            for i, rlist in enumerate(r[1:]):
-                shells[i].extend(rlist)
+        # All distances are found in a single pass and then binned in shells
+        # such that ``dR[i] < r <= dR[i+1]`` belongs to shell ``i``.
+        _, _, r = self.close_many(atom, R=dR[-1], ret_rij=True)
+        ishell = np.searchsorted(dR, r, side='left') - 1
+        r = r[ishell >= 0]
+        ishell = ishell[ishell >= 0]
+
+        # Stable sorting retains the order of the atoms in each shell
+        idx = np.argsort(ishell, kind='mergesort')
+        r = r[idx]
+        count = np.bincount(ishell, minlength=len(dR) - 1)
+        del ishell, idx
+        shells = np.split(r, _a.cumsumi(count)[:-1])
 
         # Now parse all of the shells with the correct routine
         # First we grap the routine:
@@ -5,12 +5,13 @@ from math import pi
 
 import numpy as np
 from numpy import int32
-from numpy import floor, dot, add, cos, sin
-from numpy import ogrid, take
+from numpy import floor, dot
+from numpy import take
+from multiprocessing.pool import ThreadPool
 
 import sisl._array as _a
-from ._help import dtype_complex_to_real
-from .shape import Shape
+from ._help import dtype_complex_to_real, num_threads
+from .shape import Shape, CompositeShape, NullShape, Ellipsoid
 from .utils import default_ArgumentParser, default_namespace
 from .utils import cmd, strseq, direction, str_spec
 from .utils import array_arange
@@ -66,6 +67,9 @@ class Grid(SuperCellChild):
     #: Constant for defining an open boundary condition
     OPEN = 4
 
+    #: Maximum number of bytes processed at a time for memory-mapped grids (see `memmap`)
+    chunk_bytes = 64 * 1024 ** 2
+
     def __init__(self, shape, bc=None, sc=None, dtype=None, geometry=None):
         if bc is None:
             bc = [[self.PERIODIC] * 2] * 3
@@ -129,48 +133,140 @@ class Grid(SuperCellChild):
         """
         self.grid.fill(val)
 
-    def interp(self, shape, method='linear', **kwargs):
+    @classmethod
+    def memmap(cls, filename, shape=None, mode='w+', bc=None, sc=None, dtype=None, geometry=None):
+        """ Create a grid with the values stored in a memory-mapped file (NumPy ``.npy`` format)
+
+        Memory-mapped grids are *out-of-core*, i.e. only the parts of the grid being used are
+        loaded into memory. Reductions (`sum`, `average`), `sub`, `cross_section`, `copy`
+        and in-place arithmetic (``+=``, ``-=``, ``*=``, ``/=``) are performed in chunks
+        (of at most `chunk_bytes`) along the first (slowest) axis.
+        Out-of-place operations return grids in memory unless explicitly stated.
+        To stream a calculation to disk, copy into a memory-mapped grid and use in-place
+        operations:
+
+        >>> rho = Grid.memmap('rho.npy', mode='r') # doctest: +SKIP
+        >>> diff = rho.copy('diff.npy') # doctest: +SKIP
+        >>> diff -= Grid.memmap('rho0.npy', mode='r') # doctest: +SKIP
+
+        Parameters
+        ----------
+        filename : str
+           file storing the grid values
+        shape : float or (3,) of int, optional
+           the shape of the grid (see `Grid`), only used (and required) for new files (``mode='w+'``).
+        mode : {'w+', 'r+', 'r', 'c'}
+           the file mode, see `numpy.memmap`. For all but ``'w+'`` the shape and data-type are read
+           from the file.
+        bc : list of int (3, 2) or (3, ), optional
+           the boundary conditions, see `Grid`.
+        sc : SuperCell, optional
+           the supercell that this grid represents, see `Grid`.
+        dtype : numpy.dtype, optional
+           the data-type of the grid for new files, default to `numpy.float64`.
+        geometry : Geometry, optional
+           associated geometry with the grid, see `Grid`.
+        """
+        from numpy.lib.format import open_memmap
+        grid = cls([1, 1, 1], bc=bc, sc=sc, geometry=geometry)
+        if mode == 'w+':
+            if shape is None:
+                raise ValueError(cls.__name__ + '.memmap requires the shape for new files')
+            if isinstance(shape, Real):
+                d = (grid.cell ** 2).sum(1) ** 0.5
+                shape = list(map(int, np.rint(d / shape)))
+            shape = tuple(_a.asarrayi(shape).ravel())
+            if len(shape) != 3:
+                raise ValueError(cls.__name__ + '.memmap requires shape to be of length 3')
+            if dtype is None:
+                dtype = np.float64
+            grid.grid = open_memmap(filename, mode=mode, dtype=dtype, shape=shape)
+        else:
+            grid.grid = open_memmap(filename, mode=mode)
+            if grid.grid.ndim != 3:
+                raise ValueError(cls.__name__ + '.memmap requires a 3D array in the file')
+        return grid
+
+    @property
+    def is_memmap(self):
+        """ Whether the grid values are stored in a memory-mapped file """
+        return getattr(self.grid, 'filename', None) is not None
+
+    def _chunks(self):
+        """ Slices of the first axis such that each chunk contains at most `chunk_bytes` bytes
+
+        For in-memory grids this is a single slice of the full grid.
+        """
+        n = self.shape[0]
+        if self.is_memmap:
+            step = max(1, self.chunk_bytes // max(1, self.grid[0].nbytes))
+        else:
+            step = max(1, n)
+        for i in range(0, n, step):
+            yield slice(i, min(i + step, n))
+
+    def flush(self):
+        """ Write any changes of a memory-mapped grid to disk (no-op for in-memory grids) """
+        if self.is_memmap:
+            self.grid.flush()
+
+    def interp(self, shape, method='linear', workers=None):
         """ Returns an interpolated version of the grid
 
+        The grid points are located at the fractional coordinates ``i / shape`` of the cell.
+        The interpolation is separable, i.e. performed axis by axis, in chunks on a pool of threads.
+        Periodic directions wrap around the cell, for other boundary conditions the values
+        beyond the last grid point are the values on the last grid point.
+
         Parameters
         ----------
         shape : int, array_like
             the new shape of the grid
-        method : str
-            the method used to perform the interpolation,
-            see `scipy.interpolate.interpn` for further details.
-        **kwargs :
-            optional arguments passed to the interpolation algorithm
-            The interpolation routine is `scipy.interpolate.interpn`
-        """
-        # Get current grid spacing
-        dold = (
-            np.linspace(0, 1, self.shape[0]),
-            np.linspace(0, 1, self.shape[1]),
-            np.linspace(0, 1, self.shape[2])
-        )
-
-        # Interpolate
-        from scipy.interpolate import interpn
-
-        # Create new grid
-        grid = self.__class__(shape, bc=np.copy(self.bc), sc=self.sc.copy())
-        # Clean-up to reduce memory
-        del grid.grid
-
-        # Create new mesh-grid
-        dnew = np.concatenate(np.meshgrid(
-            np.linspace(0, 1, shape[0]),
-            np.linspace(0, 1, shape[1]),
-            np.linspace(0, 1, shape[2])), axis=0)
-        dnew.shape = (-1, 3)
-
-        grid.grid = interpn(dold, self.grid, dnew, method=method, **kwargs)
-        # immediately delete the dnew (which is VERY large)
-        del dold, dnew
-        # Ensure that the grid has the correct shape
-        grid.grid.shape = tuple(shape)
+        method : {'linear', 'nearest', 'cubic', 'fourier'}
+            the method used to perform the interpolation. ``'cubic'`` are cubic splines (periodic
+            for periodic directions).
+            ``'fourier'`` pads/truncates the Fourier coefficients which is exact for smooth periodic
+            (band-limited) fields, all directions are treated as periodic.
+        workers : int, optional
+            number of threads, defaults to the environment variable ``SISL_NUM_THREADS``
+            or the number of cores.
 
+        Returns
+        -------
+        Grid
+            the interpolated grid with the same supercell and geometry (copies)
+        """
+        shape = _a.asarrayi(shape).ravel()
+        if shape.size != 3:
+            raise ValueError(self.__class__.__name__ + '.interp requires shape to be of length 3')
+        if not method in ('linear', 'nearest', 'cubic', 'fourier'):
+            raise ValueError(self.__class__.__name__ + ".interp requires method to be one of "
+                             "['linear', 'nearest', 'cubic', 'fourier'].")
+        if workers is None:
+            workers = num_threads()
+
+        pool = None
+        if workers > 1:
+            pool = ThreadPool(workers)
+
+        # First reduce the grid along the down-sampled axes (less work for the others)
+        data = self.grid
+        try:
+            for axis in np.argsort(shape / _a.asarrayd(self.shape), kind='mergesort'):
+                if shape[axis] == data.shape[axis]:
+                    continue
+                periodic = method == 'fourier' or np.all(self.bc[axis] == self.PERIODIC)
+                data = _interp_axis(data, axis, shape[axis], method, periodic,
+                                    pool, workers, self.chunk_bytes)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        grid = self.__class__([1, 1, 1], bc=np.copy(self.bc), **self.__sc_geometry_dict())
+        if data is self.grid:
+            data = data.copy()
+        grid.grid = data
         return grid
 
     @property
@@ -253,12 +349,37 @@ class Grid(SuperCellChild):
             d['geometry'] = self.geometry.copy()
         return d
 
-    def copy(self):
-        """ Returns a copy of the object. """
+    def _new(self, dtype=None):
+        """ Internal routine for a new grid (uninitialized values) sharing the SuperCell and Geometry
+
+        The SuperCell and Geometry are *not* copied, i.e. they are shared by reference.
+        """
+        grid = self.__class__([1, 1, 1], bc=np.copy(self.bc), geometry=self.geometry)
+        grid.sc = self.sc
+        if dtype is None:
+            dtype = self.dtype
+        grid.grid = np.empty(self.shape, dtype=dtype)
+        return grid
+
+    def copy(self, filename=None):
+        """ Returns a copy of the object.
+
+        Parameters
+        ----------
+        filename : str, optional
+           if specified the copy is a memory-mapped grid stored in this file, see `memmap`.
+           The values are copied in chunks.
+        """
         d = self.__sc_geometry_dict()
-        grid = self.__class__(np.copy(self.shape), bc=np.copy(self.bc),
-                              dtype=self.dtype, **d)
-        grid.grid = self.grid.copy()
+        if filename is None:
+            grid = self.__class__(np.copy(self.shape), bc=np.copy(self.bc),
+                                  dtype=self.dtype, **d)
+            grid.grid = np.array(self.grid)
+        else:
+            grid = self.memmap(filename, self.shape, bc=np.copy(self.bc),
+                               dtype=self.dtype, **d)
+            for sl in self._chunks():
+                grid.grid[sl] = self.grid[sl]
         return grid
 
     def swapaxes(self, a, b):
@@ -283,7 +404,7 @@ class Grid(SuperCellChild):
     def dcell(self):
         """ Returns the delta-cell """
         # Calculate the grid-distribution
-        shape = _a.asarrayi(self.shape).reshape(1, -3)
+        shape = _a.asarrayi(self.shape).reshape(-1, 1)
         return self.cell / shape
 
     @property
@@ -310,9 +431,11 @@ class Grid(SuperCellChild):
         if axis == 0:
             grid.grid[:, :, :] = self.grid[idx, :, :]
         elif axis == 1:
-            grid.grid[:, :, :] = self.grid[:, idx, :]
+            for sl in self._chunks():
+                grid.grid[sl] = self.grid[sl, idx, :]
         elif axis == 2:
-            grid.grid[:, :, :] = self.grid[:, :, idx]
+            for sl in self._chunks():
+                grid.grid[sl] = self.grid[sl, :, idx]
         else:
             raise ValueError('Unknown axis specification in cross_section')
 
@@ -332,7 +455,15 @@ class Grid(SuperCellChild):
         grid.set_sc(cell)
 
         # Calculate sum (retain dimensions)
-        np.sum(self.grid, axis=axis, keepdims=True, out=grid.grid)
+        if not self.is_memmap:
+            np.sum(self.grid, axis=axis, keepdims=True, out=grid.grid)
+        elif axis == 0:
+            grid.grid.fill(0)
+            for sl in self._chunks():
+                grid.grid += np.sum(self.grid[sl], axis=0, keepdims=True)
+        else:
+            for sl in self._chunks():
+                np.sum(self.grid[sl], axis=axis, keepdims=True, out=grid.grid[sl])
         return grid
 
     def average(self, axis):
@@ -431,9 +562,11 @@ class Grid(SuperCellChild):
         if axis == 0:
             grid.grid[:, :, :] = self.grid[idx, :, :]
         elif axis == 1:
-            grid.grid[:, :, :] = self.grid[:, idx, :]
+            for sl in self._chunks():
+                grid.grid[sl] = self.grid[sl, idx, :]
         elif axis == 2:
-            grid.grid[:, :, :] = self.grid[:, :, idx]
+            for sl in self._chunks():
+                grid.grid[sl] = self.grid[sl, :, idx]
 
         return grid
 
@@ -467,126 +600,160 @@ class Grid(SuperCellChild):
         """
         return dot(np.asarray(index), self.dcell)
 
-    def _index_shape(self, shape):
-        """ Internal routine for shape-indices """
-        # First grab the sphere, subsequent indices will be reduced
-        # by the actual shape
-        cuboid = shape.toCuboid()
-        ellipsoid = shape.toEllipsoid()
-        if ellipsoid.volume() > cuboid.volume():
-            idx = self._index_shape_cuboid(cuboid)
-        else:
-            idx = self._index_shape_ellipsoid(ellipsoid)
+    def _index_shape_bbox(self, shape):
+        """ Internal routine for the (inclusive) grid index bounding box of a shape
 
-        # Get min/max
-        imin = idx.min(0)
-        imax = idx.max(0)
-        del idx
+        Returns ``None`` if the shape cannot contain any grid points.
+        """
+        if isinstance(shape, NullShape):
+            return None
+
+        if isinstance(shape, CompositeShape):
+            A = self._index_shape_bbox(shape.A)
+            if shape.op == shape._SUB:
+                return A
+            B = self._index_shape_bbox(shape.B)
+            if shape.op == shape._AND:
+                if A is None or B is None:
+                    return None
+                imin = np.maximum(A[0], B[0])
+                imax = np.minimum(A[1], B[1])
+                if np.any(imin > imax):
+                    return None
+                return imin, imax
+            if A is None:
+                return B
+            elif B is None:
+                return A
+            return np.minimum(A[0], B[0]), np.maximum(A[1], B[1])
+
+        # Fractional grid indices of a coordinate are dot(ic, xyz)
+        ic = self.icell * _a.asarrayd(self.shape).reshape(3, 1)
+
+        if isinstance(shape, Ellipsoid):
+            # x = center + u . v for |u| <= 1
+            c = dot(ic, shape.center)
+            w = fnorm(dot(shape._v, ic.T).T)
+            fmin = c - w
+            fmax = c + w
+        else:
+            # x = origo + u . v for 0 <= u <= 1
+            cuboid = shape.toCuboid()
+            c = dot(ic, cuboid.origo)
+            w = dot(cuboid._v, ic.T)
+            fmin = c + np.where(w < 0, w, 0).sum(0)
+            fmax = c + np.where(w > 0, w, 0).sum(0)
+
+        # Allow a small tolerance for points on the boundary
+        imin = np.ceil(fmin - 1e-6).astype(int32)
+        imax = np.floor(fmax + 1e-6).astype(int32)
+        if np.any(imin > imax):
+            return None
+        return imin, imax
+
+    def _index_shape_within(self, shape, imin, imax):
+        """ Internal routine for the indices in the box ``[imin, imax]`` which are within the shape """
+        ix = _a.arangei(imin[0], imax[0] + 1)
+        iy = _a.arangei(imin[1], imax[1] + 1)
+        iz = _a.arangei(imin[2], imax[2] + 1)
+        ny = len(iy)
+        nz = len(iz)
+        nyz = ny * nz
 
         dc = self.dcell
+        ryz = (iy.reshape(-1, 1, 1) * dc[1, :].reshape(1, 1, 3) +
+               iz.reshape(1, -1, 1) * dc[2, :].reshape(1, 1, 3)).reshape(1, nyz, 3)
+
+        # Test the points in chunks of x-planes to limit memory usage
+        nx = max(1, self.chunk_bytes // (24 * nyz))
+        idx = []
+        for i in range(0, len(ix), nx):
+            jx = ix[i:i + nx]
+            rxyz = (jx.reshape(-1, 1, 1) * dc[0, :].reshape(1, 1, 3) + ryz).reshape(-1, 3)
+            j = shape.within_index(rxyz)
+            del rxyz
+            o = _a.emptyi([len(j), 3])
+            o[:, 0] = jx[j // nyz]
+            o[:, 1] = iy[(j // nz) % ny]
+            o[:, 2] = iz[j % nz]
+            idx.append(o)
+        if len(idx) == 1:
+            return idx[0]
+        return np.concatenate(idx)
 
-        # Now to find the actual points inside the shape
-        # First create all points in the square and then retrieve all indices
-        # within.
-        ix = _a.aranged(imin[0], imax[0] + 0.5)
-        iy = _a.aranged(imin[1], imax[1] + 0.5)
-        iz = _a.aranged(imin[2], imax[2] + 0.5)
-        output_shape = (ix.size, iy.size, iz.size, 3)
-        rxyz = _a.emptyd(output_shape)
-        ao = add.outer
-        ao(ao(ix * dc[0, 0], iy * dc[1, 0]), iz * dc[2, 0], out=rxyz[:, :, :, 0])
-        ao(ao(ix * dc[0, 1], iy * dc[1, 1]), iz * dc[2, 1], out=rxyz[:, :, :, 1])
-        ao(ao(ix * dc[0, 2], iy * dc[1, 2]), iz * dc[2, 2], out=rxyz[:, :, :, 2])
-        idx = shape.within_index(rxyz.reshape(-1, 3))
-        del rxyz
-        i = _a.emptyi(output_shape)
-        i[:, :, :, 0] = ix.reshape(-1, 1, 1)
-        i[:, :, :, 1] = iy.reshape(1, -1, 1)
-        i[:, :, :, 2] = iz.reshape(1, 1, -1)
-        del ix, iy, iz
-        i.shape = (-1, 3)
-        i = take(i, idx, axis=0)
-        del idx
-
-        return i
-
-    def _index_shape_cuboid(self, cuboid):
-        """ Internal routine for cuboid shape-indices """
-        # Construct all points on the outer rim of the cuboids
-        min_d = fnorm(self.dcell).min()
-
-        # Retrieve cuboids edge-lengths
-        v = cuboid.edge_length
-        # Create normalized cuboid vectors (because we expan via the lengths below
-        vn = cuboid._v / fnorm(cuboid._v).reshape(-1, 1)
-        LL = (cuboid.center - cuboid._v.sum(0) / 2).reshape(1, 3)
-        UR = (cuboid.center + cuboid._v.sum(0) / 2).reshape(1, 3)
-
-        # Create coordinates
-        a = vn[0, :].reshape(1, -1) * _a.aranged(0, v[0] + min_d, min_d).reshape(-1, 1)
-        b = vn[1, :].reshape(1, -1) * _a.aranged(0, v[1] + min_d, min_d).reshape(-1, 1)
-        c = vn[2, :].reshape(1, -1) * _a.aranged(0, v[2] + min_d, min_d).reshape(-1, 1)
-
-        # Now create all sides
-        sa = a.shape[0]
-        sb = b.shape[0]
-        sc = c.shape[0]
-
-        def plane(v1, v2):
-            return (v1.reshape(-1, 1, 3) + v2.reshape(1, -1, 3)).reshape(1, -1, 3)
-
-        # Allocate for the 6 faces of the cuboid
-        rxyz = _a.emptyd([2, sa * sb + sa * sc + sb * sc, 3])
-        # Define the LL and UR
-        rxyz[0, :, :] = LL
-        rxyz[1, :, :] = UR
-
-        i = 0
-        rxyz[:, i:i + sa * sb, :] += plane(a, b)
-        i += sa * sb
-        rxyz[:, i:i + sa * sc, :] += plane(a, c)
-        i += sa * sc
-        rxyz[:, i:i + sb * sc, :] += plane(b, c)
-        del a, b, c, sa, sb, sc
-        rxyz.shape = (-1, 3)
-
-        # Get all indices of the cuboid planes
-        return self.index(rxyz)
-
-    def _index_shape_ellipsoid(self, ellipsoid):
-        """ Internal routine for ellipsoid shape-indices """
-        # Figure out the points on the ellipsoid
-        rad1 = pi / 180
-        theta, phi = ogrid[-pi:pi:rad1, 0:pi:rad1]
-
-        rxyz = _a.emptyd([theta.size, phi.size, 3])
-        rxyz[..., 2] = cos(phi)
-        sin(phi, out=phi)
-        rxyz[..., 0] = cos(theta) * phi
-        rxyz[..., 1] = sin(theta) * phi
-        rxyz = dot(rxyz, ellipsoid._v) + ellipsoid.center.reshape(1, 3)
-        del theta, phi
-
-        # Get all indices of the ellipsoid circumference
-        return self.index(rxyz)
-
-    def index(self, coord, axis=None):
+    def _index_shape(self, shape):
+        """ Internal routine for shape-indices """
+        bbox = self._index_shape_bbox(shape)
+        if bbox is None:
+            return _a.emptyi([0, 3])
+        return self._index_shape_within(shape, *bbox)
+
+    def _index_shapes(self, shapes, op):
+        """ Internal routine for the indices of the union or intersection of shapes """
+        bboxes = [self._index_shape_bbox(shape) for shape in shapes]
+
+        if op == 'and':
+            if any(bbox is None for bbox in bboxes):
+                return _a.emptyi([0, 3])
+            imin = np.amax([bbox[0] for bbox in bboxes], axis=0)
+            imax = np.amin([bbox[1] for bbox in bboxes], axis=0)
+            if np.any(imin > imax):
+                return _a.emptyi([0, 3])
+            # Successively reduce the indices within the first shape
+            idx = self._index_shape_within(shapes[0], imin, imax)
+            for shape in shapes[1:]:
+                if len(idx) == 0:
+                    break
+                idx = take(idx, shape.within_index(self.index2xyz(idx)), axis=0)
+            return idx
+
+        elif op != 'or':
+            raise ValueError(self.__class__.__name__ + ".index requires op to be one of ['or', 'and'].")
+
+        idx = [self._index_shape_within(shape, *bbox)
+               for shape, bbox in zip(shapes, bboxes) if bbox is not None]
+        if len(idx) == 0:
+            return _a.emptyi([0, 3])
+        idx = np.concatenate(idx)
+        if len(idx) == 0:
+            return idx
+
+        # Remove duplicate indices (from overlapping shapes)
+        imin = idx.min(0).astype(np.int64)
+        n = idx.max(0) - imin + 1
+        lin = ((idx[:, 0] - imin[0]) * n[1] + idx[:, 1] - imin[1]) * n[2] + idx[:, 2] - imin[2]
+        return take(idx, np.unique(lin, return_index=True)[1], axis=0)
+
+    def index(self, coord, axis=None, op='or'):
         """ Returns the index along axis `axis` where `coord` exists
 
         Parameters
         ----------
-        coord : (:, 3) or float or Shape
+        coord : (:, 3) or float or Shape or list of Shape
             the coordinate of the axis. If a float is passed `axis` is
             also required in which case it corresponds to the length along the
             lattice vector corresponding to `axis`.
             If a Shape a list of coordinates that fits the voxel positions
             are returned (all internal points also).
+            If a list of shapes the voxel positions in the union (or intersection, see `op`)
+            of the shapes are returned.
         axis : int
             the axis direction of the index
+        op : {'or', 'and'}
+            for a list of shapes, whether the union or the intersection of the shapes is returned
+
+        Notes
+        -----
+        Only the grid points in the index bounding box of each shape are tested.
+        The shape indices are returned in lexicographic order, and are not restricted
+        to the grid.
         """
         if isinstance(coord, Shape):
             # We have to do something differently
             return self._index_shape(coord)
+        elif isinstance(coord, (list, tuple)) and len(coord) > 0 and \
+             all(isinstance(c, Shape) for c in coord):
+            return self._index_shapes(coord, op)
 
         coord = _a.asarrayd(coord)
         if coord.size == 1: # float
@@ -690,11 +857,94 @@ class Grid(SuperCellChild):
         raise ValueError('Grids are not compatible, ' +
                          s1 + '-' + s2 + '. ', msg)
 
-    def _compatible_copy(self, other, *args, **kwargs):
-        """ Returns a copy of self with an additional check of commensurable """
+    def _ioperate(self, op, other, msg):
+        """ In-place operation ``op(self, other)``, in chunks if any of the grids are memory-mapped """
         if isinstance(other, Grid):
-            self._check_compatibility(other, *args, **kwargs)
-        return self.copy()
+            self._check_compatibility(other, msg)
+            if self.is_memmap or other.is_memmap:
+                for sl in self._chunks():
+                    op(self.grid[sl], other.grid[sl], out=self.grid[sl])
+            else:
+                op(self.grid, other.grid, out=self.grid)
+        elif self.is_memmap:
+            for sl in self._chunks():
+                op(self.grid[sl], other, out=self.grid[sl])
+        else:
+            op(self.grid, other, out=self.grid)
+        return self
+
+    def _apply(self, func, args, out, msg):
+        """ Internal routine for `apply` with a specific error message for incompatible grids """
+        for arg in args:
+            if isinstance(arg, Grid):
+                self._check_compatibility(arg, msg)
+        if not out is None:
+            self._check_compatibility(out, msg)
+        grids = (self, ) + args
+        # Arrays are sliced with the grids, scalars are passed as is
+        values = []
+        for arg in grids:
+            if isinstance(arg, Grid):
+                values.append(arg.grid)
+            elif np.ndim(arg) > 0:
+                values.append(np.broadcast_to(arg, self.shape))
+            else:
+                values.append(None)
+
+        # Number of planes (along the first axis) evaluated at a time
+        n = self.shape[0]
+        nbytes = max([arg.grid[0].nbytes for arg in grids if isinstance(arg, Grid)])
+        step = max(1, self.chunk_bytes // max(1, nbytes))
+        for i in range(0, n, step):
+            sl = slice(i, min(i + step, n))
+            v = func(*[arg if val is None else val[sl] for arg, val in zip(grids, values)])
+            if out is None:
+                out = self._new(dtype=np.asarray(v).dtype)
+            out.grid[sl] = v
+        return out
+
+    def apply(self, func, *args, **kwargs):
+        """ Evaluate an element-wise expression of this and other grids chunk by chunk
+
+        The expression is evaluated on chunks of at most `chunk_bytes` bytes along the first axis
+        which fuses the operations and limits the temporary arrays to the chunk size.
+        The returned grid shares the `SuperCell` and `Geometry` of this grid (by reference).
+
+        Parameters
+        ----------
+        func : callable
+           element-wise function called as ``func(self.grid[chunk], *args)`` where all
+           `Grid` arguments are replaced by their chunk of values
+        *args : Grid or array_like or float
+           additional arguments passed to `func`, grids must be commensurable with this grid.
+           Arrays are broadcast to the grid shape and chunked, other arguments are passed as is (e.g. scalars).
+        out : Grid, optional
+           grid where the result is stored (may be one of the arguments, or a memory-mapped grid),
+           else a new grid is returned with the data-type of the result.
+
+        Examples
+        --------
+        >>> g1 = Grid(0.1, sc=2.)
+        >>> g2 = Grid(0.1, sc=2.)
+        >>> g3 = Grid(0.1, sc=2.)
+        >>> g = g1.apply(lambda x, y, z: 2 * x + 3 * y - z, g2, g3)
+        >>> g1.apply(np.add, g2, out=g3) is g3
+        True
+
+        Returns
+        -------
+        Grid
+           the grid with the result, `out` if specified
+        """
+        out = kwargs.pop('out', None)
+        if len(kwargs) > 0:
+            raise ValueError(self.__class__.__name__ + '.apply got unexpected keyword arguments: ' +
+                             ', '.join(kwargs.keys()))
+        return self._apply(func, args, out, 'they cannot be combined')
+
+    def _operate(self, op, other, msg):
+        """ Operation ``op(self, other)`` in a new grid sharing the SuperCell and Geometry """
+        return self._apply(op, (other, ), None, msg)
 
     def __eq__(self, other):
         """ Returns true if the two grids are commensurable
@@ -708,60 +958,35 @@ class Grid(SuperCellChild):
 
     def __abs__(self):
         r""" Return the absolute value :math:`|grid|` """
-        dtype = dtype_complex_to_real(self.dtype)
-        a = self.copy()
-        a.grid = np.absolute(self.grid).astype(dtype, copy=False)
-        return a
+        return self._apply(np.absolute, (), None, '')
 
     def __add__(self, other):
         """ Returns a new grid with the addition of two grids
 
         Returns same shape with same cell as the first
         """
-        if isinstance(other, Grid):
-            grid = self._compatible_copy(other, 'they cannot be added')
-            grid.grid = self.grid + other.grid
-        else:
-            grid = self.copy()
-            grid.grid = self.grid + other
-        return grid
+        return self._operate(np.add, other, 'they cannot be added')
 
     def __iadd__(self, other):
         """ Returns a new grid with the addition of two grids
 
         Returns same shape with same cell as the first
         """
-        if isinstance(other, Grid):
-            self._check_compatibility(other, 'they cannot be added')
-            self.grid += other.grid
-        else:
-            self.grid += other
-        return self
+        return self._ioperate(np.add, other, 'they cannot be added')
 
     def __sub__(self, other):
         """ Returns a new grid with the difference of two grids
 
         Returns same shape with same cell as the first
         """
-        if isinstance(other, Grid):
-            grid = self._compatible_copy(other, 'they cannot be subtracted')
-            np.subtract(self.grid, other.grid, out=grid.grid)
-        else:
-            grid = self.copy()
-            np.subtract(self.grid, other, out=grid.grid)
-        return grid
+        return self._operate(np.subtract, other, 'they cannot be subtracted')
 
     def __isub__(self, other):
         """ Returns a same grid with the difference of two grids
 
         Returns same shape with same cell as the first
         """
-        if isinstance(other, Grid):
-            self._check_compatibility(other, 'they cannot be subtracted')
-            self.grid -= other.grid
-        else:
-            self.grid -= other
-        return self
+        return self._ioperate(np.subtract, other, 'they cannot be subtracted')
 
     def __div__(self, other):
         return self.__truediv__(other)
@@ -770,38 +995,136 @@ class Grid(SuperCellChild):
         return self.__itruediv__(other)
 
     def __truediv__(self, other):
-        if isinstance(other, Grid):
-            grid = self._compatible_copy(other, 'they cannot be divided')
-            np.divide(self.grid, other.grid, out=grid.grid)
-        else:
-            grid = self.copy()
-            np.divide(self.grid, other, out=grid.grid)
-        return grid
+        return self._operate(np.true_divide, other, 'they cannot be divided')
 
     def __itruediv__(self, other):
-        if isinstance(other, Grid):
-            self._check_compatibility(other, 'they cannot be divided')
-            self.grid /= other.grid
-        else:
-            self.grid /= other
-        return self
+        return self._ioperate(np.true_divide, other, 'they cannot be divided')
 
     def __mul__(self, other):
-        if isinstance(other, Grid):
-            grid = self._compatible_copy(other, 'they cannot be multiplied')
-            np.multiply(self.grid, other.grid, out=grid.grid)
-        else:
-            grid = self.copy()
-            np.multiply(self.grid, other, out=grid.grid)
-        return grid
+        return self._operate(np.multiply, other, 'they cannot be multiplied')
 
     def __imul__(self, other):
-        if isinstance(other, Grid):
-            self._check_compatibility(other, 'they cannot be multiplied')
-            self.grid *= other.grid
+        return self._ioperate(np.multiply, other, 'they cannot be multiplied')
+
+    def poisson(self, workers=None):
+        r""" Solve the Poisson equation :math:`\nabla^2 V(\mathbf r) = -\rho(\mathbf r)` using fast Fourier transforms
+
+        The grid values are the source :math:`\rho` and the potential :math:`V` is returned as a new
+        grid. The equation is solved in :math:`\mathcal O(N\log N)` with the continuous Laplacian, i.e.
+        :math:`V(\mathbf G) = \rho(\mathbf G) / |\mathbf G|^2`.
+
+        Periodic directions are expanded in plane waves. For Dirichlet directions the potential is
+        zero on the lower boundary plane (index 0) and on the periodic image of it (index ``shape[axis]``),
+        and the interior is expanded in sine functions (discrete sine transform).
+        Dirichlet directions require the lattice vector to be orthogonal to the other lattice vectors.
+
+        For fully periodic grids the average of :math:`V` is 0, i.e. a neutralizing background
+        is assumed (:math:`V(\mathbf G=0)=0`).
+
+        Parameters
+        ----------
+        workers : int, optional
+           number of threads used in the FFT's. This is only used for ``scipy>=1.4`` (`scipy.fft`).
+
+        Raises
+        ------
+        ValueError : for boundary conditions other than `PERIODIC` and `DIRICHLET` or if a Dirichlet
+                     lattice vector is not orthogonal to the other lattice vectors
+
+        Returns
+        -------
+        Grid
+            the potential with the same shape, boundary conditions and cell as this grid
+
+        See Also
+        --------
+        topyamg : setup of a general boundary condition problem for `pyamg`
+        """
+        periodic = []
+        dirichlet = []
+        for i in range(3):
+            if np.all(self.bc[i] == self.PERIODIC):
+                periodic.append(i)
+            elif np.all(self.bc[i] == self.DIRICHLET):
+                dirichlet.append(i)
+            else:
+                raise ValueError(self.__class__.__name__ + '.poisson only accepts periodic or Dirichlet '
+                                 'boundary conditions (for both sides of a lattice vector).')
+
+        cell = self.cell
+        length = fnorm(cell)
+        for i in dirichlet:
+            c = np.abs(dot(cell, cell[i])) / (length * length[i])
+            c[i] = 0.
+            if np.any(c > 1e-8):
+                raise ValueError(self.__class__.__name__ + '.poisson requires the Dirichlet lattice vectors '
+                                 'to be orthogonal to the other lattice vectors.')
+
+        fft, dst, kw = _fft_backend(workers)
+
+        # Only solve for the interior of the Dirichlet directions
+        sl = [slice(None)] * 3
+        for i in dirichlet:
+            sl[i] = slice(1, None)
+        sl = tuple(sl)
+        is_complex = np.iscomplexobj(self.grid)
+        if is_complex:
+            F = np.asarray(self.grid[sl], dtype=np.complex128)
         else:
-            self.grid *= other
-        return self
+            F = np.asarray(self.grid[sl], dtype=np.float64)
+        shape = F.shape
+
+        # Forward transform
+        for i in dirichlet:
+            F = dst(F, axis=i)
+        use_rfft = not is_complex and len(periodic) > 0
+        if use_rfft:
+            F = fft.rfftn(F, axes=periodic, **kw)
+        elif len(periodic) > 0:
+            F = fft.fftn(F, axes=periodic, **kw)
+
+        # Calculate |G|^2
+        def bshape(i, n):
+            s = [1] * 3
+            s[i] = n
+            return s
+        m = [None] * 3
+        for i in periodic:
+            n = self.shape[i]
+            if use_rfft and i == periodic[-1]:
+                m[i] = _a.arangei(n // 2 + 1)
+            else:
+                m[i] = np.rint(np.fft.fftfreq(n) * n)
+            m[i] = m[i].reshape(bshape(i, -1))
+        G2 = np.zeros(F.shape)
+        rcell = self.rcell
+        for i in periodic:
+            for j in periodic:
+                G2 = G2 + m[i] * m[j] * dot(rcell[i], rcell[j])
+        for i in dirichlet:
+            k = _a.arangei(1, self.shape[i]) * (pi / length[i])
+            G2 = G2 + (k ** 2).reshape(bshape(i, -1))
+
+        # Solve
+        if len(dirichlet) == 0:
+            # Neutralizing background
+            G2[0, 0, 0] = 1.
+            F[0, 0, 0] = 0.
+        F /= G2
+        del G2
+
+        # Backward transform
+        if use_rfft:
+            F = fft.irfftn(F, s=[shape[i] for i in periodic], axes=periodic, **kw)
+        elif len(periodic) > 0:
+            F = fft.ifftn(F, axes=periodic, **kw)
+        for i in dirichlet:
+            F = dst(F, axis=i) / (2 * self.shape[i])
+
+        grid = self.__class__(self.shape, bc=np.copy(self.bc), dtype=self.dtype,
+                              **self.__sc_geometry_dict())
+        grid.grid[sl] = F
+        return grid
 
     # Here comes additional supplementary routines which enables an easy
     # work-through case with other programs.
@@ -1245,6 +1568,149 @@ class Grid(SuperCellChild):
         return p, namespace
 
 
+def _interp_axis(data, axis, n, method, periodic, pool, workers, chunk_bytes):
+    """ Interpolate `data` along `axis` to `n` points, in chunks along another axis on `pool` """
+    m = data.shape[axis]
+    dtype = data.dtype
+    if not np.issubdtype(dtype, np.inexact):
+        dtype = np.float64
+    shape = list(data.shape)
+    shape[axis] = n
+    out = np.empty(shape, dtype=dtype)
+
+    # Old (fractional) index of the new points
+    x = _a.arangei(n) * (m / n)
+    if m == 1:
+        method = 'nearest'
+
+    def sub(sl, a):
+        s = [slice(None)] * 3
+        s[axis] = sl
+        return a[tuple(s)]
+
+    def bshape(v):
+        s = [1] * 3
+        s[axis] = -1
+        return v.reshape(s)
+
+    if method == 'nearest':
+        i0 = np.rint(x).astype(np.int64)
+        if periodic:
+            i0 %= m
+        else:
+            i0 = np.minimum(i0, m - 1)
+
+        def interp(a):
+            return take(a, i0, axis=axis)
+
+    elif method == 'linear':
+        i0 = floor(x).astype(np.int64)
+        w = bshape(x - i0)
+        i1 = i0 + 1
+        if periodic:
+            i1 %= m
+        else:
+            i1 = np.minimum(i1, m - 1)
+
+        def interp(a):
+            return take(a, i0, axis=axis) * (1 - w) + take(a, i1, axis=axis) * w
+
+    elif method == 'cubic':
+        from scipy.interpolate import CubicSpline
+
+        def interp(a):
+            if periodic:
+                a = np.concatenate((a, sub(slice(0, 1), a)), axis=axis)
+                return CubicSpline(_a.arangei(m + 1), a, axis=axis, bc_type='periodic')(x)
+            return CubicSpline(_a.arangei(m), a, axis=axis)(np.minimum(x, m - 1))
+
+    elif method == 'fourier':
+        fft = _fft_backend()[0]
+        k = min(m, n)
+        is_complex = np.iscomplexobj(data)
+
+        def interp(a):
+            # Pad/truncate the Fourier coefficients, the Nyquist frequency (even k)
+            # is split (up-sampling) or collected (down-sampling) to retain the exact
+            # values of the trigonometric interpolation.
+            if is_complex:
+                F = fft.fft(a, axis=axis)
+                s = list(F.shape)
+                s[axis] = n
+                G = np.zeros(s, dtype=F.dtype)
+                h = (k + 1) // 2
+                sub(slice(0, h), G)[...] = sub(slice(0, h), F)
+                l = k // 2
+                if l > 0:
+                    sub(slice(n - l, n), G)[...] = sub(slice(m - l, m), F)
+                if k % 2 == 0:
+                    if k == m:
+                        sub(n - l, G)[...] *= 0.5
+                        sub(l, G)[...] = sub(n - l, G)
+                    else:
+                        sub(n - l, G)[...] += sub(l, F)
+                return fft.ifft(G, axis=axis) * (n / m)
+
+            F = fft.rfft(a, axis=axis)
+            s = list(F.shape)
+            s[axis] = n // 2 + 1
+            G = np.zeros(s, dtype=F.dtype)
+            h = k // 2 + 1
+            sub(slice(0, h), G)[...] = sub(slice(0, h), F)
+            if k % 2 == 0:
+                if k == m:
+                    sub(k // 2, G)[...] *= 0.5
+                else:
+                    sub(k // 2, G)[...] = 2 * sub(k // 2, F).real
+            return fft.irfft(G, n=n, axis=axis) * (n / m)
+
+    # Chunks along the largest of the other axes
+    caxis = max([i for i in range(3) if i != axis], key=lambda i: data.shape[i])
+    nc = data.shape[caxis]
+    nchunk = max(workers, max(out.nbytes, data.nbytes) // chunk_bytes + 1)
+    idx = np.linspace(0, nc, min(nc, nchunk) + 1).astype(np.int64)
+
+    def run(i):
+        s = [slice(None)] * 3
+        s[caxis] = slice(idx[i], idx[i + 1])
+        s = tuple(s)
+        out[s] = interp(data[s])
+
+    if pool is None:
+        for i in range(len(idx) - 1):
+            run(i)
+    else:
+        pool.map(run, range(len(idx) - 1))
+    return out
+
+
+def _fft_backend(workers=None):
+    """ FFT module, type-I sine transform and the keyword arguments for threaded FFT's
+
+    `scipy.fft` (``scipy>=1.4``) is preferred since it can use multiple threads.
+    """
+    try:
+        import scipy.fft as fft
+        kw = {}
+        if workers is not None:
+            kw['workers'] = workers
+
+        def dst(a, axis):
+            return fft.dst(a, type=1, axis=axis, **kw)
+
+    except ImportError:
+        fft = np.fft
+        kw = {}
+        from scipy.fftpack import dst as _dst
+
+        def dst(a, axis):
+            if np.iscomplexobj(a):
+                return _dst(a.real, type=1, axis=axis) + 1j * _dst(a.imag, type=1, axis=axis)
+            return _dst(a, type=1, axis=axis)
+
+    return fft, dst, kw
+
+
 def sgrid(grid=None, argv=None, ret_grid=False):
     """ Main script for sgrid.
 
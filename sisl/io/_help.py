@@ -1,5 +1,9 @@
 from __future__ import print_function, division
 
+import re
+
+import numpy as np
+
 __all__ = ['starts_with_list']
 
 
@@ -8,3 +12,189 @@ def starts_with_list(l, comments):
         if l.startswith(comment):
             return True
     return False
+
+
+def _format_e(values, width, precision, upper):
+    """ Vectorized ``'{:<width>.<precision>e}'.format`` of the values
+
+    The mantissas are only rounded vectorized when the rounding is guaranteed to
+    be correct, the remaining values (non-finite, close to ties or with 3 exponent
+    digits) are formatted by Python.
+
+    Returns
+    -------
+    numpy.ndarray
+       ``(n, w + 1)`` array of bytes with the right-aligned formatted values in the
+       first ``w`` columns, the last column is left for a separator
+    numpy.ndarray
+       number of leading bytes of each value which are not part of the formatted value
+    """
+    n = len(values)
+    p = precision
+    W = p + 7
+    F = max(width, W)
+    a = np.abs(values)
+    slow = ~np.isfinite(a)
+    a[slow] = 1.
+    zero = a == 0.
+    with np.errstate(divide='ignore'):
+        e = np.floor(np.log10(np.where(zero, 1., a))).astype(np.int64)
+    slow |= np.abs(e) > 100
+    a[slow] = 1.
+    e[slow] = 0
+
+    def scale(a, e):
+        k = p - e
+        f = 10. ** np.abs(k)
+        return np.where(k >= 0, a * f, a / f)
+
+    y = scale(a, e)
+    # Correct possible round-off errors in the exponent
+    idx = (y >= 10. ** (p + 1)).nonzero()[0]
+    e[idx] += 1
+    y[idx] = scale(a[idx], e[idx])
+    idx = np.logical_and(y < 10. ** p, ~zero).nonzero()[0]
+    e[idx] -= 1
+    y[idx] = scale(a[idx], e[idx])
+
+    # The scaled values have a relative error of at most a few ulp, hence
+    # the rounding is correct unless the value is that close to a tie.
+    m = np.rint(y)
+    slow |= np.abs(y - np.floor(y) - 0.5) <= y * 2. ** -50
+    # Rounding up to the next decade
+    idx = (m >= 10. ** (p + 1)).nonzero()[0]
+    m[idx] = 10. ** p
+    e[idx] += 1
+    slow |= np.abs(e) > 99
+    m[slow] = 0.
+    e[slow] = 0
+    neg = np.signbit(values)
+
+    # Layout: sign, digit, '.', digits, 'e', exponent sign and 2 exponent digits
+    s = np.empty([n, F + 1], np.uint8)
+    s[:, :F - W] = ord(' ')
+    o = F - W
+    s[:, o] = np.where(neg, ord('-'), ord(' '))
+    s[:, o + 2] = ord('.')
+    m = m.astype(np.int32 if p < 9 else np.int64)
+    for c in [o + i for i in range(p + 2, 2, -1)] + [o + 1]:
+        q = m // 10
+        s[:, c] = m - q * 10 + ord('0')
+        m = q
+    s[:, o + p + 3] = ord('E') if upper else ord('e')
+    s[:, o + p + 4] = np.where(e < 0, ord('-'), ord('+'))
+    e = np.abs(e)
+    s[:, o + p + 5] = e // 10 + ord('0')
+    s[:, o + p + 6] = e % 10 + ord('0')
+    length = p + 6 + neg
+
+    idx = slow.nonzero()[0]
+    if len(idx) > 0:
+        fmt = '{:' + str(F) + '.' + str(p) + ('E' if upper else 'e') + '}'
+        strs = [fmt.format(v) for v in values[idx].tolist()]
+        if max(map(len, strs)) > F:
+            # Extend all values to fit 3 digit exponents
+            s = np.concatenate([np.full([n, 1], ord(' '), np.uint8), s], axis=1)
+            F += 1
+            strs = [v.rjust(F) for v in strs]
+        s[idx, :F] = np.frombuffer(''.join(strs).encode('ascii'), np.uint8).reshape(-1, F)
+        length[idx] = [len(v.lstrip()) for v in strs]
+
+    return s, F - np.maximum(width, length)
+
+
+def array_to_text(values, fmt='.5e', ncol=1):
+    """ Convert the values to text with `ncol` values per line
+
+    Each value is formatted as ``format(value, fmt)`` and followed by a space, or
+    a newline for the last value of a line. An incomplete last line is terminated by a
+    newline. For formats of the form ``'[width].<precision>e'`` (with precision
+    up to 10) the formatting is vectorized, else the values are formatted one by one.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+       values to format (raveled)
+    fmt : str, optional
+       format of each value
+    ncol : int, optional
+       number of values per line
+
+    Returns
+    -------
+    str
+       the formatted lines, all terminated with a newline
+    """
+    values = np.asarray(values).ravel()
+    n = len(values)
+    if n == 0:
+        return ''
+    m = re.match(r'^([1-9]\d*)?\.(\d+)([eE])$', fmt)
+    if not (m and 0 < int(m.group(2)) <= 10):
+        strs = list(map(('{:' + fmt + '}').format, values.tolist()))
+        nfull = n - n % ncol
+        out = ''.join([' '.join(strs[i:i + ncol]) + '\n' for i in range(0, nfull, ncol)])
+        if nfull < n:
+            out += ' '.join(strs[nfull:]) + ' \n'
+        return out
+
+    s, drop = _format_e(values.astype(np.float64), int(m.group(1) or 0),
+                        int(m.group(2)), m.group(3) == 'E')
+    w = s.shape[1] - 1
+    s[:, w] = ord(' ')
+    s[ncol - 1::ncol, w] = ord('\n')
+    if np.any(drop > 0):
+        keep = np.ones(s.shape, np.bool_)
+        keep[:, :w] = np.arange(w).reshape(1, -1) >= drop.reshape(-1, 1)
+        out = s[keep].tobytes()
+    else:
+        out = s.tobytes()
+    if n % ncol:
+        out += b'\n'
+    return out.decode('ascii')
+
+
+def read_values(fh, n, dtype=np.float64, chunk=2 ** 24):
+    """ Read `n` white-space separated values from the file-handle `fh`
+
+    The file is read in chunks of `chunk` characters which are parsed in bulk.
+    Reading stops after `n` values or at the end of the file (or the first non-numeric text).
+
+    Returns
+    -------
+    numpy.ndarray
+       the values read, possibly fewer than `n`
+    """
+    out = np.empty([n], dtype)
+    i = 0
+    rest = ''
+    while i < n:
+        s = fh.read(chunk)
+        if isinstance(s, bytes) and not isinstance(s, str):
+            s = s.decode('ascii')
+        if len(s) == 0:
+            s = rest
+            rest = ''
+            done = True
+        else:
+            s = rest + s
+            # Do not parse the (possibly) partial last value
+            j = max(s.rfind(' '), s.rfind('\n'))
+            if j < 0:
+                rest = s
+                continue
+            rest = s[j:]
+            s = s[:j]
+            done = False
+        s = s.strip()
+        if len(s) > 0:
+            v = np.fromstring(s, dtype=np.float64, sep=' ')
+            ni = min(len(v), n - i)
+            out[i:i + ni] = v[:ni]
+            i += ni
+            if len(v) == 0:
+                # non-numeric data
+                break
+        if done:
+            break
+    return out[:i]
@@ -4,6 +4,7 @@ import numpy as np
 
 # Import sile objects
 from sisl.io.sile import *
+from sisl.io._help import array_to_text, read_values
 
 # Import the geometry object
 from sisl import Geometry, Atom, SuperCell, Grid, SislError
@@ -76,7 +77,7 @@ class cubeSile(Sile):
            write only imaginary part of the grid, default to only writing the
            real part.
         buffersize : int, optional
-           size of the buffer while writing the data, (6144)
+           number of values formatted at a time while writing the data, (393216)
         """
         # Check that we can write to the file
         sile_raise_write(self)
@@ -88,32 +89,22 @@ class cubeSile(Sile):
         # Write the geometry
         self.write_geometry(geom, size=grid.grid.shape, *args, **kwargs)
 
-        buffersize = kwargs.get('buffersize', min(6144, grid.grid.size))
-        buffersize += buffersize % 6 # ensure multiple of 6
-
         # A CUBE file contains grid-points aligned like this:
         # for x
         #   for y
         #     for z
         #       write...
-        _fmt1 = '{:' + fmt + '} '
-        _fmt6 = (_fmt1 * 6)[:-1] + '\n'
-        __fmt = _fmt6 * (buffersize // 6)
+        # The values are formatted in chunks (of full lines) to limit memory usage.
+        buffersize = kwargs.get('buffersize', 6 * 2 ** 16)
+        buffersize = max(6, buffersize - buffersize % 6) # ensure multiple of 6
 
         if imag:
-            for z in np.nditer(np.asarray(grid.grid.imag, order='C').reshape(-1), flags=['external_loop', 'buffered'],
-                               op_flags=[['readonly']], order='C', buffersize=buffersize):
-                if z.shape[0] != buffersize:
-                    s = z.shape[0]
-                    __fmt = _fmt6 * (s // 6) + _fmt1 * (s % 6) + '\n'
-                self._write(__fmt.format(*z.tolist()))
+            data = grid.grid.imag
         else:
-            for z in np.nditer(np.asarray(grid.grid.real, order='C').reshape(-1), flags=['external_loop', 'buffered'],
-                               op_flags=[['readonly']], order='C', buffersize=buffersize):
-                if z.shape[0] != buffersize:
-                    s = z.shape[0]
-                    __fmt = _fmt6 * (s // 6) + _fmt1 * (s % 6) + '\n'
-                self._write(__fmt.format(*z.tolist()))
+            data = grid.grid.real
+        data = data.reshape(-1)
+        for i in range(0, data.size, buffersize):
+            self._write(array_to_text(data[i:i + buffersize], fmt, 6))
 
         # Add a finishing line to ensure empty ending
         self._write('\n')
@@ -200,14 +191,13 @@ class cubeSile(Sile):
             self.readline()
 
         grid = Grid(ngrid, dtype=np.float64, geometry=geom)
-        grid.grid.shape = (-1,)
-
-        # TODO check performance of this
-        # We are currently doing this to enable reading
-        #  1-column data and 6-column data.
-        lines = [item for sublist in self.fh.readlines() for item in sublist.split()]
-        grid.grid[:] = np.array(lines).astype(grid.dtype)
-        grid.grid.shape = ngrid
+
+        # Parse the values in bulk, this enables reading
+        # both 1-column data and 6-column data.
+        data = read_values(self.fh, grid.grid.size, grid.dtype)
+        if data.size != grid.grid.size:
+            raise SislError(repr(self) + ' contains {} grid values, expected {}.'.format(data.size, grid.grid.size))
+        grid.grid = data.reshape(ngrid)
 
         if imag is None:
             return grid
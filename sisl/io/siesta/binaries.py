@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+import os
 from numbers import Integral
 import numpy as np
 
@@ -16,7 +17,7 @@ from .sile import SileBinSiesta
 
 # Import the geometry object
 import sisl._array as _a
-from sisl import Geometry, Atom, SuperCell, Grid
+from sisl import Geometry, Atom, SuperCell, Grid, SparseCSR
 from sisl.unit.siesta import unit_convert
 from sisl.physics.sparse import SparseOrbitalBZ
 from sisl.physics import Hamiltonian, DensityMatrix, EnergyDensityMatrix
@@ -31,22 +32,208 @@ __all__ += ['hsxSileSiesta', 'dmSileSiesta']
 __all__ += ['gridSileSiesta']
 __all__ += ['tsgfSileSiesta']
 
+# The unit conversions used by the Siesta (Fortran) readers, retained for equivalent results
+_Ry2eV = 13.60580
+_Bohr2Ang = 0.529177
+
+
+class _FortranRecords(object):
+    """ Sequential reader of Fortran unformatted files (4 byte record markers) through a read-only memory-map
+
+    Only the accessed parts of the file are read from disk, hence sizes and geometries
+    may be read from huge files without touching the matrix elements.
+
+    Parameters
+    ----------
+    file : str
+       the file to read
+    """
+
+    #: Number of elements in each gathered chunk in `read_rows`
+    chunk = 2 ** 22
+
+    def __init__(self, file):
+        self.file = file
+        if os.path.getsize(file) == 0:
+            self._mm = np.empty([0], np.uint8)
+        else:
+            self._mm = np.memmap(file, dtype=np.uint8, mode='r').view(np.ndarray)
+        self.pos = 0
+
+    def _error(self, pos):
+        raise SislError("{}: unrecognized Fortran record layout at byte {}.".format(self.file, pos))
+
+    def _marker(self, pos):
+        if pos < 0 or pos + 4 > len(self._mm):
+            self._error(pos)
+        return int(self._mm[pos:pos + 4].view(np.int32)[0])
+
+    def record(self):
+        """ The bytes of the next record (a view of the memory-map) """
+        pos = self.pos
+        n = self._marker(pos)
+        if n < 0 or self._marker(pos + 4 + n) != n:
+            self._error(pos)
+        self.pos = pos + 8 + n
+        return self._mm[pos + 4:pos + 4 + n]
+
+    def read(self, dtype, count=None):
+        """ Read the next record as a (copied) array of `dtype`
+
+        Parameters
+        ----------
+        dtype : numpy.dtype
+           data-type of the record elements
+        count : int, optional
+           only read the first `count` elements of the record (a record with fewer elements is an error)
+        """
+        rec = self.record()
+        dtype = np.dtype(dtype)
+        if count is None:
+            if len(rec) % dtype.itemsize != 0:
+                self._error(self.pos - len(rec) - 8)
+            count = len(rec) // dtype.itemsize
+        elif len(rec) < count * dtype.itemsize:
+            self._error(self.pos - len(rec) - 8)
+        return np.frombuffer(rec[:count * dtype.itemsize].tobytes(), dtype)
+
+    def skip(self, n=1):
+        """ Skip the next `n` records """
+        for _ in range(n):
+            self.record()
+
+    @staticmethod
+    def rows_nbytes(nnz, nrows, dtype):
+        """ Number of bytes of `nrows` records with a total of `nnz` elements, see `read_rows` """
+        return int(nnz) * np.dtype(dtype).itemsize + 8 * int(nrows)
+
+    def read_rows(self, ptr, dtype, out, func=None):
+        """ Read one record per row of a sparse matrix into `out`
+
+        Record ``i`` contains the ``ptr[i+1] - ptr[i]`` elements of row ``i``. The record
+        markers are checked and the elements are gathered in chunks directly from the memory-map.
+
+        Parameters
+        ----------
+        ptr : numpy.ndarray
+           row pointers
+        dtype : numpy.dtype
+           data-type of the elements in the file
+        out : numpy.ndarray
+           the array to store the elements in (``len(out) == ptr[-1]``), may be non-contiguous
+        func : callable, optional
+           conversion of the elements ``func(data, start, end)`` for the elements ``out[start:end]``
+        """
+        dtype = np.dtype(dtype)
+        isize = dtype.itemsize
+        no = len(ptr) - 1
+        nnz = ptr[-1]
+        pos = self.pos
+        nbytes = self.rows_nbytes(nnz, no, dtype)
+        if pos + nbytes > len(self._mm):
+            self._error(pos)
+        self.pos = pos + nbytes
+        if no == 0:
+            return
+
+        # The elements (starting after the first record marker) and the record markers
+        data = self._mm[pos + 4:pos + nbytes - 4].view(dtype)
+        markers = self._mm[pos:pos + nbytes].view(np.int32)
+        # markers (in units of elements) between consecutive rows
+        m = 8 // isize
+        w = isize // 4
+
+        # Chunks of rows
+        r = np.searchsorted(ptr, np.arange(self.chunk, nnz, self.chunk, dtype=np.int64))
+        r = np.unique(np.concatenate(([0], r, [no])))
+        for r0, r1 in zip(r[:-1], r[1:]):
+            rows = np.arange(r0, r1, dtype=np.int64)
+            n = np.diff(ptr[r0:r1 + 1])
+            i = 2 * rows + w * ptr[r0:r1].astype(np.int64)
+            if np.any(markers[i] != n * isize) or np.any(markers[i + 1 + w * n] != n * isize):
+                self._error(pos)
+            a, b = ptr[r0], ptr[r1]
+            idx = np.arange(a, b, dtype=np.int64) + np.repeat(rows * m, n)
+            if func is None:
+                out[a:b] = data[idx]
+            else:
+                out[a:b] = func(data[idx], a, b)
+
+    def read_sparsity(self, no, csr):
+        """ Read the number of elements per row and the (1-based) column indices of a sparse matrix
+
+        The sparsity pattern is stored in `csr` and the row pointers are returned.
+
+        Parameters
+        ----------
+        no : int
+           number of rows
+        csr : SparseCSR
+           the sparse matrix to store the sparsity pattern in
+        """
+        ncol = _a.arrayi(self.read(np.int32, no))
+        ptr = _a.zerosi(no + 1)
+        _a.cumsumi(ncol, out=ptr[1:])
+
+        def fortran2py(col, a, b):
+            col -= 1
+            return col
+
+        col = _a.emptyi(ptr[-1])
+        self.read_rows(ptr, np.int32, col, fortran2py)
+        csr.ncol = ncol
+        csr.ptr = ptr
+        csr.col = col
+        csr._nnz = len(col)
+        return ptr
+
 
 class tshsSileSiesta(SileBinSiesta):
-    """ TranSiesta TSHS file object """
+    """ TranSiesta TSHS file object
+
+    The file is read through a memory-map, the geometry and supercell are read without
+    reading the matrix elements.
+    """
+
+    def _r_header(self):
+        """ Read the header of the TSHS file
+
+        Returns
+        -------
+        _FortranRecords
+           the file positioned at the number of non-zero elements per row
+        dict
+           the header values
+        """
+        f = _FortranRecords(self.file)
+        version = f.read(np.int32)
+        if len(version) != 1 or version[0] != 1:
+            raise SislError(self.__class__.__name__ + ' can only read version 1 TSHS files.')
+        na_u, no_u, no_s, nspin, nnz = f.read(np.int32, 5)
+        h = {'na_u': na_u, 'no_u': no_u, 'n_s': no_s // no_u, 'nspin': nspin, 'nnz': nnz}
+        h['nsc'] = _a.arrayi(f.read(np.int32, 3))
+        cell_xa = f.read(np.float64, 9 + 3 * na_u)
+        h['cell'] = cell_xa[:9].reshape(3, 3) * _Bohr2Ang
+        h['xa'] = cell_xa[9:].reshape(-1, 3) * _Bohr2Ang
+        h['Gamma'] = f.read(np.int32, 1)[0] != 0
+        f.skip()
+        h['Ef'] = f.read(np.float64, 1)[0]
+        f.skip()
+        h['lasto'] = _a.arrayi(f.read(np.int32, na_u + 1))
+        return f, h
 
     def read_supercell(self):
         """ Returns a SuperCell object from a siesta.TSHS file """
-        n_s = _siesta.read_tshs_sizes(self.file)[3]
-        arr = _siesta.read_tshs_cell(self.file, n_s)
-        nsc = np.array(arr[0].T, np.int32)
-        cell = np.array(arr[1].T, np.float64)
-        cell.shape = (3, 3)
-        isc = np.array(arr[2].T, np.int32)
-        isc.shape = (-1, 3)
-
-        SC = SuperCell(cell, nsc=nsc)
-        SC.sc_off = isc
+        f, h = self._r_header()
+
+        SC = SuperCell(h['cell'], nsc=h['nsc'])
+        if not h['Gamma']:
+            # The supercell offsets are stored after the matrix elements
+            no, nnz = h['no_u'], h['nnz']
+            # ncol, list_col, S and H
+            f.skip()
+            f.pos += f.rows_nbytes(nnz, no, np.int32) + (h['nspin'] + 1) * f.rows_nbytes(nnz, no, np.float64)
+            SC.sc_off = f.read(np.int32, 3 * h['n_s']).reshape(-1, 3)
         return SC
 
     def read_geometry(self):
@@ -55,11 +242,9 @@ class tshsSileSiesta(SileBinSiesta):
         # Read supercell
         sc = self.read_supercell()
 
-        na = _siesta.read_tshs_sizes(self.file)[1]
-        arr = _siesta.read_tshs_geom(self.file, na)
-        xyz = np.array(arr[0].T, np.float64)
-        xyz.shape = (-1, 3)
-        lasto = np.array(arr[1], np.int32)
+        _, h = self._r_header()
+        xyz = h['xa']
+        lasto = h['lasto']
 
         # Create all different atoms...
         # The TSHS file does not contain the
@@ -68,20 +253,12 @@ class tshsSileSiesta(SileBinSiesta):
         orbs = np.diff(lasto)
 
         # Get unique orbitals
-        uorb = np.unique(orbs)
+        uorb, iorb = np.unique(orbs, return_inverse=True)
         # Create atoms
         atoms = []
         for Z, orb in enumerate(uorb):
             atoms.append(Atom(Z+1, [-1] * orb))
-
-        def get_atom(atoms, orbs):
-            for atom in atoms:
-                if atom.no == orbs:
-                    return atom
-
-        atom = []
-        for _, orb in enumerate(orbs):
-            atom.append(get_atom(atoms, orb))
+        atom = [atoms[i] for i in iorb]
 
         # Create and return geometry object
         geom = Geometry(xyz, atom, sc=sc)
@@ -94,26 +271,36 @@ class tshsSileSiesta(SileBinSiesta):
         # First read the geometry
         geom = self.read_geometry()
 
-        # Now read the sizes used...
-        sizes = _siesta.read_tshs_sizes(self.file)
-        spin = sizes[0]
-        no = sizes[2]
-        nnz = sizes[4]
-        ncol, col, dH, dS = _siesta.read_tshs_hs(self.file, spin, no, nnz)
+        f, h = self._r_header()
+        spin = h['nspin']
+        nnz = h['nnz']
+        Ef = h['Ef']
 
         # Create the Hamiltonian container
         H = Hamiltonian(geom, spin, nnzpr=1, orthogonal=False)
 
         # Create the new sparse matrix
-        H._csr.ncol = ncol.astype(np.int32, copy=False)
-        H._csr.ptr = np.insert(np.cumsum(ncol, dtype=np.int32), 0, 0)
-        # Correct fortran indices
-        H._csr.col = col.astype(np.int32, copy=False) - 1
-        H._csr._nnz = len(col)
+        ptr = f.read_sparsity(h['no_u'], H._csr)
+        if ptr[-1] != nnz:
+            raise SislError(self.__class__.__name__ + '.read_hamiltonian found an inconsistent number of non-zero elements.')
+
+        D = np.empty([nnz, spin+1], np.float64)
+        S = D[:, spin]
+        f.read_rows(ptr, np.float64, S)
 
-        H._csr._D = np.empty([nnz, spin+1], np.float64)
-        H._csr._D[:, :spin] = dH[:, :]
-        H._csr._D[:, spin] = dS[:]
+        def shift(H, a, b):
+            H -= Ef * S[a:b]
+            H *= _Ry2eV
+            return H
+
+        def scale(H, a, b):
+            H *= _Ry2eV
+            return H
+
+        for i in range(spin):
+            # Only the diagonal spin components are shifted to the Fermi level
+            f.read_rows(ptr, np.float64, D[:, i], shift if i < 2 else scale)
+        H._csr._D = D
 
         return H
 
@@ -123,24 +310,18 @@ class tshsSileSiesta(SileBinSiesta):
         # First read the geometry
         geom = self.read_geometry()
 
-        # Now read the sizes used...
-        sizes = _siesta.read_tshs_sizes(self.file)
-        no = sizes[2]
-        nnz = sizes[4]
-        ncol, col, dS = _siesta.read_tshs_s(self.file, no, nnz)
+        f, h = self._r_header()
 
         # Create the Hamiltonian container
         S = SparseOrbitalBZ(geom, nnzpr=1)
 
         # Create the new sparse matrix
-        S._csr.ncol = ncol.astype(np.int32, copy=False)
-        S._csr.ptr = np.insert(np.cumsum(ncol, dtype=np.int32), 0, 0)
-        # Correct fortran indices
-        S._csr.col = col.astype(np.int32, copy=False) - 1
-        S._csr._nnz = len(col)
+        ptr = f.read_sparsity(h['no_u'], S._csr)
+        if ptr[-1] != h['nnz']:
+            raise SislError(self.__class__.__name__ + '.read_overlap found an inconsistent number of non-zero elements.')
 
-        S._csr._D = np.empty([nnz, 1], np.float64)
-        S._csr._D[:, 0] = dS[:]
+        S._csr._D = np.empty([h['nnz'], 1], np.float64)
+        f.read_rows(ptr, np.float64, S._csr._D[:, 0])
 
         return S
 
@@ -191,13 +372,8 @@ class tshsSileSiesta(SileBinSiesta):
 class dmSileSiesta(SileBinSiesta):
     """ Siesta DM file object """
 
-    def read_density_matrix(self, **kwargs):
-        """ Returns the density matrix from the siesta.DM file """
-
-        # Now read the sizes used...
-        spin, no, nnz = _siesta.read_dm_sizes(self.file)
-        ncol, col, dDM = _siesta.read_dm(self.file, spin, no, nnz)
-
+    def _r_geometry(self, no, **kwargs):
+        """ The geometry passed in the arguments, or a boxed system with `no` orbitals """
         # Try and immediately attach a geometry
         geom = kwargs.get('geometry', kwargs.get('geom', None))
         if geom is None:
@@ -207,25 +383,48 @@ class dmSileSiesta(SileBinSiesta):
             geom = Geometry(xyz, Atom(1), sc=[no, 1, 1])
 
         if geom.no != no:
-            raise ValueError("Reading DM files requires the input geometry to have the "
+            raise ValueError(self.__class__.__name__ + " requires the input geometry to have the "
                              "correct number of orbitals.")
+        return geom
 
-        # Create the density matrix container
-        DM = DensityMatrix(geom, spin, nnzpr=1, dtype=np.float64, orthogonal=False)
+    def _r_class(self, cls, dtype, skip=False, scale=None, **kwargs):
+        """ Read a sparse matrix of `cls` with one record per row and spin-component
+
+        Parameters
+        ----------
+        skip : bool, optional
+           skip the first matrix (all spin-components) in the file
+        scale : float, optional
+           scale the read values
+        """
+        f = _FortranRecords(self.file)
+        no, spin = f.read(np.int32, 2)
+        geom = self._r_geometry(no, **kwargs)
+
+        # Create the matrix container
+        M = cls(geom, spin, nnzpr=1, dtype=dtype, orthogonal=False)
 
         # Create the new sparse matrix
-        DM._csr.ncol = ncol.astype(np.int32, copy=False)
-        DM._csr.ptr = np.insert(np.cumsum(ncol, dtype=np.int32), 0, 0)
-        # Correct fortran indices
-        DM._csr.col = col.astype(np.int32, copy=False) - 1
-        DM._csr._nnz = len(col)
+        ptr = f.read_sparsity(no, M._csr)
+        nnz = ptr[-1]
+        if skip:
+            f.pos += spin * f.rows_nbytes(nnz, no, np.float64)
+
+        def convert(D, a, b):
+            D *= scale
+            return D
 
-        DM._csr._D = np.empty([nnz, spin+1], np.float64)
-        DM._csr._D[:, :spin] = dDM[:, :]
-        # DM file does not contain overlap matrix... so neglect it for now.
-        DM._csr._D[:, spin] = 0.
+        M._csr._D = np.empty([nnz, spin+1], dtype)
+        for i in range(spin):
+            f.read_rows(ptr, np.float64, M._csr._D[:, i], None if scale is None else convert)
+        # The file does not contain overlap matrix... so neglect it for now.
+        M._csr._D[:, spin] = 0.
 
-        return DM
+        return M
+
+    def read_density_matrix(self, **kwargs):
+        """ Returns the density matrix from the siesta.DM file """
+        return self._r_class(DensityMatrix, np.float64, **kwargs)
 
     def write_density_matrix(self, DM, **kwargs):
         """ Writes the density matrix to a siesta.DM file """
@@ -256,56 +455,54 @@ class tsdeSileSiesta(dmSileSiesta):
 
     def read_energy_density_matrix(self, **kwargs):
         """ Returns the energy density matrix from the siesta.DM file """
-
-        # Now read the sizes used...
-        spin, no, nnz = _siesta.read_tsde_sizes(self.file)
-        ncol, col, dEDM = _siesta.read_tsde_edm(self.file, spin, no, nnz)
-
-        # Try and immediately attach a geometry
-        geom = kwargs.get('geometry', kwargs.get('geom', None))
-        if geom is None:
-            # We truly, have no clue,
-            # Just generate a boxed system
-            xyz = [[x, 0, 0] for x in range(no)]
-            geom = Geometry(xyz, Atom(1), sc=[no, 1, 1])
-
-        if geom.no != no:
-            raise ValueError("Reading EDM files requires the input geometry to have the "
-                             "correct number of orbitals.")
-
-        # Create the energy density matrix container
-        EDM = EnergyDensityMatrix(geom, spin, nnzpr=1, dtype=np.float32, orthogonal=False)
-
-        # Create the new sparse matrix
-        EDM._csr.ncol = ncol.astype(np.int32, copy=False)
-        EDM._csr.ptr = np.insert(np.cumsum(ncol, dtype=np.int32), 0, 0)
-        # Correct fortran indices
-        EDM._csr.col = col.astype(np.int32, copy=False) - 1
-        EDM._csr._nnz = len(col)
-
-        EDM._csr._D = np.empty([nnz, spin+1], np.float32)
-        EDM._csr._D[:, :spin] = dEDM[:, :]
-        # EDM file does not contain overlap matrix... so neglect it for now.
-        EDM._csr._D[:, spin] = 0.
-
-        return EDM
+        # The energy density matrix is stored after the density matrix
+        return self._r_class(EnergyDensityMatrix, np.float32, skip=True, scale=_Ry2eV, **kwargs)
 
 
 class hsxSileSiesta(SileBinSiesta):
     """ Siesta HSX file object """
 
-    def read_hamiltonian(self, **kwargs):
-        """ Returns the electronic structure from the siesta.TSHS file """
-
-        # Now read the sizes used...
-        Gamma, spin, no, no_s, nnz = _siesta.read_hsx_sizes(self.file)
-        ncol, col, dH, dS, dxij = _siesta.read_hsx_hsx(self.file, Gamma, spin, no, no_s, nnz)
+    def _r_sparsity(self, csr=None):
+        """ Read the header and (optionally) the sparsity pattern of the HSX file
 
-        # Try and immediately attach a geometry
+        Returns
+        -------
+        _FortranRecords
+           the file positioned after the sparsity pattern (if `csr` is passed)
+        dict
+           the header values
+        """
+        f = _FortranRecords(self.file)
+        no, no_s, spin, nnz = f.read(np.int32, 4)
+        h = {'no_u': no, 'no_s': no_s, 'nspin': spin, 'nnz': nnz}
+        h['Gamma'] = f.read(np.int32, 1)[0] != 0
+        if not h['Gamma']:
+            f.skip()
+        if csr is not None:
+            h['ptr'] = f.read_sparsity(no, csr)
+            if h['ptr'][-1] != nnz:
+                raise SislError(self.__class__.__name__ + ' found an inconsistent number of non-zero elements.')
+        return f, h
+
+    def _r_geometry(self, h, f=None, **kwargs):
+        """ The geometry passed in the arguments, or a boxed system
+
+        `f` must be positioned at the (supercell) orbital distances when no geometry is passed.
+        """
+        no = h['no_u']
         geom = kwargs.get('geometry', kwargs.get('geom', None))
         if geom is None:
             # We have *no* clue about the
-            if np.allclose(dxij, 0.):
+            if h['Gamma']:
+                zero = True
+            else:
+                f.skip()
+                ptr = h['ptr'] * 3
+                xij = np.empty(ptr[-1], np.float32)
+                f.read_rows(ptr, np.float32, xij)
+                zero = np.allclose(xij, 0.)
+                del xij
+            if zero:
                 # We truly, have no clue,
                 # Just generate a boxed system
                 xyz = [[x, 0, 0] for x in range(no)]
@@ -317,48 +514,68 @@ class hsxSileSiesta(SileBinSiesta):
         if geom.no != no:
             raise ValueError("Reading HSX files requires the input geometry to have the "
                              "correct number of orbitals {} / {}.".format(no, geom.no))
+        return geom
+
+    def read_hamiltonian(self, **kwargs):
+        """ Returns the electronic structure from the siesta.TSHS file """
+        csr = SparseCSR((1, 1, 1), nnzpr=1)
+        f, h = self._r_sparsity(csr)
+        spin = h['nspin']
+        nnz = h['nnz']
+        ptr = h['ptr']
+
+        D = np.empty([nnz, spin+1], np.float32)
+        eV = np.float32(_Ry2eV)
+
+        def scale(H, a, b):
+            H *= eV
+            return H
+
+        for i in range(spin):
+            f.read_rows(ptr, np.float32, D[:, i], scale)
+        f.read_rows(ptr, np.float32, D[:, spin])
+
+        # Try and immediately attach a geometry
+        geom = self._r_geometry(h, f, **kwargs)
 
         # Create the Hamiltonian container
         H = Hamiltonian(geom, spin, nnzpr=1, dtype=np.float32, orthogonal=False)
 
         # Create the new sparse matrix
-        H._csr.ncol = ncol.astype(np.int32, copy=False)
-        H._csr.ptr = np.insert(np.cumsum(ncol, dtype=np.int32), 0, 0)
-        # Correct fortran indices
-        H._csr.col = col.astype(np.int32, copy=False) - 1
-        H._csr._nnz = len(col)
-
-        H._csr._D = np.empty([nnz, spin+1], np.float32)
-        H._csr._D[:, :spin] = dH[:, :]
-        H._csr._D[:, spin] = dS[:]
+        H._csr.ncol = csr.ncol
+        H._csr.ptr = ptr
+        H._csr.col = csr.col
+        H._csr._nnz = nnz
+        H._csr._D = D
 
         return H
 
     def read_overlap(self, **kwargs):
         """ Returns the overlap matrix from the siesta.HSX file """
-        # Now read the sizes used...
-        Gamma, spin, no, no_s, nnz = _siesta.read_hsx_sizes(self.file)
-        ncol, col, dS = _siesta.read_hsx_s(self.file, Gamma, spin, no, no_s, nnz)
-
         geom = kwargs.get('geometry', kwargs.get('geom', None))
         if geom is None:
             warn(self.__class__.__name__ + ".read_overlap requires input geometry to assign S")
-        if geom.no != no:
+
+        csr = SparseCSR((1, 1, 1), nnzpr=1)
+        f, h = self._r_sparsity(csr)
+        if geom.no != h['no_u']:
             raise ValueError("Reading HSX files requires the input geometry to have the "
-                             "correct number of orbitals {} / {}.".format(no, geom.no))
+                             "correct number of orbitals {} / {}.".format(h['no_u'], geom.no))
+        ptr = h['ptr']
+        nnz = h['nnz']
+        f.pos += h['nspin'] * f.rows_nbytes(nnz, len(ptr) - 1, np.float32)
 
         # Create the Hamiltonian container
         S = SparseOrbitalBZ(geom, nnzpr=1)
 
         # Create the new sparse matrix
-        S._csr.ncol = ncol.astype(np.int32, copy=False)
-        S._csr.ptr = np.insert(np.cumsum(ncol, dtype=np.int32), 0, 0)
-        # Correct fortran indices
-        S._csr.col = col.astype(np.int32, copy=False) - 1
-        S._csr._nnz = len(col)
+        S._csr.ncol = csr.ncol
+        S._csr.ptr = ptr
+        S._csr.col = csr.col
+        S._csr._nnz = nnz
 
         S._csr._D = np.empty([nnz, 1], np.float32)
-        S._csr._D[:, 0] = dS[:]
+        f.read_rows(ptr, np.float32, S._csr._D[:, 0])
 
         return S
 
@@ -374,9 +591,53 @@ class gridSileSiesta(SileBinSiesta):
 
         return SuperCell(cell)
 
-    def read_grid(self, spin=0, *args, **kwargs):
+    def _read_grid_memmap(self):
+        """ Read-only memory-map of the grid values as stored in the file
+
+        The file consists of Fortran sequential records (each enclosed by 4 byte
+        record markers): the cell, the mesh and number of spin components, and
+        one record per ``(spin, z, y)`` containing the values along the first lattice vector.
+
+        Returns
+        -------
+        cell : numpy.ndarray
+           the cell in Ang
+        grid : numpy.memmap or None
+           the grid values with shape ``(nspin, mesh3, mesh2, mesh1)``, ``None`` if the
+           record layout is not recognized
+        """
+        size = os.path.getsize(self.file)
+        head = np.dtype([('m1', np.int32), ('cell', np.float64, (3, 3)), ('m2', np.int32),
+                         ('m3', np.int32), ('mesh', np.int32, 3), ('nspin', np.int32), ('m4', np.int32),
+                         ('m5', np.int32)])
+        if size < head.itemsize:
+            return None, None
+        h = np.fromfile(self.file, dtype=head, count=1)[0]
+        if h['m1'] != 72 or h['m2'] != 72 or h['m3'] != 16 or h['m4'] != 16:
+            return None, None
+        cell = h['cell'] * Bohr2Ang
+        mesh = h['mesh']
+        nspin = h['nspin']
+
+        # Single or double precision grid values
+        for dtype in [np.float32, np.float64]:
+            nbytes = mesh[0] * np.dtype(dtype).itemsize
+            if h['m5'] != nbytes:
+                continue
+            if size != head.itemsize - 4 + nspin * mesh[2] * mesh[1] * (nbytes + 8):
+                continue
+            record = np.dtype([('m1', np.int32), ('v', dtype, (mesh[0],)), ('m2', np.int32)])
+            grid = np.memmap(self.file, dtype=record, mode='r', offset=head.itemsize - 4,
+                             shape=(nspin, mesh[2], mesh[1]))
+            return cell, grid['v']
+        return None, None
+
+    def read_grid(self, spin=0, z=None, *args, **kwargs):
         """ Read grid contained in the Grid file
 
+        The grid values are memory-mapped, so only the requested spin components and slab
+        are read. The spin-weighted sum is accumulated one spin component at a time.
+
         Parameters
         ----------
         spin : int or array_like, optional
@@ -384,29 +645,65 @@ class gridSileSiesta(SileBinSiesta):
            is passed it refers to the fraction per indexed component. I.e.
            ``[0.5, 0.5]`` will return sum of half the first two components.
            Default to the first component.
+        z : slice or (2,) of int, optional
+           only read a slab of the grid, i.e. the indices ``z[0]:z[1]`` along the third lattice
+           vector (the slab must be contiguous). The cell and origo of the returned grid corresponds to the slab.
+           Default to the full grid.
         """
-        # Read the sizes
-        nspin, mesh = _siesta.read_grid_sizes(self.file)
-        # Read the cell and grid
-        cell = _siesta.read_grid_cell(self.file)
-        grid = _siesta.read_grid(self.file, nspin, mesh[0], mesh[1], mesh[2])
-
-        if isinstance(spin, Integral):
-            grid = grid[:, :, :, spin]
-        else:
-            if len(spin) > grid.shape[0]:
-                raise ValueError(self.__class__.__name__ + '.read_grid requires spin to be an integer or '
-                                 'an array of length equal to the number of spin components.')
-            g = grid[:, :, :, 0] * spin[0]
-            for i, scale in enumerate(spin[1:]):
-                g += grid[:, :, :, 1+i] * scale
-            grid = g
-
-        cell = np.array(cell.T, np.float64)
+        cell, grid = self._read_grid_memmap()
+        if grid is None:
+            # Unrecognized record layout, use the Fortran reader
+            nspin, mesh = _siesta.read_grid_sizes(self.file)
+            cell = np.array(_siesta.read_grid_cell(self.file).T, np.float64)
+            grid = _siesta.read_grid(self.file, nspin, mesh[0], mesh[1], mesh[2]).T
+        nspin, m3, m2, m1 = grid.shape
         cell.shape = (3, 3)
 
-        g = Grid(mesh, sc=SuperCell(cell), dtype=np.float32)
-        g.grid = np.array(grid.swapaxes(0, 2), np.float32) * self.grid_unit
+        if z is None:
+            z = slice(0, m3)
+        elif not isinstance(z, slice):
+            z = slice(*z)
+        if z.step not in (None, 1):
+            raise ValueError(self.__class__.__name__ + '.read_grid requires a contiguous z slab (step 1).')
+        z = slice(*z.indices(m3)[:2])
+        nz = z.stop - z.start
+        if nz <= 0:
+            raise ValueError(self.__class__.__name__ + '.read_grid requires a non-empty z slab.')
+
+        if isinstance(spin, Integral):
+            if not -nspin <= spin < nspin:
+                raise ValueError(self.__class__.__name__ + '.read_grid requires spin to be smaller than '
+                                 'the number of spin components ({}).'.format(nspin))
+            spin = [0.] * (spin % nspin) + [1.]
+        elif len(spin) > nspin:
+            raise ValueError(self.__class__.__name__ + '.read_grid requires spin to be an integer or '
+                             'an array of length equal to the number of spin components.')
+
+        # Retain the precision of the stored values
+        dtype = grid.dtype
+        data = np.empty([m1, m2, nz], dtype)
+
+        # Sum the spin components in chunks of z-planes (in the stored order) to limit the
+        # temporary memory, then transpose the chunk into the grid
+        step = max(1, 2 ** 22 // (m1 * m2))
+        tmp = np.empty([min(step, nz), m2, m1], dtype)
+        for iz in range(z.start, z.stop, step):
+            jz = min(iz + step, z.stop)
+            t = tmp[:jz - iz]
+            t.fill(0)
+            for i, scale in enumerate(spin):
+                if scale != 0.:
+                    t += grid[i, iz:jz] * scale
+            data[:, :, iz - z.start:jz - z.start] = t.T
+        del grid, tmp
+
+        # Cell and origo of the slab
+        origo = cell[2, :] * (z.start / float(m3))
+        cell[2, :] *= nz / float(m3)
+
+        g = Grid([m1, m2, nz], sc=SuperCell(cell, origo=origo), dtype=dtype)
+        g.grid = data
+        g.grid *= self.grid_unit
         return g
 
 
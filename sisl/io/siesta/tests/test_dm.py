@@ -26,3 +26,25 @@ def test_si_pdos_kgrid_dm(sisl_files):
     csr1._shape = csr2._shape
     assert csr1.spsame(csr2)
     assert np.allclose(csr1._D, csr2._D)
+
+
+def test_dm_write_read(sisl_tmp):
+    g = sisl.geom.graphene(orthogonal=True).tile(2, 0)
+    DM1 = sisl.DensityMatrix(g, spin=sisl.Spin('p'))
+    DM1.construct([[0.1, 1.5], [[1., 2.], [-0.2, -0.3]]])
+    f = sisl_tmp('tmp_rw.DM', _dir)
+    DM1.write(f)
+    DM2 = sisl.get_sile(f).read_density_matrix(geometry=g)
+    assert DM1._csr.spsame(DM2._csr)
+    assert np.allclose(DM1.tocsr(0).toarray(), DM2.tocsr(0).toarray())
+    assert np.allclose(DM1.tocsr(1).toarray(), DM2.tocsr(1).toarray())
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_dm_read_geometry_fail(sisl_tmp):
+    g = sisl.geom.graphene(orthogonal=True)
+    DM = sisl.DensityMatrix(g)
+    DM.construct([[0.1, 1.5], [1., -0.2]])
+    f = sisl_tmp('tmp_fail.DM', _dir)
+    DM.write(f)
+    sisl.get_sile(f).read_density_matrix(geometry=g.tile(2, 0))
@@ -25,3 +25,73 @@ def test_si_pdos_kgrid_grid_fractions(sisl_files):
     grid = si.read_grid()
     grid_halve = si.read_grid(spin=[0.5])
     assert np.allclose(grid.grid * 0.5, grid_halve.grid)
+
+
+def _write_grid(f, cell, grids, dtype=np.float32):
+    """ Write grids in the Siesta binary record layout """
+    mesh = grids[0].shape
+    nbytes = mesh[0] * np.dtype(dtype).itemsize
+    with open(f, 'wb') as fh:
+        np.array([72], np.int32).tofile(fh)
+        (cell * sisl.unit.siesta.unit_convert('Ang', 'Bohr')).tofile(fh)
+        np.array([72, 16] + list(mesh) + [len(grids), 16], np.int32).tofile(fh)
+        for grid in grids:
+            for iz in range(mesh[2]):
+                for iy in range(mesh[1]):
+                    np.array([nbytes], np.int32).tofile(fh)
+                    grid[:, iy, iz].astype(dtype).tofile(fh)
+                    np.array([nbytes], np.int32).tofile(fh)
+
+
+def test_grid_spin_z(sisl_tmp):
+    f = sisl_tmp('grid.RHO', _dir)
+    cell = np.diag([2., 3., 4.])
+    cell[1, 0] = 0.5
+    np.random.seed(1)
+    g0 = np.random.rand(6, 7, 8)
+    g1 = np.random.rand(6, 7, 8)
+    _write_grid(f, cell, [g0, g1])
+    si = sisl.get_sile(f)
+    unit = si.grid_unit
+
+    grid = si.read_grid()
+    assert grid.dtype == np.float32
+    assert np.allclose(grid.cell, si.read_supercell().cell)
+    assert np.allclose(grid.cell, cell)
+    assert np.allclose(grid.grid, g0 * unit)
+    assert np.allclose(si.read_grid(1).grid, g1 * unit)
+    assert np.allclose(si.read_grid(-1).grid, g1 * unit)
+    assert np.allclose(si.read_grid(-2).grid, g0 * unit)
+    assert np.allclose(si.read_grid([0.5, 2.]).grid, (g0 * 0.5 + g1 * 2) * unit)
+
+    grid = si.read_grid(1, z=(2, 5))
+    assert grid.shape == (6, 7, 3)
+    assert np.allclose(grid.grid, g1[:, :, 2:5] * unit)
+    assert np.allclose(grid.cell[2], cell[2] * 3 / 8)
+    assert np.allclose(grid.origo, cell[2] * 2 / 8)
+    grid = si.read_grid(z=slice(6, None))
+    assert np.allclose(grid.grid, g0[:, :, 6:] * unit)
+
+
+def test_grid_double(sisl_tmp):
+    f = sisl_tmp('grid.VT', _dir)
+    np.random.seed(1)
+    g0 = np.random.rand(6, 7, 8)
+    _write_grid(f, np.diag([2., 3., 4.]), [g0], np.float64)
+    grid = sisl.get_sile(f).read_grid()
+    assert grid.dtype == np.float64
+    assert np.allclose(grid.grid, g0 * sisl.get_sile(f).grid_unit)
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_grid_spin_fail(sisl_tmp):
+    f = sisl_tmp('grid.RHO', _dir)
+    _write_grid(f, np.diag([2., 3., 4.]), [np.zeros([2, 2, 2])])
+    sisl.get_sile(f).read_grid(1)
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_grid_z_step_fail(sisl_tmp):
+    f = sisl_tmp('grid.RHO', _dir)
+    _write_grid(f, np.diag([2., 3., 4.]), [np.zeros([2, 2, 10])])
+    sisl.get_sile(f).read_grid(z=slice(0, 10, 2))
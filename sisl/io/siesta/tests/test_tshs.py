@@ -28,3 +28,46 @@ def test_si_pdos_kgrid_tshs_overlap(sisl_files, sisl_tmp):
     S = si.read_overlap()
     assert HS._csr.spsame(S._csr)
     assert np.allclose(HS._csr._D[:, HS.S_idx], S._csr._D[:, 0])
+
+
+def _tshs_hamiltonian():
+    g = sisl.geom.graphene(orthogonal=True).tile(2, 0)
+    H = sisl.Hamiltonian(g, spin=sisl.Spin('p'), orthogonal=False)
+    H.construct([[0.1, 1.5], [[1., 2., 1.], [-0.2, -0.3, 0.1]]])
+    return H
+
+
+def test_tshs_write_read(sisl_tmp):
+    H1 = _tshs_hamiltonian()
+    f = sisl_tmp('tmp_rw.TSHS', _dir)
+    H1.write(f)
+    si = sisl.get_sile(f)
+    H2 = si.read_hamiltonian()
+    assert H1._csr.spsame(H2._csr)
+    assert np.allclose(H1._csr._D, H2._csr._D, atol=1e-6)
+    assert np.allclose(H1.Hk([0.1, 0.2, 0]).toarray(), H2.Hk([0.1, 0.2, 0]).toarray(), atol=1e-6)
+    S = si.read_overlap()
+    assert np.allclose(S._csr._D[:, 0], H2._csr._D[:, H2.S_idx])
+
+
+def test_tshs_read_geometry(sisl_tmp):
+    H = _tshs_hamiltonian()
+    f = sisl_tmp('tmp_geom.TSHS', _dir)
+    H.write(f)
+    g = sisl.get_sile(f).read_geometry()
+    assert np.allclose(g.cell, H.geometry.cell)
+    assert np.allclose(g.xyz, H.geometry.xyz)
+    assert np.all(g.nsc == H.geometry.nsc)
+    assert np.all(g.lasto == H.geometry.lasto)
+
+
+@pytest.mark.xfail(raises=sisl.SislError)
+def test_tshs_read_truncated(sisl_tmp):
+    H = _tshs_hamiltonian()
+    f = sisl_tmp('tmp_trunc.TSHS', _dir)
+    H.write(f)
+    with open(f, 'rb') as fh:
+        b = fh.read()
+    with open(f, 'wb') as fh:
+        fh.write(b[:-100])
+    sisl.get_sile(f).read_hamiltonian()
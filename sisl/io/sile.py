@@ -6,6 +6,7 @@ import gzip
 
 import numpy as np
 
+from sisl._help import is_python3
 from sisl.messages import SislWarning, SislInfo
 from sisl.utils.misc import str_spec
 from ._help import *
@@ -481,7 +482,11 @@ class Sile(BaseSile):
 
     def _open(self):
         if self.file.endswith('gz'):
-            self.fh = gzip.open(self.file)
+            mode = self._mode
+            if is_python3 and not 'b' in mode:
+                # gzip defaults to binary mode
+                mode = mode.replace('+', '') + 't'
+            self.fh = gzip.open(self.file, mode)
         else:
             self.fh = open(self.file, self._mode)
         self._line = 0
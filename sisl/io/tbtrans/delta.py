@@ -54,8 +54,19 @@ class deltancSileTBtrans(SileCDFTBtrans):
     >>> dH.write_delta(H, E=1.) # only at 1 eV
     >>> H[1, 1] += 1.j
     >>> dH.write_delta(H, E=1., k=[0, 0, 0]) # only at 1 eV and Gamma-point
+    >>> # many k-points and energies at once (sharing the sparsity pattern of H)
+    >>> dH.write_delta_stack(H, data, k=k, E=E) # data.shape == (len(k), len(E), H.nnz, len(H.spin))
     """
 
+    #: Maximum number of sparse elements in one chunk of the delta variables (4 MB)
+    chunk_nnz = 2 ** 19
+
+    #: Maximum memory (in bytes) of converted data in each write of `write_delta_stack`
+    write_bytes = 2 ** 26
+
+    #: Name of the delta variables (``Re<name>`` and ``Im<name>`` for complex values)
+    _delta_name = 'delta'
+
     def read_supercell(self):
         """ Returns the `SuperCell` object from this file """
         cell = _a.arrayd(np.copy(self._value('cell')))
@@ -289,33 +300,7 @@ class deltancSileTBtrans(SileCDFTBtrans):
         ilvl, ik, iE = self._get_lvl_k_E(**kwargs)
         lvl = self._add_lvl(ilvl)
 
-        # Append the sparsity pattern
-        # Create basis group
-        if 'n_col' in lvl.variables:
-            if len(lvl.dimensions['nnzs']) != delta.nnz:
-                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
-                                 "all delta entries [nnz].")
-            if np.any(lvl.variables['n_col'][:] != delta._csr.ncol[:]):
-                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
-                                 "all delta entries [n_col].")
-            if np.any(lvl.variables['list_col'][:] != delta._csr.col[:]+1):
-                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
-                                 "all delta entries [list_col].")
-            if np.any(lvl.variables['isc_off'][:] != delta.geom.sc.sc_off):
-                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
-                                 "all delta entries [sc_off].")
-        else:
-            self._crt_dim(lvl, 'nnzs', delta.nnz)
-            v = self._crt_var(lvl, 'n_col', 'i4', ('no_u',))
-            v.info = "Number of non-zero elements per row"
-            v[:] = delta._csr.ncol[:]
-            v = self._crt_var(lvl, 'list_col', 'i4', ('nnzs',),
-                              chunksizes=(delta.nnz,), **self._cmp_args)
-            v.info = "Supercell column indices in the sparse format"
-            v[:] = delta._csr.col[:] + 1  # correct for fortran indices
-            v = self._crt_var(lvl, 'isc_off', 'i4', ('n_s', 'xyz'))
-            v.info = "Index of supercell coordinates"
-            v[:] = delta.geom.sc.sc_off[:, :]
+        self._write_pattern(lvl, delta)
 
         warn_E = True
         if ilvl in [3, 4]:
@@ -343,52 +328,207 @@ class deltancSileTBtrans(SileCDFTBtrans):
         elif ilvl == 2 and warn_k:
             warn(SileWarning('Overwriting k-point {0} correction.'.format(ik)))
 
-        if ilvl == 1:
-            dim = ('spin', 'nnzs')
-            sl = [slice(None)] * 2
-            csize = [1] * 2
-        elif ilvl == 2:
-            dim = ('nkpt', 'spin', 'nnzs')
-            sl = [slice(None)] * 3
+        sl = [slice(None)] * (ilvl // 2 + 2)
+        if ilvl == 2:
             sl[0] = ik
-            csize = [1] * 3
         elif ilvl == 3:
-            dim = ('ne', 'spin', 'nnzs')
-            sl = [slice(None)] * 3
             sl[0] = iE
-            csize = [1] * 3
         elif ilvl == 4:
-            dim = ('nkpt', 'ne', 'spin', 'nnzs')
-            sl = [slice(None)] * 4
             sl[0] = ik
             sl[1] = iE
-            csize = [1] * 4
 
-        # Number of non-zero elements
-        csize[-1] = delta.nnz
+        V = self._crt_delta(lvl, ilvl, delta)
+        D = delta._csr._D
+        for i in range(len(delta.spin)):
+            sl[-2] = i
+            if len(V) == 2:
+                V[0][sl] = D[:, i].real * eV2Ry
+                V[1][sl] = D[:, i].imag * eV2Ry
+            else:
+                V[0][sl] = D[:, i] * eV2Ry
 
-        if delta.dtype.kind == 'c':
-            v1 = self._crt_var(lvl, 'Redelta', 'f8', dim,
-                               chunksizes=csize,
-                               attr = {'info': "Real part of delta",
-                                       'unit': "Ry"}, **self._cmp_args)
-            v2 = self._crt_var(lvl, 'Imdelta', 'f8', dim,
-                               chunksizes=csize,
-                               attr = {'info': "Imaginary part of delta",
-                                       'unit': "Ry"}, **self._cmp_args)
-            for i in range(len(delta.spin)):
-                sl[-2] = i
-                v1[sl] = delta._csr._D[:, i].real * eV2Ry
-                v2[sl] = delta._csr._D[:, i].imag * eV2Ry
+    def write_delta_stack(self, delta, data, k=None, E=None):
+        r""" Writes many :math:`\delta` terms sharing the sparsity pattern of `delta` to the file
+
+        This is equivalent to calling `write_delta` for each k-point and/or energy, but
+        the k-points and energies are added in one extension of the dimensions and the data
+        is written in as few (hyperslab) writes as possible.
+
+        Parameters
+        ----------
+        delta : SparseOrbitalBZSpin
+           the sparsity pattern (and data-type) of the :math:`\delta` terms
+        data : array_like
+           the :math:`\delta` values with the same ordering as the sparse elements in `delta`
+           (after `delta.finalize()`) with shape ``([nk,] [nE,] delta.nnz, len(delta.spin))``
+           where the k and E dimensions are only present if `k` and/or `E` are specified.
+        k : array_like, optional
+           k-points of the :math:`\delta` terms (``(nk, 3)``)
+        E : array_like, optional
+           energies of the :math:`\delta` terms (``(nE,)``)
+
+        See Also
+        --------
+        write_delta : write a single :math:`\delta` term
+        """
+        # Ensure finalization
+        delta.finalize()
+
+        # Ensure that the geometry is written
+        self.write_geometry(delta.geom)
+
+        nspin = len(delta.spin)
+        self._crt_dim(self, 'spin', nspin)
+
+        shape = []
+        if k is not None:
+            k = _a.asarrayd(k).reshape(-1, 3)
+            shape.append(len(k))
+        if E is not None:
+            E = _a.asarrayd(E).ravel()
+            shape.append(len(E))
+        ilvl = 1 + (k is not None) + 2 * (E is not None)
+        data = np.asarray(data)
+        if data.shape != tuple(shape + [delta.nnz, nspin]):
+            raise ValueError(self.__class__.__name__ + ".write_delta_stack requires data with shape "
+                             "{}, got {}.".format(tuple(shape + [delta.nnz, nspin]), data.shape))
+
+        lvl = self._add_lvl(ilvl)
+        self._write_pattern(lvl, delta)
+
+        # Look-up and append the k-points and energies
+        idx = []
+        if k is not None:
+            ik, exist = self._append_index(lvl.variables['kpt'], k)
+            if ilvl == 2 and exist.any():
+                warn(SileWarning('Overwriting k-point {0} correction.'.format(ik[exist])))
+            idx.append(ik)
+        if E is not None:
+            iE, exist = self._append_index(lvl.variables['E'], E * eV2Ry)
+            if ilvl == 3 and exist.any():
+                warn(SileWarning('Overwriting energy point {0} correction.'.format(iE[exist])))
+            idx.append(iE)
+
+        V = self._crt_delta(lvl, ilvl, delta)
+        if ilvl == 1:
+            data = data.reshape(1, delta.nnz, nspin)
+            idx = [None]
+
+        # Write in blocks of the first dimension
+        nblock = max(1, self.write_bytes // max(1, data[0].size * 8))
+        for i in range(0, len(data), nblock):
+            D = np.swapaxes(data[i:i + nblock], -1, -2) * eV2Ry
+            if idx[0] is None:
+                D = D[0]
+                bidx = []
+            else:
+                bidx = [idx[0][i:i + nblock]] + idx[1:]
+            if len(V) == 2:
+                self._write_hyperslab(V[0], bidx, D.real)
+                self._write_hyperslab(V[1], bidx, D.imag)
+            else:
+                self._write_hyperslab(V[0], bidx, D)
+            del D
+
+    @staticmethod
+    def _append_index(var, values, atol=1e-4):
+        """ Indices of `values` in the (unlimited) variable `var`, values not found are appended in one write
+
+        Returns
+        -------
+        index : numpy.ndarray
+           the index of each value in `var`
+        exist : numpy.ndarray
+           whether the value already existed in `var`
+        """
+        n = var.shape[0]
+        m = len(values)
+        values = values.reshape(m, -1)
+        index = _a.fulli(m, -1)
+        if n > 0:
+            old = _a.arrayd(var[:]).reshape(n, -1)
+            diff = np.abs(old.reshape(1, n, -1) - values.reshape(m, 1, -1)).max(2)
+            j = diff.argmin(1)
+            exist = diff[_a.arangei(m), j] <= atol
+            index[exist] = j[exist]
+        exist = index >= 0
+        new = (~exist).nonzero()[0]
+        if len(new) > 0:
+            index[new] = _a.arangei(n, n + len(new))
+            var[n:n + len(new)] = values[new].reshape((-1,) + var.shape[1:])
+        return index, exist
+
+    @staticmethod
+    def _write_hyperslab(var, idx, data, sl=(), dsl=()):
+        """ Write `data` to `var` at the indices `idx` of the leading dimensions
+
+        Contiguous indices are written as a single slice, otherwise the dimension is looped.
+        """
+        d = len(sl)
+        if d == len(idx):
+            var[sl] = data[dsl]
+            return
+        i = idx[d]
+        if len(i) == 1 or np.all(np.diff(i) == 1):
+            deltancSileTBtrans._write_hyperslab(var, idx, data, sl + (slice(i[0], i[-1] + 1),),
+                                                dsl + (slice(None),))
+        else:
+            for j, ij in enumerate(i):
+                deltancSileTBtrans._write_hyperslab(var, idx, data, sl + (slice(ij, ij + 1),),
+                                                    dsl + (slice(j, j + 1),))
 
+    def _write_pattern(self, lvl, delta):
+        """ Write the sparsity pattern of `delta` to the level, or check that it is equivalent to the stored one """
+        if 'n_col' in lvl.variables:
+            if len(lvl.dimensions['nnzs']) != delta.nnz:
+                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
+                                 "all delta entries [nnz].")
+            if np.any(lvl.variables['n_col'][:] != delta._csr.ncol[:]):
+                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
+                                 "all delta entries [n_col].")
+            if np.any(lvl.variables['list_col'][:] != delta._csr.col[:]+1):
+                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
+                                 "all delta entries [list_col].")
+            if np.any(lvl.variables['isc_off'][:] != delta.geom.sc.sc_off):
+                raise ValueError("The sparsity pattern stored in delta *MUST* be equivalent for "
+                                 "all delta entries [sc_off].")
         else:
-            v = self._crt_var(lvl, 'delta', 'f8', dim,
+            self._crt_dim(lvl, 'nnzs', delta.nnz)
+            v = self._crt_var(lvl, 'n_col', 'i4', ('no_u',))
+            v.info = "Number of non-zero elements per row"
+            v[:] = delta._csr.ncol[:]
+            v = self._crt_var(lvl, 'list_col', 'i4', ('nnzs',),
+                              chunksizes=(min(delta.nnz, self.chunk_nnz),), **self._cmp_args)
+            v.info = "Supercell column indices in the sparse format"
+            v[:] = delta._csr.col[:] + 1  # correct for fortran indices
+            v = self._crt_var(lvl, 'isc_off', 'i4', ('n_s', 'xyz'))
+            v.info = "Index of supercell coordinates"
+            v[:] = delta.geom.sc.sc_off[:, :]
+
+    def _crt_delta(self, lvl, ilvl, delta):
+        """ Create (or return) the delta variables of a level, a list of the real (and imaginary) variables
+
+        Each chunk contains (at most `chunk_nnz` of) the sparse elements of a single k-point, energy
+        and spin which is the access pattern of TBtrans.
+        """
+        dim = {1: (), 2: ('nkpt',), 3: ('ne',), 4: ('nkpt', 'ne')}[ilvl] + ('spin', 'nnzs')
+        csize = [1] * len(dim)
+        csize[-1] = min(delta.nnz, self.chunk_nnz)
+
+        name = self._delta_name
+        if delta.dtype.kind == 'c':
+            return [self._crt_var(lvl, 'Re' + name, 'f8', dim,
+                                  chunksizes=csize,
+                                  attr = {'info': "Real part of " + name,
+                                          'unit': "Ry"}, **self._cmp_args),
+                    self._crt_var(lvl, 'Im' + name, 'f8', dim,
+                                  chunksizes=csize,
+                                  attr = {'info': "Imaginary part of " + name,
+                                          'unit': "Ry"}, **self._cmp_args)]
+        return [self._crt_var(lvl, name, 'f8', dim,
                               chunksizes=csize,
-                              attr = {'info': "delta",
-                                      'unit': "Ry"},  **self._cmp_args)
-            for i in range(len(delta.spin)):
-                sl[-2] = i
-                v[sl] = delta._csr._D[:, i] * eV2Ry
+                              attr = {'info': name,
+                                      'unit': "Ry"},  **self._cmp_args)]
 
     def _read_class(self, cls, **kwargs):
         """ Reads a class model from a file """
@@ -475,6 +615,8 @@ class dhncSileTBtrans(deltancSileTBtrans):
     If required please use `sisl.io.dhncSileTBtrans` explicitly.
     """
 
+    _delta_name = 'dH'
+
     def write_hamiltonian(self, H, **kwargs):
         """ Writes Hamiltonian model to file
 
@@ -482,127 +624,12 @@ class dhncSileTBtrans(deltancSileTBtrans):
         ----------
         H : Hamiltonian
            the model to be saved in the NC file
-        spin : int, optional
-           the spin-index of the Hamiltonian object that is stored. Default is the first index.
+        k : array_like, optional
+           a specific k-point dH term, see `write_delta`
+        E : float, optional
+           an energy dependent dH term, see `write_delta`
         """
-        # Ensure finalization
-        H.finalize()
-
-        # Ensure that the geometry is written
-        self.write_geometry(H.geom)
-
-        self._crt_dim(self, 'spin', len(H.spin))
-
-        # Determine the type of dH we are storing...
-        k = kwargs.get('k', None)
-        E = kwargs.get('E', None)
-
-        ilvl, ik, iE = self._get_lvl_k_E(**kwargs)
-        lvl = self._add_lvl(ilvl)
-
-        # Append the sparsity pattern
-        # Create basis group
-        if 'n_col' in lvl.variables:
-            if len(lvl.dimensions['nnzs']) != H.nnz:
-                raise ValueError("The sparsity pattern stored in dH *MUST* be equivalent for "
-                                 "all dH entries [nnz].")
-            if np.any(lvl.variables['n_col'][:] != H._csr.ncol[:]):
-                raise ValueError("The sparsity pattern stored in dH *MUST* be equivalent for "
-                                 "all dH entries [n_col].")
-            if np.any(lvl.variables['list_col'][:] != H._csr.col[:]+1):
-                raise ValueError("The sparsity pattern stored in dH *MUST* be equivalent for "
-                                 "all dH entries [list_col].")
-            if np.any(lvl.variables['isc_off'][:] != H.geom.sc.sc_off):
-                raise ValueError("The sparsity pattern stored in dH *MUST* be equivalent for "
-                                 "all dH entries [sc_off].")
-        else:
-            self._crt_dim(lvl, 'nnzs', H._csr.col.shape[0])
-            v = self._crt_var(lvl, 'n_col', 'i4', ('no_u',))
-            v.info = "Number of non-zero elements per row"
-            v[:] = H._csr.ncol[:]
-            v = self._crt_var(lvl, 'list_col', 'i4', ('nnzs',),
-                              chunksizes=(len(H._csr.col),), **self._cmp_args)
-            v.info = "Supercell column indices in the sparse format"
-            v[:] = H._csr.col[:] + 1  # correct for fortran indices
-            v = self._crt_var(lvl, 'isc_off', 'i4', ('n_s', 'xyz'))
-            v.info = "Index of supercell coordinates"
-            v[:] = H.geom.sc.sc_off[:, :]
-
-        warn_E = True
-        if ilvl in [3, 4]:
-            if iE < 0:
-                # We need to add the new value
-                iE = len(lvl.variables['E'])
-                lvl.variables['E'][iE] = E * eV2Ry
-                warn_E = False
-
-        warn_k = True
-        if ilvl in [2, 4]:
-            if ik < 0:
-                ik = len(lvl.variables['kpt'])
-                lvl.variables['kpt'][ik, :] = k
-                warn_k = False
-
-        if ilvl == 4 and warn_k and warn_E and False:
-            # As soon as we have put the second k-point and the first energy
-            # point, this warning will proceed...
-            # I.e. even though the variable has not been set, it will WARN
-            # Hence we out-comment this for now...
-            warn(SileWarning('Overwriting k-point {0} and energy point {1} correction.'.format(ik, iE)))
-        elif ilvl == 3 and warn_E:
-            warn(SileWarning('Overwriting energy point {0} correction.'.format(iE)))
-        elif ilvl == 2 and warn_k:
-            warn(SileWarning('Overwriting k-point {0} correction.'.format(ik)))
-
-        if ilvl == 1:
-            dim = ('spin', 'nnzs')
-            sl = [slice(None)] * 2
-            csize = [1] * 2
-        elif ilvl == 2:
-            dim = ('nkpt', 'spin', 'nnzs')
-            sl = [slice(None)] * 3
-            sl[0] = ik
-            csize = [1] * 3
-        elif ilvl == 3:
-            dim = ('ne', 'spin', 'nnzs')
-            sl = [slice(None)] * 3
-            sl[0] = iE
-            csize = [1] * 3
-        elif ilvl == 4:
-            dim = ('nkpt', 'ne', 'spin', 'nnzs')
-            sl = [slice(None)] * 4
-            sl[0] = ik
-            sl[1] = iE
-            csize = [1] * 4
-
-        # Number of non-zero elements
-        csize[-1] = H.nnz
-
-        if H.dtype.kind == 'c':
-            v1 = self._crt_var(lvl, 'RedH', 'f8', dim,
-                               chunksizes=csize,
-                               attr = {'info': "Real part of dH",
-                                       'unit': "Ry"}, **self._cmp_args)
-            for i in range(len(H.spin)):
-                sl[-2] = i
-                v1[sl] = H._csr._D[:, i].real * eV2Ry
-
-            v2 = self._crt_var(lvl, 'ImdH', 'f8', dim,
-                               chunksizes=csize,
-                               attr = {'info': "Imaginary part of dH",
-                                       'unit': "Ry"}, **self._cmp_args)
-            for i in range(len(H.spin)):
-                sl[-2] = i
-                v2[sl] = H._csr._D[:, i].imag * eV2Ry
-
-        else:
-            v = self._crt_var(lvl, 'dH', 'f8', dim,
-                              chunksizes=csize,
-                              attr = {'info': "dH",
-                                      'unit': "Ry"},  **self._cmp_args)
-            for i in range(len(H.spin)):
-                sl[-2] = i
-                v[sl] = H._csr._D[:, i] * eV2Ry
+        self.write_delta(H, **kwargs)
 
     def _read_class(self, cls, **kwargs):
         """ Reads a class model from a file """
@@ -1,5 +1,7 @@
 from __future__ import print_function, division
 
+import os
+
 import numpy as np
 from numpy import in1d, argsort
 
@@ -52,8 +54,23 @@ class tbtsencSileTBtrans(_devncSileTBtrans):
     >>> # Following inserts are equivalent
     >>> Hdev[dpvt_unsorted, dpvt_unsorted.T] -= se_unsorted[:, :] # doctest: +SKIP
     >>> Hdev[dpvt_sorted, dpvt_sorted.T] -= se_sorted[:, :] # doctest: +SKIP
+    >>> #
+    >>> # Read many energies at once, or stream them in blocks of energies
+    >>> se_stack = se.self_energy_stack('Left', k=0) # doctest: +SKIP
+    >>> for E, SE in se.iter_self_energy('Left', k=0): # doctest: +SKIP
+    ...     pass # doctest: +SKIP
     """
 
+    #: Maximum memory (in bytes) used for a block of self-energies read in `iter_self_energy`, defaults
+    #: to the environment variable ``SISL_TBT_SE_BLOCK_MB`` (in MB) or 64 MB
+    block_bytes = int(float(os.environ.get('SISL_TBT_SE_BLOCK_MB', 64)) * 1024 ** 2)
+
+    def _setup(self, *args, **kwargs):
+        """ Setup the special object for data containing """
+        # Cached pivoting tables
+        self._pivot = dict()
+        super(tbtsencSileTBtrans, self)._setup(*args, **kwargs)
+
     def o2p(self, orbital):
         """ Return the pivoting indices (0-based) for the orbitals
 
@@ -129,6 +146,15 @@ class tbtsencSileTBtrans(_devncSileTBtrans):
         >>> se.pivot(0, sort=True) # doctest: +SKIP
         [2, 3]
         """
+        if elec is not None:
+            elec = self._elec(elec)
+        key = (elec, in_device, sort)
+        if key not in self._pivot:
+            self._pivot[key] = self._pivot_calc(elec, in_device, sort)
+        return self._pivot[key].copy()
+
+    def _pivot_calc(self, elec, in_device, sort):
+        """ Calculate the pivoting table, see `pivot` """
         if elec is None:
             if in_device and sort:
                 return _a.arangei(self.no_d)
@@ -148,7 +174,7 @@ class tbtsencSileTBtrans(_devncSileTBtrans):
                 pvt = np.sort(pvt)
 
         # Get electrode pivoting elements
-        se_pvt = self._value('pivot', tree=self._elec(elec)) - 1
+        se_pvt = self._value('pivot', tree=elec) - 1
         if sort:
             # Sort pivoting indices
             # Since we know that pvt is also sorted, then
@@ -192,6 +218,53 @@ class tbtsencSileTBtrans(_devncSileTBtrans):
         """
         return in1d(self.pivot(elec=elec), orbital).nonzero()[0]
 
+    def _sort_index(self, elec):
+        """ Cached permutation that sorts the self-energy of `elec` (see `pivot`) """
+        key = (self._elec(elec), 'argsort')
+        if key not in self._pivot:
+            self._pivot[key] = argsort(self.pivot(elec))
+        return self._pivot[key]
+
+    def _E_list(self, E):
+        """ Energy indices in the requested order from an energy (index) list, a slice of indices or ``None`` (all energies) """
+        if E is None:
+            return _a.arangei(self.nE)
+        elif isinstance(E, slice):
+            return _a.arangei(self.nE)[E]
+        return _a.asarrayi([self.Eindex(e) for e in np.asarray(E, dtype=object).ravel()])
+
+    def _E_indices(self, E):
+        """ Energy indices (``slice`` or sorted `numpy.ndarray`) and a possible re-ordering of the read energies """
+        if E is None:
+            return slice(0, self.nE), None
+        iE = self._E_list(E)
+        if len(iE) > 0 and np.all(np.diff(iE) == 1):
+            return slice(iE[0], iE[-1] + 1), None
+        uE, inv = np.unique(iE, return_inverse=True)
+        return uE, inv
+
+    def _read_self_energy(self, tree, iE, k, sort):
+        """ Read the self-energies (in eV) of `tree` at the energy indices `iE` (slice or sorted array) in one hyperslab
+
+        If `k` is ``None`` the k-averaged self-energies are returned.
+        """
+        re = self._variable('ReSelfEnergy', tree=tree)
+        im = self._variable('ImSelfEnergy', tree=tree)
+
+        if k is None:
+            wk = self.wkpt * Ry2eV
+            SE = np.tensordot(wk, re[:, iE, :, :], axes=(0, 0)) + \
+                 1j * np.tensordot(wk, im[:, iE, :, :], axes=(0, 0))
+        else:
+            ik = self.kindex(k)
+            SE = re[ik, iE, :, :] * Ry2eV + 1j * (im[ik, iE, :, :] * Ry2eV)
+
+        if sort:
+            idx = self._sort_index(tree)
+            # pivot for sorted device region
+            return SE[..., idx, :][..., idx]
+        return SE
+
     def self_energy(self, elec, E, k, sort=False):
         """ Return the self-energy from the electrode `elec`
 
@@ -208,23 +281,7 @@ class tbtsencSileTBtrans(_devncSileTBtrans):
         sort : bool, optional
            if ``True`` the returned self-energy will be sorted (equivalent to pivoting the self-energy)
         """
-        tree = self._elec(elec)
-        ik = self.kindex(k)
-        iE = self.Eindex(E)
-
-        re = self._variable('ReSelfEnergy', tree=tree)
-        im = self._variable('ImSelfEnergy', tree=tree)
-
-        SE = (re[ik, iE, :, :] + 1j * im[ik, iE, :, :]) * Ry2eV
-        if sort:
-            pvt = self.pivot(elec)
-            idx = argsort(pvt)
-            idx.shape = (-1, 1)
-
-            # pivot for sorted device region
-            return SE[idx, idx.T]
-
-        return SE
+        return self._read_self_energy(self._elec(elec), self.Eindex(E), k, sort)
 
     def self_energy_average(self, elec, E, sort=False):
         """ Return the k-averaged average self-energy from the electrode `elec`
@@ -241,22 +298,80 @@ class tbtsencSileTBtrans(_devncSileTBtrans):
            if ``True`` the returned self-energy will be sorted but not necessarily consecutive
            in the device region.
         """
-        tree = self._elec(elec)
-        iE = self.Eindex(E)
+        return self._read_self_energy(self._elec(elec), self.Eindex(E), None, sort)
 
-        re = self._variable('ReSelfEnergyMean', tree=tree)
-        im = self._variable('ImSelfEnergyMean', tree=tree)
+    def self_energy_stack(self, elec, E=None, k=None, sort=False):
+        """ Return the self-energies from the electrode `elec` for many energies
 
-        SE = (re[ik, iE, :, :] + 1j * im[ik, iE, :, :]) * Ry2eV
-        if sort:
-            pvt = self.pivot(elec)
-            idx = argsort(pvt)
-            idx.shape = (-1, 1)
+        All requested energies are read in a single (hyperslab) read.
 
-            # pivot for sorted device region
-            return SE[idx, idx.T]
+        Parameters
+        ----------
+        elec : str or int
+           the corresponding electrode to return the self-energy from
+        E : array_like or slice, optional
+           energies (or indices) to retrieve the self-energies at, see `self_energy`. Defaults to all energies.
+        k : array_like or int, optional
+           k-point to retrieve, if an integer it is the k-index in the file.
+           Defaults to the k-averaged self-energies.
+        sort : bool, optional
+           if ``True`` the returned self-energies will be sorted (equivalent to pivoting the self-energy)
 
-        return SE
+        Returns
+        -------
+        numpy.ndarray
+           the self-energies with shape ``(nE, no, no)``
+        """
+        iE, inv = self._E_indices(E)
+        SE = self._read_self_energy(self._elec(elec), iE, k, sort)
+        if inv is None:
+            return SE
+        return SE[inv]
+
+    def iter_self_energy(self, elec, E=None, k=None, sort=False):
+        """ Iterate the self-energies from the electrode `elec` for many energies
+
+        The self-energies are read in blocks of energies where each block is limited by
+        `block_bytes`, thus the memory usage is bounded for large self-energies or many energies.
+
+        Parameters
+        ----------
+        elec : str or int
+           the corresponding electrode to return the self-energy from
+        E : array_like or slice, optional
+           energies (or indices) to retrieve the self-energies at, see `self_energy`. Defaults to all energies.
+        k : array_like or int, optional
+           k-point to retrieve, if an integer it is the k-index in the file.
+           Defaults to the k-averaged self-energies.
+        sort : bool, optional
+           if ``True`` the returned self-energies will be sorted (equivalent to pivoting the self-energy)
+
+        Yields
+        ------
+        E : float
+           the energy of the self-energy
+        SE : numpy.ndarray
+           the self-energy with shape ``(no, no)``
+        """
+        tree = self._elec(elec)
+        # Retain the requested order
+        iE = self._E_list(E)
+
+        no = len(self.pivot(tree))
+        # Real, imaginary (per k-point when averaging) and complex data per energy
+        nbytes = no ** 2 * 8 * (2 * (self.nk if k is None else 1) + 2 + 2 * sort)
+        nblock = max(1, self.block_bytes // nbytes)
+
+        allE = self.E
+        for i in range(0, len(iE), nblock):
+            blk = iE[i:i + nblock]
+            uE, inv = np.unique(blk, return_inverse=True)
+            if len(uE) > 0 and uE[-1] - uE[0] + 1 == len(uE):
+                uE = slice(uE[0], uE[-1] + 1)
+            SE = self._read_self_energy(tree, uE, k, sort)
+            for j, ie in zip(inv, blk):
+                yield allE[ie], SE[j]
+            del SE
 
 
 add_sile('TBT.SE.nc', tbtsencSileTBtrans)
@@ -7,7 +7,6 @@ except Exception:
     from io import StringIO
 
 import numpy as np
-from numpy import in1d
 import itertools
 
 # The sparse matrix for the orbital/bond currents
@@ -20,8 +19,10 @@ from ._cdf import _devncSileTBtrans
 from sisl.utils import *
 import sisl._array as _a
 
-from sisl import Geometry, Atoms
+from sisl import Geometry, Atoms, SparseCSR
 from sisl.messages import warn, info, SislError
+from sisl._help import _str
+from sisl._cache import LRUCache, cache_bytes_env
 from sisl._help import _range as range
 from sisl.unit.siesta import unit_convert
 from sisl.physics.distribution import fermi_dirac
@@ -66,6 +67,30 @@ class tbtncSileTBtrans(_devncSileTBtrans):
     _trans_type = 'TBT'
     _k_avg = False
 
+    #: Maximum number of bytes read at a time when averaging k-points, see `_value_kavg`
+    kavg_bytes = 64 * 1024 ** 2
+
+    #: Memory limit of the cache of (k-averaged) data, defaults to the environment
+    #: variable ``SISL_TBT_CACHE_MB`` (in MB) or 256 MB. Set to 0 to disable the cache.
+    cache_bytes = cache_bytes_env('SISL_TBT_CACHE_MB')
+
+    def _setup(self, *args, **kwargs):
+        """ Setup the special object for data containing """
+        self._cache = LRUCache(self.cache_bytes)
+        # Sparsity patterns of the sparse data (per supercell request)
+        self._sparse = dict()
+        super(tbtncSileTBtrans, self)._setup(*args, **kwargs)
+
+    def cache_clear(self):
+        """ Clear the cache of read (k-averaged) data
+
+        All k-averaged and energy sliced data read from the file is cached (see `cache_bytes`)
+        such that repeated requests of the same data does not re-read and re-average the data.
+        If the file is changed while this object is open the cache should be cleared.
+        """
+        self._cache.clear()
+        self._sparse = dict()
+
     def write_tbtav(self, *args, **kwargs):
         """ Convert this to a TBT.AV.nc file, i.e. all k dependent quantites are averaged out.
 
@@ -83,6 +108,96 @@ class tbtncSileTBtrans(_devncSileTBtrans):
         f = kwargs.get('file', f)
         tbtavncSileTBtrans(f, mode='w', access=0).write_tbtav(self)
 
+    def write_negf(self, negf, E, k=(0, 0, 0), wk=None, workers=None):
+        """ Calculate and write the transmissions, DOS and spectral DOS of a `NEGF` calculation
+
+        The file may subsequently be read as any TBtrans output file.
+        Each k-point is calculated and written before the next one.
+
+        Parameters
+        ----------
+        negf : NEGF
+           the block-tridiagonal transport calculator
+        E : array_like
+           the energies (in eV)
+        k : array_like or BrillouinZone, optional
+           k-points (in reduced coordinates)
+        wk : array_like, optional
+           weights of the k-points, defaults to equal weights
+           (or the weights of the `BrillouinZone`)
+        workers : int, optional
+           number of threads used in the calculation, see `NEGF.calculate`
+        """
+        sile_raise_write(self)
+
+        if hasattr(k, 'weight'):
+            # BrillouinZone
+            wk = k.weight
+            k = k.k
+        k = _a.asarrayd(k).reshape(-1, 3)
+        nk = len(k)
+        if wk is None:
+            wk = _a.fulld(nk, 1. / nk)
+        E = _a.asarrayd(E).ravel()
+
+        geom = negf.H.geometry
+        pivot = negf.pivot
+        a_dev = np.unique(geom.o2a(pivot))
+
+        # Create dimensions
+        for d, n in [('one', 1), ('xyz', 3), ('n_s', geom.n_s), ('na_u', geom.na), ('no_u', geom.no),
+                     ('na_d', len(a_dev)), ('no_d', len(pivot)), ('n_btd', len(negf.btd)),
+                     ('nkpt', None), ('ne', len(E))]:
+            self._crt_dim(self, d, n)
+
+        def crt_var(g, name, dtype, dims, value=None, info=None, unit=None):
+            v = self._crt_var(g, name, dtype, dims, **self._cmp_args)
+            if info is not None:
+                v.info = info
+            if unit is not None:
+                v.unit = unit
+            if value is not None:
+                v[:] = value
+            return v
+
+        crt_var(self, 'cell', 'f8', ('xyz', 'xyz'), geom.cell / Bohr2Ang, 'Unit cell', 'Bohr')
+        crt_var(self, 'nsc', 'i4', ('xyz', ), geom.nsc, 'Number of supercells in each unit-cell direction')
+        crt_var(self, 'isc_off', 'i4', ('n_s', 'xyz'), geom.sc.sc_off, 'Index of supercell coordinates')
+        crt_var(self, 'xa', 'f8', ('na_u', 'xyz'), geom.xyz / Bohr2Ang, 'Atomic coordinates', 'Bohr')
+        crt_var(self, 'lasto', 'i4', ('na_u', ), geom.lasto + 1, 'Last orbital of equivalent atom')
+        crt_var(self, 'a_dev', 'i4', ('na_d', ), a_dev + 1, 'Device region atoms')
+        crt_var(self, 'pivot', 'i4', ('no_d', ), pivot + 1, 'Pivot table')
+        crt_var(self, 'btd', 'i4', ('n_btd', ), negf.btd, 'Block tri-diagonal partitioning')
+        crt_var(self, 'E', 'f8', ('ne', ), E * eV2Ry, 'Energy', 'Ry')
+        vk = crt_var(self, 'kpt', 'f8', ('nkpt', 'xyz'), info='k point', unit='b')
+        vwk = crt_var(self, 'wkpt', 'f8', ('nkpt', ), info='k point weights')
+        vDOS = crt_var(self, 'DOS', 'f8', ('nkpt', 'ne', 'no_d'), info='Density of states', unit='1/Ry')
+
+        vT = {}
+        vADOS = []
+        for ie, elec in enumerate(negf.elecs):
+            g = self._crt_grp(self, elec)
+            crt_var(g, 'mu', 'f8', ('one', ), negf.mu[ie] * eV2Ry, 'Chemical potential', 'Ry')
+            crt_var(g, 'kT', 'f8', ('one', ), negf.kT[ie] * eV2Ry, 'Electronic temperature', 'Ry')
+            crt_var(g, 'eta', 'f8', ('one', ), getattr(negf._elec_se[ie], 'eta', 0.) * eV2Ry,
+                    'Imaginary part for self-energies', 'Ry')
+            vADOS.append(crt_var(g, 'ADOS', 'f8', ('nkpt', 'ne', 'no_d'),
+                                 info='Spectral function density of states', unit='1/Ry'))
+            for je, other in enumerate(negf.elecs):
+                if ie != je:
+                    vT[ie, je] = crt_var(g, other + '.T', 'f8', ('nkpt', 'ne'), info='Transmission')
+
+        for ik in range(nk):
+            T, DOS, ADOS = negf.calculate(E, k[ik], workers)
+            vk[ik, :] = k[ik]
+            vwk[ik] = wk[ik]
+            vDOS[ik, :, :] = DOS * Ry2eV
+            for ie in range(len(negf.elecs)):
+                vADOS[ie][ik, :, :] = ADOS[:, ie, :] * Ry2eV
+            for (ie, je), v in vT.items():
+                v[ik, :] = T[:, ie, je]
+        self.sync()
+
     def _value_avg(self, name, tree=None, kavg=False):
         """ Local method for obtaining the data from the SileCDF.
 
@@ -93,37 +208,7 @@ class tbtncSileTBtrans(_devncSileTBtrans):
             if name in self._data:
                 return self._data[name]
 
-        v = self._variable(name, tree=tree)
-        if self._k_avg:
-            return v[:]
-
-        wkpt = self.wk
-
-        # Perform normalization
-        orig_shape = v.shape
-        if isinstance(kavg, bool):
-            if kavg:
-                nk = len(wkpt)
-                data = v[0, ...] * wkpt[0]
-                for i in range(1, nk):
-                    data += v[i, :] * wkpt[i]
-                data.shape = orig_shape[1:]
-            else:
-                data = v[:]
-
-        elif isinstance(kavg, Integral):
-            data = v[kavg, ...] * wkpt[kavg]
-            data.shape = orig_shape[1:]
-
-        else:
-            # We assume kavg is some kind of iterable
-            data = v[kavg[0], ...] * wkpt[kavg[0]]
-            for i in range(1, len(kavg)):
-                data += v[kavg[i], ...] * wkpt[kavg[i]]
-            data.shape = orig_shape[1:]
-
-        # Return data
-        return data
+        return self._value_cached(name, tree, kavg)
 
     def _value_E(self, name, tree=None, kavg=False, E=None):
         """ Local method for obtaining the data from the SileCDF using an E index.
@@ -133,39 +218,131 @@ class tbtncSileTBtrans(_devncSileTBtrans):
             return self._value_avg(name, tree, kavg)
 
         # Ensure that it is an index
-        iE = self.Eindex(E)
+        return self._value_cached(name, tree, kavg, self.Eindex(E))
 
-        v = self._variable(name, tree=tree)
-        if self._k_avg:
-            return v[iE, ...]
+    def _value_cached(self, name, tree, kavg, iE=None):
+        """ Local method for the (cached) k-averaged data of a variable, optionally at energy index `iE`
 
-        wkpt = self.wk
+        A copy of the cached data is returned.
+        """
+        # Create a hashable key, note that True == 1
+        if isinstance(tree, list):
+            tree = tuple(tree)
+        if isinstance(kavg, bool):
+            kkey = kavg
+        elif isinstance(kavg, Integral):
+            kkey = ('k', int(kavg))
+        else:
+            kkey = tuple(np.sort(_a.asarrayi(kavg).ravel()).tolist())
+        if iE is None or isinstance(iE, slice):
+            Ekey = iE if iE is None else (iE.start, iE.stop, iE.step)
+        else:
+            Ekey = int(iE)
+        key = (name, tree, kkey, Ekey)
+
+        cache = self._cache
+        cache.max_bytes = self.cache_bytes
+        data = cache.get(key)
+        if data is None:
+            v = self._variable(name, tree=tree)
+            if self._k_avg:
+                if iE is None:
+                    data = np.array(v[:])
+                else:
+                    data = np.array(v[iE, ...])
+            else:
+                data = self._value_kavg(v, kavg, iE)
+            cache.add(key, data)
+        return data.copy()
 
-        # Perform normalization
-        orig_shape = v.shape
+    def _value_kavg(self, v, kavg, iE=None):
+        """ Local method for the k-averaging of the variable `v` (optionally at energy index `iE`)
 
-        if isinstance(kavg, bool):
-            if kavg:
-                nk = len(wkpt)
-                data = np.array(v[0, iE, ...]) * wkpt[0]
-                for i in range(1, nk):
-                    data += v[i, iE, ...] * wkpt[i]
-                data.shape = orig_shape[2:]
+        The k-points are read in hyperslabs of consecutive k-points (aligned to the chunks
+        of the NetCDF variable) of at most `kavg_bytes` bytes. Each hyperslab is reduced with the
+        k-point weights.
+
+        Parameters
+        ----------
+        v : netCDF4.Variable or numpy.ndarray
+           the variable with the k-points along the first dimension
+        kavg : bool, int or array_like
+           whether the returned data is k-averaged, an explicit k-point
+           or a selection of k-points
+        iE : int, slice or array_like, optional
+           only return data for this energy index (or range/sorted list of energy indices)
+           (the second dimension)
+        """
+        if iE is None:
+            idx = ()
+            shape = v.shape[1:]
+        elif isinstance(iE, slice):
+            idx = (iE, )
+            shape = (len(range(*iE.indices(v.shape[1]))), ) + v.shape[2:]
+        elif np.ndim(iE) > 0:
+            if isinstance(v, np.ndarray):
+                # numpy does not index the k-points and energies orthogonally
+                v = v[:, iE, ...]
+                idx = ()
             else:
-                data = np.array(v[:, iE, ...])
+                idx = (iE, )
+            shape = (len(iE), ) + v.shape[2:]
+        else:
+            idx = (iE, )
+            shape = v.shape[2:]
 
+        if isinstance(kavg, bool):
+            if not kavg:
+                return np.array(v[(slice(None), ) + idx])
+            ik = _a.arangei(v.shape[0])
+            w = self.wk
         elif isinstance(kavg, Integral):
-            data = np.array(v[kavg, iE, ...]) * wkpt[kavg]
-            data.shape = orig_shape[2:]
+            data = np.array(v[(kavg, ) + idx]) * self.wk[kavg]
+            data.shape = shape
+            return data
+        else:
+            # We assume kavg is some kind of iterable
+            # Sort the k-points, repeated k-points are weighted accordingly
+            ik, count = np.unique(_a.asarrayi(kavg).ravel() % v.shape[0], return_counts=True)
+            w = self.wk[ik] * count
 
+        # Number of k-points read at a time
+        nblk = max(1, self.kavg_bytes // max(1, int(np.prod(shape)) * v.dtype.itemsize))
+        try:
+            chunk = v.chunking()
+        except AttributeError:
+            # a numpy array
+            chunk = None
+        if isinstance(chunk, list):
+            chunk = chunk[0]
         else:
-            # We assume kavg is some kind of itterable
-            data = v[kavg[0], iE, ...] * wkpt[kavg[0]]
-            for i in kavg[1:]:
-                data += v[i, iE, ...] * wkpt[i]
-            data.shape = orig_shape[2:]
+            # contiguous variable
+            chunk = 1
+        if nblk >= chunk:
+            nblk -= nblk % chunk
+
+        data = None
+        # Loop hyperslabs aligned to nblk
+        i = 0
+        while i < len(ik):
+            start = ik[i] - ik[i] % nblk
+            j = np.searchsorted(ik, start + nblk)
+            lo, hi = ik[i], ik[j - 1] + 1
+            if hi - lo > 2 * (j - i):
+                # Too sparse for a hyperslab
+                blk = np.asarray(v[(ik[i:j], ) + idx])
+            else:
+                blk = np.asarray(v[(slice(lo, hi), ) + idx])
+                if hi - lo != j - i:
+                    blk = blk[ik[i:j] - lo, ...]
+            blk = np.tensordot(w[i:j], blk, axes=(0, 0))
+            if data is None:
+                data = blk
+            else:
+                data += blk
+            i = j
 
-        # Return data
+        data.shape = shape
         return data
 
     def _elec(self, elec):
@@ -628,29 +805,41 @@ class tbtncSileTBtrans(_devncSileTBtrans):
            I(\mu_t - \mu_f) = \frac{e}{h}\int\!\mathrm{d}E\, T(E) [n_F(\mu_t, k_B T_t) - n_F(\mu_f, k_B T_f)]
 
         The chemical potential and the temperature are passed as arguments to
-        this routine.
+        this routine. All parameters may be arrays (broadcasted against each other) in which
+        case the current is calculated for all parameters (e.g. an I-V curve) while the
+        transmission is only read once.
 
         Parameters
         ----------
         elec_from: str, int
            the originating electrode
-        mu_from: float
+        mu_from: float or array_like
            the chemical potential of the electrode (in eV)
-        kt_from: float
+        kt_from: float or array_like
            the electronic temperature of the electrode (in eV)
         elec_to: str, int
            the absorbing electrode (different from `elec_from`)
-        mu_to: float
+        mu_to: float or array_like
            the chemical potential of the electrode (in eV)
-        kt_to: float
+        kt_to: float or array_like
            the electronic temperature of the electrode (in eV)
         kavg: bool, int or array_like, optional
            whether the returned current is k-averaged, an explicit k-point
            or a selection of k-points
 
+        Returns
+        -------
+        float or numpy.ndarray : the current, an array with the broadcasted shape of the parameters
+
+        Examples
+        --------
+        >>> V = np.linspace(0, 1, 101) # doctest: +SKIP
+        >>> I = tbt.current_parameter(0, V / 2, 0.025, 1, -V / 2, 0.025) # I-V curve # doctest: +SKIP
+
         See Also
         --------
         current : which calculates the current with the chemical potentials and temperatures set in the TBtrans calculation
+        noise_parameter : the noise for arbitrary chemical potentials and temperatures
         """
         elec_from = self._elec(elec_from)
         elec_to = self._elec(elec_to)
@@ -663,28 +852,159 @@ class tbtncSileTBtrans(_devncSileTBtrans):
         # to both ends.
         dE = E[1] - E[0]
 
-        # Check that the lower bound is sufficient
-        print_warning = mu_from - kt_from * 3 < E[0] - dE / 2 or \
-                        mu_to - kt_to * 3  < E[0] - dE / 2
-        print_warning = mu_from + kt_from * 3 > E[-1] + dE / 2 or \
-                        mu_to + kt_to * 3  > E[-1] + dE / 2 or \
-                        print_warning
+        shape, param = self._parameter_check('current_parameter', E, dE, elec_from, mu_from, kt_from,
+                                             elec_to, mu_to, kt_to)
+
+        def window(nf, nt):
+            return nf - nt
+        I = self._parameter_integrate(E, param, [(window, T * dE)])
+        return I.reshape(shape)[()] * 1.6021766208e-19 / 4.135667662e-15
+
+    def _parameter_check(self, method, E, dE, elec_from, mu_from, kt_from, elec_to, mu_to, kt_to):
+        """ Broadcast the chemical potentials and temperatures and warn if the energy range is insufficient
+
+        Returns
+        -------
+        shape : tuple
+           the broadcasted shape of the parameters
+        param : numpy.ndarray
+           the flattened parameters, ``(4, n)`` for ``mu_from, kt_from, mu_to, kt_to``
+        """
+        param = np.broadcast_arrays(*[_a.asarrayd(p) for p in (mu_from, kt_from, mu_to, kt_to)])
+        shape = param[0].shape
+        param = np.array([p.ravel() for p in param])
+        mu_from, kt_from, mu_to, kt_to = param
+
+        # Check that the lower and upper bounds are sufficient
+        from_min = np.amin(mu_from - kt_from * 3)
+        from_max = np.amax(mu_from + kt_from * 3)
+        to_min = np.amin(mu_to - kt_to * 3)
+        to_max = np.amax(mu_to + kt_to * 3)
+        print_warning = min(from_min, to_min) < E[0] - dE / 2 or \
+                        max(from_max, to_max) > E[-1] + dE / 2
         if print_warning:
             # We should pretty-print a table of data
             m = max(len(elec_from), len(elec_to), 15)
             s = ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format('Energy range', E[0] - dE / 2, E[-1] + dE / 2)
-            s += ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format(elec_from, mu_from - kt_from * 3, mu_from + kt_from * 3)
-            s += ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format(elec_to, mu_to - kt_to * 3, mu_to + kt_to * 3)
-            min_e = min(mu_from - kt_from * 3, mu_to - kt_to * 3)
-            max_e = max(mu_from + kt_from * 3, mu_to + kt_to * 3)
-            s += ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format('dFermi function', min_e, max_e)
+            s += ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format(elec_from, from_min, from_max)
+            s += ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format(elec_to, to_min, to_max)
+            s += ("{:"+str(m)+"s} {:9.3f} : {:9.3f} eV\n").format('dFermi function', min(from_min, to_min),
+                                                                   max(from_max, to_max))
 
-            warn(self.__class__.__name__ + ".current_parameter cannot "
+            warn(self.__class__.__name__ + "." + method + " cannot "
                  "accurately calculate the current due to the calculated energy range. "
                  "Increase the calculated energy-range.\n" + s)
 
-        I = _a.sumd(T * dE * (fermi_dirac(E, kt_from, mu_from) - fermi_dirac(E, kt_to, mu_to)))
-        return I * 1.6021766208e-19 / 4.135667662e-15
+        return shape, param
+
+    @staticmethod
+    def _parameter_integrate(E, param, terms):
+        """ Integrate functions of the Fermi-Dirac distributions for all parameters
+
+        The Fermi windows for a block of parameters are calculated at once and
+        the integration is a matrix-vector product.
+
+        Parameters
+        ----------
+        E : numpy.ndarray
+           the energies
+        param : numpy.ndarray
+           ``(4, n)`` array of ``mu_from, kt_from, mu_to, kt_to``
+        terms : list of (func, numpy.ndarray)
+           each term integrates ``func(nf_from, nf_to).dot(vector)``
+
+        Returns
+        -------
+        numpy.ndarray : the sum of the integrated terms, ``(n, )``
+        """
+        n = param.shape[1]
+        out = _a.zerosd(n)
+        # Limit the Fermi window arrays to 8M elements (64 MB)
+        nblk = max(1, 2 ** 23 // len(E))
+        for i in range(0, n, nblk):
+            mu_f, kt_f, mu_t, kt_t = param[:, i:i+nblk, None]
+            nf = fermi_dirac(E, kt_f, mu_f)
+            nt = fermi_dirac(E, kt_t, mu_t)
+            for func, vec in terms:
+                out[i:i+nblk] += func(nf, nt).dot(vec)
+        return out
+
+    def noise_parameter(self, elec_from, mu_from, kt_from,
+                        elec_to, mu_to, kt_to, classical=False, kavg=True):
+        r""" Current noise (thermal and shot-noise) between `from` and `to` for arbitrary chemical potentials and temperatures
+
+        Calculates the zero-frequency noise as:
+
+        .. math::
+           S = \frac{2e^2}{h}\int\!\mathrm{d}E\, \Big\{\sum_n T_n(E)\big[n_F^f(1 - n_F^f) + n_F^t(1 - n_F^t)\big]
+               + \sum_n T_n(E)\big(1 - T_n(E)\big)\big(n_F^f - n_F^t\big)^2\Big\}
+
+        with :math:`n_F^f = n_F(\mu_f, k_B T_f)` and :math:`n_F^t = n_F(\mu_t, k_B T_t)`.
+        At zero temperature and constant transmission this reduces to `shot_noise`.
+        If `classical` is true the Poisson value :math:`2e|I|` is returned instead.
+
+        All parameters may be arrays (broadcasted against each other) in which case the noise is
+        calculated for all parameters while the transmission (eigenvalues) are only read once.
+
+        Parameters
+        ----------
+        elec_from: str, int
+           the originating electrode
+        mu_from: float or array_like
+           the chemical potential of the electrode (in eV)
+        kt_from: float or array_like
+           the electronic temperature of the electrode (in eV)
+        elec_to: str, int
+           the absorbing electrode (different from `elec_from`)
+        mu_to: float or array_like
+           the chemical potential of the electrode (in eV)
+        kt_to: float or array_like
+           the electronic temperature of the electrode (in eV)
+        classical: bool, optional
+           whether the Poisson (classical) shot-noise is returned
+        kavg: bool, int or array_like, optional
+           whether the returned noise is k-averaged, an explicit k-point
+           or a selection of k-points
+
+        Returns
+        -------
+        float or numpy.ndarray : the noise, an array with the broadcasted shape of the parameters
+
+        See Also
+        --------
+        shot_noise : the energy resolved shot-noise for the chemical potentials in the calculation
+        current_parameter : the current for arbitrary chemical potentials and temperatures
+        """
+        elec_from = self._elec(elec_from)
+        elec_to = self._elec(elec_to)
+        E, T = self._E_T_sorted(elec_from, elec_to, kavg)
+        dE = E[1] - E[0]
+
+        shape, param = self._parameter_check('noise_parameter', E, dE, elec_from, mu_from, kt_from,
+                                             elec_to, mu_to, kt_to)
+
+        # Pre-factor
+        e2OVERh = 2 * 1.6021766208e-19 ** 2 / 4.135667662e-15
+        if classical:
+            def window(nf, nt):
+                return nf - nt
+            S = np.abs(self._parameter_integrate(E, param, [(window, T * dE)]))
+            return S.reshape(shape)[()] * e2OVERh
+
+        TE = self.transmission_eig(elec_from, elec_to, kavg=kavg)[np.argsort(self.E)]
+        if np.any(np.logical_and.reduce(TE > 0.001, axis=-1)):
+            info(self.__class__.__name__ + ".noise_parameter does possibly not have all relevant transmission eigenvalues in the "
+                 "calculation. For some energy values all transmission eigenvalues are above 0.001!")
+
+        def thermal(nf, nt):
+            return nf * (1 - nf) + nt * (1 - nt)
+
+        def shot(nf, nt):
+            return (nf - nt) ** 2
+
+        S = self._parameter_integrate(E, param, [(thermal, T * dE),
+                                                 (shot, (TE * (1 - TE)).sum(-1) * dE)])
+        return S.reshape(shape)[()] * e2OVERh
 
     def shot_noise(self, elec_from=0, elec_to=1, classical=False, kavg=True):
         r""" Shot-noise term `from` to `to` using the k-weights and energy spacings in the file.
@@ -718,6 +1038,7 @@ class tbtncSileTBtrans(_devncSileTBtrans):
         See Also
         --------
         fano : the ratio between the quantum mechanial and the classical shot noise.
+        noise_parameter : the noise for arbitrary chemical potentials and temperatures
         """
         elec_from = self._elec(elec_from)
         elec_to = self._elec(elec_to)
@@ -766,42 +1087,62 @@ class tbtncSileTBtrans(_devncSileTBtrans):
                  "calculation. For some energy values all transmission eigenvalues are above 0.001!")
         return (TE * (1 - TE)).sum(-1) / self.transmission(elec_from, elec_to, kavg=kavg)
 
-    def _sparse_data(self, data, elec, E, kavg=True, isc=None):
-        """ Internal routine for retrieving sparse data (orbital current, COOP) """
-        # Get the geometry for obtaining the sparsity pattern.
-        if elec is not None:
-            elec = self._elec(elec)
+    def _sparse_pattern(self, isc=None):
+        """ Internal routine for retrieving the (cached) sparsity pattern of the sparse data
+
+        Parameters
+        ----------
+        isc : array_like, optional
+           the returned pattern only contains the requested supercell indices (``None`` for all
+           supercells along a direction)
 
+        Returns
+        -------
+        rptr : numpy.ndarray
+           row pointers of the pattern
+        col : numpy.ndarray
+           column indices of the pattern
+        idx : numpy.ndarray or None
+           indices of the sparse data elements in the pattern, ``None`` for all elements
+        mat_size : list of int
+           shape of the sparse matrix
+        """
         geom = self.geom
 
-        # These are the row-pointers...
-        rptr = np.insert(_a.cumsumi(self._value('n_col')), 0, 0)
+        # Figure out the super-cell indices that are requested
+        nsc = np.copy(geom.nsc)
+        if isc is None:
+            isc = [None, None, None]
+        # Shorten to the unit-cell if there are no more
+        isc = tuple(None if isc[i] is None or nsc[i] == 1 else int(isc[i]) for i in [0, 1, 2])
+        if isc[0] is None and isc[1] is None and isc[2] is None:
+            isc = None
+
+        pattern = self._sparse.get(isc, None)
+        if pattern is not None:
+            return pattern
+
+        if isc is not None:
+            # The pattern of all supercells is reduced
+            rptr, col, _, _ = self._sparse_pattern()
+        else:
+            # These are the row-pointers...
+            rptr = np.insert(_a.cumsumi(np.asarray(self._value('n_col'))), 0, 0)
 
-        # Get column indices
-        col = self._value('list_col') - 1
+            # Get column indices
+            col = np.asarray(self._value('list_col')) - 1
 
         # Default matrix size
         mat_size = [geom.no, geom.no_s]
 
-        # Figure out the super-cell indices that are requested
-        # First we figure out the indices, then
-        # we build the array of allowed columns
         if isc is None:
-            isc = [None, None, None]
-
-        if isc[0] is None and isc[1] is None and isc[2] is None:
-            all_col = None
+            idx = None
 
         else:
             # The user has requested specific supercells
             # Here we create a list of supercell interactions.
-
-            nsc = np.copy(geom.nsc)
-            # Shorten to the unit-cell if there are no more
             for i in [0, 1, 2]:
-                if nsc[i] == 1:
-                    isc[i] = 0
-                if not isc[i] is None:
+                if isc[i] is not None:
                     nsc[i] = 1
 
             # Small function for creating the supercells allowed
@@ -814,39 +1155,144 @@ class tbtncSileTBtrans(_devncSileTBtrans):
             y = ret_range(nsc[1], isc[1])
             z = ret_range(nsc[2], isc[2])
 
-            # Make a shrinking logical array for selecting a subset of the
-            # orbital currents...
-            all_col = _a.emptyi(len(x) * len(y) * len(z))
-            for i, (ix, iy, iz) in enumerate(itertools.product(x, y, z)):
-                all_col[i] = geom.sc_index([ix, iy, iz])
+            all_sc = geom.sc_index(list(itertools.product(x, y, z)))
+            all_sc = _a.asarrayi(all_sc).ravel()
 
             # If the user requests a single supercell index, we will
             # return a square matrix
-            if len(all_col) == 1:
+            if len(all_sc) == 1:
                 mat_size[1] = mat_size[0]
 
-            # Transfer all_col to the range
-            all_col = array_arange(all_col * geom.no,
-                                   n=_a.fulli(len(all_col), geom.no))
+            # Create a logical array for sub-indexing the columns
+            # from the supercell index of each column
+            sc = np.zeros(geom.n_s, dtype=np.bool_)
+            sc[all_sc] = True
+            mask = sc[col // geom.no]
+            idx = mask.nonzero()[0]
+            col = col[idx]
+            if len(all_sc) == 1:
+                # Square matrix, i.e. fold the columns into the unit-cell
+                col = col % geom.no
+
+            # Recreate row-pointer from the number of retained elements before each row
+            # (segment counts of the mask)
+            cmask = np.insert(_a.cumsumi(mask), 0, 0)
+            rptr = cmask[rptr]
+            del mask, cmask
+
+        pattern = (rptr, col, idx, mat_size)
+        self._sparse[isc] = pattern
+        return pattern
 
-            # Create a logical array for sub-indexing
-            all_col = in1d(col, _a.arrayi(all_col))
-            col = col[all_col]
+    def _sparse_data(self, data, elec, E, kavg=True, isc=None):
+        """ Internal routine for retrieving sparse data (orbital current, COOP) """
+        # Get the geometry for obtaining the sparsity pattern.
+        if elec is not None:
+            elec = self._elec(elec)
 
-            # recreate row-pointer
-            cnz = np.count_nonzero
-            def func(ptr1, ptr2):
-                return cnz(all_col[ptr1:ptr2])
-            tmp = _a.arrayi(map(func, rptr[:geom.no], rptr[1:]))
-            rptr = np.insert(_a.cumsumi(tmp), 0, 0)
-            del tmp
+        rptr, col, idx, mat_size = self._sparse_pattern(isc)
 
-        if all_col is None:
+        if idx is None:
             D = self._value_E(data, elec, kavg, E)
         else:
-            D = self._value_E(data, elec, kavg, E)[..., all_col]
+            D = self._value_E(data, elec, kavg, E)[..., idx]
+
+        # The cached pattern may not be changed by the returned matrix
+        return csr_matrix((D, col.copy(), rptr.copy()), shape=mat_size)
+
+    def _E_indices(self, E):
+        """ Energy indices from an energy (index) list, a slice of indices or ``None`` (all energies) """
+        nE = len(self.E)
+        if E is None:
+            return _a.arangei(nE)
+        elif isinstance(E, slice):
+            return _a.arangei(nE)[E]
+        elif isinstance(E, (Integral, float, _str)):
+            E = [E]
+        return _a.arrayi([self.Eindex(e) for e in E]) % nE
+
+    def _sparse_data_stack(self, data, elec, E, kavg=True, isc=None):
+        """ Internal routine for retrieving sparse data (orbital current, COOP) at several energies
+
+        Consecutive energies are read (and cached) in a single hyperslab, otherwise only the
+        requested energies are read. The returned `SparseCSR` has the energies along the last dimension.
+        """
+        if elec is not None:
+            elec = self._elec(elec)
+        if isinstance(kavg, bool) and not kavg:
+            raise ValueError(self.__class__.__name__ + '._sparse_data_stack requires '
+                             'k-averaged data or explicit k-points.')
+
+        iE = self._E_indices(E)
+        if len(iE) == 0:
+            raise ValueError(self.__class__.__name__ + '._sparse_data_stack requires '
+                             'at least one energy.')
+        rptr, col, idx, mat_size = self._sparse_pattern(isc)
+
+        if np.all(np.diff(iE) == 1):
+            # Consecutive energies are read in one hyperslab
+            D = self._value_cached(data, elec, kavg, slice(iE[0], iE[-1] + 1))
+        else:
+            # Only read the requested energies, memory does not follow the span of iE
+            uE, inv = np.unique(iE, return_inverse=True)
+            v = self._variable(data, tree=elec)
+            if self._k_avg:
+                D = np.array(v[uE, ...])
+            else:
+                D = self._value_kavg(v, kavg, uE)
+            if len(uE) != len(iE) or np.any(uE != iE):
+                D = D[inv]
+        if idx is not None:
+            D = D[:, idx]
+
+        return SparseCSR((D.T, col.copy(), rptr.copy()), shape=(mat_size[0], mat_size[1], len(iE)))
+
+    def _sparse_data_stack_orb_to_atom(self, Dij, uc=False):
+        """ Reduce orbital sparse data (all dimensions) to atomic sparse data
+
+        Contrary to `_sparse_data_orb_to_atom` the duplicate elements are summed.
+
+        Parameters
+        ----------
+        Dij : SparseCSR
+           the input data (finalized)
+        uc : bool, optional
+           whether the returned data are only in the unit-cell.
+        """
+        geom = self.geom
+        na = geom.na
+
+        if not uc:
+            uc = Dij.shape[0] == Dij.shape[1]
+        if uc:
+            nc = na
+        else:
+            nc = na * geom.n_s
 
-        return csr_matrix((D, col, rptr), shape=mat_size)
+        # Atomic rows and columns of all elements
+        row = geom.o2a(np.repeat(_a.arangei(Dij.shape[0]), Dij.ncol))
+        col = geom.o2a(Dij.col)
+        if uc:
+            col = col % na
+        bond, inv = np.unique(row.astype(np.int64) * nc + col, return_inverse=True)
+
+        # Sum all elements belonging to the same bond (for all dimensions)
+        # by a sparse matrix product
+        nnz = len(inv)
+        P = csr_matrix((np.ones(nnz, dtype=Dij.dtype), (inv, _a.arangei(nnz))), shape=(len(bond), nnz))
+        D = P.dot(Dij.data[:nnz])
+
+        ptr = np.insert(_a.cumsumi(np.bincount(bond // nc, minlength=na)), 0, 0)
+        return SparseCSR((D, (bond % nc).astype(np.int32), ptr), shape=(na, nc, Dij.shape[2]))
+
+    @staticmethod
+    def _sparse_data_stack_row_sum(Dij):
+        """ Sum of each row of the sparse data (all dimensions), shape ``(Dij.shape[2], Dij.shape[0])`` """
+        nr = Dij.shape[0]
+        nnz = Dij.nnz
+        row = np.repeat(_a.arangei(nr), Dij.ncol)
+        R = csr_matrix((np.ones(nnz, dtype=Dij.dtype), (row, _a.arangei(nnz))), shape=(nr, nnz))
+        return R.dot(Dij.data[:nnz]).T
 
     def _sparse_data_orb_to_atom(self, Dij, uc=False):
         """ Reduce orbital sparse data to atomic sparse data
@@ -977,6 +1423,56 @@ class tbtncSileTBtrans(_devncSileTBtrans):
 
         return J
 
+    def orbital_current_stack(self, elec, E=None, kavg=True, isc=None, take='all'):
+        """ Orbital currents originating from `elec` at several energies
+
+        Equivalent to calling `orbital_current` for each energy, but all energies are
+        read at once and share the same sparsity pattern (zero elements are retained).
+
+        Parameters
+        ----------
+        elec: str, int
+           the electrode of originating electrons
+        E: array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg: bool, int or array_like, optional
+           whether the returned orbital currents are k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        isc: array_like, optional
+           the returned orbital currents from the unit-cell to the given supercell,
+           see `orbital_current`.
+        take : {'all', '+', '-'}
+           which orbital currents to return, all, positive or negative values only.
+
+        Returns
+        -------
+        SparseCSR : the orbital currents with ``shape = (no, no_s, nE)``, use ``J.tocsr(i)`` for
+                    a ``scipy.sparse.csr_matrix`` of the i'th energy
+
+        Examples
+        --------
+        >>> J = tbt.orbital_current_stack(0, slice(10, 20)) # orbital currents for energy indices 10 to 19 # doctest: +SKIP
+        >>> J.tocsr(2) # orbital current at energy index 12 # doctest: +SKIP
+
+        See Also
+        --------
+        orbital_current : the orbital current at a single energy
+        bond_current_stack : the bond currents at several energies
+        atom_current_stack : the atomic currents at several energies
+        """
+        J = self._sparse_data_stack('J', elec, E, kavg, isc)
+
+        if take == '+':
+            J.data[J.data < 0] = 0
+        elif take == '-':
+            J.data[J.data > 0] = 0
+        elif take != 'all':
+            raise ValueError(self.__class__.__name__ + '.orbital_current_stack "take" keyword has '
+                             'wrong value ["all", "+", "-"] allowed.')
+
+        return J
+
     def bond_current_from_orbital(self, Jij, sum='+', uc=False):
         r""" Bond-current between atoms (sum of orbital currents) from an external orbital current
 
@@ -1090,6 +1586,47 @@ class tbtncSileTBtrans(_devncSileTBtrans):
 
         return self.bond_current_from_orbital(Jij, sum=sum, uc=uc)
 
+    def bond_current_stack(self, elec, E=None, kavg=True, isc=None, sum='+', uc=False):
+        """ Bond-currents between atoms (sum of orbital currents) at several energies
+
+        Equivalent to calling `bond_current` for each energy, but all energies are
+        read and reduced at once (zero elements are retained).
+
+        Parameters
+        ----------
+        elec : str, int
+           the electrode of originating electrons
+        E : array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg : bool, int or array_like, optional
+           whether the returned bond currents are k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        isc : array_like, optional
+           the returned bond currents from the unit-cell to the given supercell,
+           see `bond_current`.
+        sum : {'+', 'all', '-'}
+           If "+" is supplied only the positive orbital currents are used,
+           for "-", only the negative orbital currents are used,
+           else return the sum of both.
+        uc : bool, optional
+           whether the returned bond-currents are only in the unit-cell.
+
+        Returns
+        -------
+        SparseCSR : the bond currents with ``shape = (na, na * n_s, nE)`` (or ``(na, na, nE)``)
+
+        See Also
+        --------
+        bond_current : the bond current at a single energy
+        orbital_current_stack : the orbital currents at several energies
+        """
+        if sum not in ['+', '-', 'all']:
+            raise ValueError(self.__class__.__name__ + '.bond_current_stack "sum" keyword has '
+                             'wrong value ["+", "-", "all"] allowed.')
+        Jij = self.orbital_current_stack(elec, E, kavg, isc, take=sum)
+        return self._sparse_data_stack_orb_to_atom(Jij, uc)
+
     def atom_current_from_orbital(self, Jij, activity=True):
         r""" Atomic current of atoms by passing the orbital current
 
@@ -1137,11 +1674,10 @@ class tbtncSileTBtrans(_devncSileTBtrans):
 
         if activity:
             # Calculate the absolute summation of all orbital
-            # currents and transfer it to a bond-current
-            Jab = self.bond_current_from_orbital(abs(Jij), sum='all')
-
-            # Sum to make it per atom, it is already the absolute
-            Jo = np.asarray(Jab.sum(1)).ravel()
+            # currents and sum them per atom
+            geom = self.geom
+            Jo = np.asarray(abs(Jij).sum(1)).ravel()
+            Jo = np.bincount(geom.o2a(_a.arangei(geom.no)), weights=Jo, minlength=geom.na)
 
             # Return the geometric mean of the atomic current X orbital
             # current.
@@ -1181,6 +1717,51 @@ class tbtncSileTBtrans(_devncSileTBtrans):
 
         return self.atom_current_from_orbital(Jorb, activity=activity)
 
+    def atom_current_stack(self, elec, E=None, kavg=True, activity=True):
+        """ Atomic currents of atoms at several energies
+
+        Equivalent to calling `atom_current` for each energy, but all energies are
+        read and reduced at once.
+
+        Parameters
+        ----------
+        elec: str, int
+           the electrode of originating electrons
+        E: array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg: bool, int or array_like, optional
+           whether the returned atomic currents are k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        activity: bool, optional
+           whether the activity current is returned, see `atom_current_from_orbital` for details.
+
+        Returns
+        -------
+        numpy.ndarray : the atomic currents with ``shape = (nE, na)``
+
+        See Also
+        --------
+        atom_current : the atomic current at a single energy
+        orbital_current_stack : the orbital currents at several energies
+        """
+        Jij = self.orbital_current_stack(elec, E, kavg)
+
+        Jab = self._sparse_data_stack_orb_to_atom(Jij)
+        np.abs(Jab.data, out=Jab.data)
+        Ja = self._sparse_data_stack_row_sum(Jab)
+
+        if activity:
+            # The absolute orbital currents summed per atom
+            np.abs(Jij.data, out=Jij.data)
+            Jo = self._sparse_data_stack_row_sum(self._sparse_data_stack_orb_to_atom(Jij))
+            Ja = np.sqrt(Ja * Jo)
+
+        # Scale correctly
+        Ja *= 0.5
+
+        return Ja
+
     def vector_current_from_bond(self, Jab):
         r""" Vector for each atom being the sum of bond-current times the normalized bond between the atoms
 
@@ -1209,32 +1790,30 @@ class tbtncSileTBtrans(_devncSileTBtrans):
         atom_current : the atomic current for each atom (scalar representation of bond-currents)
         """
         geom = self.geom
-
         na = geom.na
+
+        # Only the atoms in the device region may have bond-currents
+        dev = np.zeros(na, dtype=np.bool_)
+        dev[self.a_dev] = True
+
+        # Work on all bonds at once
+        Jab = Jab.tocoo()
+        # Remove the diagonal (prohibits the calculation of the
+        # norm of the zero vector, hence required)
+        idx = np.logical_and(dev[Jab.row], Jab.row != Jab.col)
+        idx = np.logical_and(idx, Jab.data != 0).nonzero()[0]
+        row = Jab.row[idx]
+        J = Jab.data[idx]
+
+        # Now calculate the vector elements
+        # Remark that the vector goes from ia -> ja
+        rv = geom.Rij(row, Jab.col[idx])
+        rv *= (J / np.sqrt((rv ** 2).sum(1))).reshape(-1, 1)
+
         # vector currents
-        Ja = _a.zerosd([na, 3])
-
-        # Short-hand
-        sqrt = np.sqrt
-
-        # Loop atoms in the device region
-        # These are the only atoms which may have bond-currents,
-        # So no need to loop over any other atoms
-        for ia in self.a_dev:
-            # Get csr matrix
-            Jia = Jab.getrow(ia)
-
-            # Set diagonal to zero
-            Jia[0, ia] = 0.
-            # Remove the diagonal (prohibits the calculation of the
-            # norm of the zero vector, hence required)
-            Jia.eliminate_zeros()
-
-            # Now calculate the vector elements
-            # Remark that the vector goes from ia -> ja
-            rv = geom.Rij(ia, Jia.indices)
-            rv = rv / sqrt((rv ** 2).sum(1))[:, None]
-            Ja[ia, :] = (Jia.data[:, None] * rv).sum(0)
+        Ja = _a.emptyd([na, 3])
+        for i in range(3):
+            Ja[:, i] = np.bincount(row, weights=rv[:, i], minlength=na)
 
         return Ja
 
@@ -1338,6 +1917,66 @@ class tbtncSileTBtrans(_devncSileTBtrans):
         """
         return self.orbital_ACOOP(None, E, kavg, isc)
 
+    def orbital_COOP_stack(self, E=None, kavg=True, isc=None):
+        """ Orbital COOP analysis of the Green function at several energies
+
+        Equivalent to calling `orbital_COOP` for each energy, but all energies are
+        read at once and share the same sparsity pattern (zero elements are retained).
+
+        Parameters
+        ----------
+        E: array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg: bool, int or array_like, optional
+           whether the returned COOP is k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        isc: array_like, optional
+           the returned COOP from unit-cell to the given supercell, see `orbital_COOP`.
+
+        Returns
+        -------
+        SparseCSR : the COOP with ``shape = (no, no_s, nE)``
+
+        See Also
+        --------
+        orbital_COOP : the orbital COOP at a single energy
+        orbital_ACOOP_stack : orbital COOP analysis of the spectral function at several energies
+        """
+        return self.orbital_ACOOP_stack(None, E, kavg, isc)
+
+    def orbital_ACOOP_stack(self, elec, E=None, kavg=True, isc=None):
+        """ Orbital COOP analysis of the spectral function at several energies
+
+        Equivalent to calling `orbital_ACOOP` for each energy, but all energies are
+        read at once and share the same sparsity pattern (zero elements are retained).
+
+        Parameters
+        ----------
+        elec: str or int
+           the electrode of the spectral function
+        E: array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg: bool, int or array_like, optional
+           whether the returned COOP is k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        isc: array_like, optional
+           the returned COOP from unit-cell to the given supercell, see `orbital_ACOOP`.
+
+        Returns
+        -------
+        SparseCSR : the COOP with ``shape = (no, no_s, nE)``
+
+        See Also
+        --------
+        orbital_ACOOP : the orbital COOP at a single energy
+        orbital_COOP_stack : orbital COOP analysis of the Green function at several energies
+        """
+        COOP = self._sparse_data_stack('COOP', elec, E, kavg, isc)
+        COOP.data[...] *= eV2Ry
+        return COOP
+
     def orbital_ACOOP(self, elec, E, kavg=True, isc=None):
         r""" Orbital COOP analysis of the spectral function
 
@@ -1535,6 +2174,64 @@ class tbtncSileTBtrans(_devncSileTBtrans):
         """
         return self.orbital_ACOHP(None, E, kavg, isc)
 
+    def orbital_COHP_stack(self, E=None, kavg=True, isc=None):
+        """ Orbital COHP analysis of the Green function at several energies
+
+        Equivalent to calling `orbital_COHP` for each energy, but all energies are
+        read at once and share the same sparsity pattern (zero elements are retained).
+
+        Parameters
+        ----------
+        E: array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg: bool, int or array_like, optional
+           whether the returned COHP is k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        isc: array_like, optional
+           the returned COHP from unit-cell to the given supercell, see `orbital_COHP`.
+
+        Returns
+        -------
+        SparseCSR : the COHP with ``shape = (no, no_s, nE)``
+
+        See Also
+        --------
+        orbital_COHP : the orbital COHP at a single energy
+        orbital_ACOHP_stack : orbital COHP analysis of the spectral function at several energies
+        """
+        return self.orbital_ACOHP_stack(None, E, kavg, isc)
+
+    def orbital_ACOHP_stack(self, elec, E=None, kavg=True, isc=None):
+        """ Orbital COHP analysis of the spectral function at several energies
+
+        Equivalent to calling `orbital_ACOHP` for each energy, but all energies are
+        read at once and share the same sparsity pattern (zero elements are retained).
+
+        Parameters
+        ----------
+        elec: str or int
+           the electrode of the spectral function
+        E: array_like or slice, optional
+           the energies (or energy indices), or a slice of energy indices.
+           Defaults to all energies.
+        kavg: bool, int or array_like, optional
+           whether the returned COHP is k-averaged, an explicit k-point
+           or a selection of k-points (``False`` is not allowed)
+        isc: array_like, optional
+           the returned COHP from unit-cell to the given supercell, see `orbital_ACOHP`.
+
+        Returns
+        -------
+        SparseCSR : the COHP with ``shape = (no, no_s, nE)``
+
+        See Also
+        --------
+        orbital_ACOHP : the orbital COHP at a single energy
+        orbital_COHP_stack : orbital COHP analysis of the Green function at several energies
+        """
+        return self._sparse_data_stack('COHP', elec, E, kavg, isc)
+
     def orbital_ACOHP(self, elec, E, kavg=True, isc=None):
         r""" Orbital resolved COHP analysis of the spectral function
 
@@ -88,3 +88,122 @@ def test_tbt_dH_write_read(sisl_tmp, sisl_system):
         h = sile.read_delta()
     assert h.spsame(H)
     assert h.dkind == H.dkind
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.complex128])
+def test_tbt_dH_write_stack(sisl_tmp, sisl_system, dtype):
+    f1 = sisl_tmp('gr_stack.dH.nc', _dir)
+    f2 = sisl_tmp('gr_single.dH.nc', _dir)
+    H = Hamiltonian(sisl_system.gtb, dtype=dtype)
+    H.construct([sisl_system.R, sisl_system.t])
+    H.finalize()
+    np.random.seed(1)
+    k = np.random.rand(3, 3)
+    E = np.linspace(-1, 1, 4)
+
+    def rand(*shape):
+        d = np.random.rand(*shape)
+        if dtype == np.complex128:
+            d = d + 1j * np.random.rand(*shape)
+        return d
+
+    D1 = rand(H.nnz, 1)
+    D2 = rand(len(k), H.nnz, 1)
+    D3 = rand(len(E), H.nnz, 1)
+    D4 = rand(len(k), len(E), H.nnz, 1)
+
+    with deltancSileTBtrans(f1, 'w') as sile:
+        H.geom.write(sile)
+    with deltancSileTBtrans(f1, 'a') as sile:
+        sile.write_delta_stack(H, D1)
+        sile.write_delta_stack(H, D2, k=k)
+        sile.write_delta_stack(H, D3, E=E)
+        # Write in two steps with an overlapping k-point
+        sile.write_delta_stack(H, D4[:2], k=k[:2], E=E)
+        sile.write_delta_stack(H, D4[1:], k=k[1:], E=E)
+        assert sile._get_lvl(4).variables['kpt'].shape == (3, 3)
+        assert sile._get_lvl(4).variables['E'].shape == (4, )
+
+    # Equivalent single writes
+    h = H.copy()
+    with deltancSileTBtrans(f2, 'w') as sile:
+        H.geom.write(sile)
+    with deltancSileTBtrans(f2, 'a') as sile:
+        h._csr._D[:, :] = D1
+        sile.write_delta(h)
+        for ik in range(len(k)):
+            h._csr._D[:, :] = D2[ik]
+            sile.write_delta(h, k=k[ik])
+        for iE in range(len(E)):
+            h._csr._D[:, :] = D3[iE]
+            sile.write_delta(h, E=E[iE])
+        for ik in range(len(k)):
+            for iE in range(len(E)):
+                h._csr._D[:, :] = D4[ik, iE]
+                sile.write_delta(h, k=k[ik], E=E[iE])
+
+    with deltancSileTBtrans(f1, 'r') as s1, deltancSileTBtrans(f2, 'r') as s2:
+        for lvl in range(1, 5):
+            g1 = s1._get_lvl(lvl)
+            g2 = s2._get_lvl(lvl)
+            for name in g2.variables:
+                assert np.allclose(g1.variables[name][:], g2.variables[name][:])
+        assert np.allclose(s1.read_delta(k=k[1], E=E[2])._csr._D, D4[1, 2])
+        assert np.allclose(s1.read_delta(k=k[2])._csr._D, D2[2])
+
+
+def test_tbt_dH_write_stack_non_contiguous(sisl_tmp, sisl_system):
+    f = sisl_tmp('gr_stack_nc.dH.nc', _dir)
+    H = Hamiltonian(sisl_system.gtb)
+    H.construct([sisl_system.R, sisl_system.t])
+    H.finalize()
+    np.random.seed(2)
+    E = np.linspace(-1, 1, 4)
+    D = np.random.rand(len(E), H.nnz, 1)
+
+    with deltancSileTBtrans(f, 'w') as sile:
+        H.geom.write(sile)
+    with deltancSileTBtrans(f, 'a') as sile:
+        sile.write_delta_stack(H, D[::2], E=E[::2])
+        # Overwrites E[0] and appends E[1] and E[3]
+        sile.write_delta_stack(H, D[[3, 0, 1]], E=E[[3, 0, 1]])
+        assert sile._get_lvl(3).variables['E'].shape == (4, )
+    with deltancSileTBtrans(f, 'r') as sile:
+        for iE, e in enumerate(E):
+            assert np.allclose(sile.read_delta(E=e)._csr._D, D[iE])
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_tbt_dH_write_stack_fail(sisl_tmp, sisl_system):
+    f = sisl_tmp('gr_stack_fail.dH.nc', _dir)
+    H = Hamiltonian(sisl_system.gtb)
+    H.construct([sisl_system.R, sisl_system.t])
+    H.finalize()
+    with deltancSileTBtrans(f, 'w') as sile:
+        sile.write_delta_stack(H, np.zeros([2, H.nnz, 1]), k=np.zeros([3, 3]))
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.complex128])
+def test_tbt_dhnc_write_stack(sisl_tmp, sisl_system, dtype):
+    f = sisl_tmp('gr_dhnc.dH.nc', _dir)
+    H = Hamiltonian(sisl_system.gtb, dtype=dtype)
+    H.construct([sisl_system.R, sisl_system.t])
+    H.finalize()
+    np.random.seed(3)
+    E = np.linspace(-1, 1, 3)
+    D = np.random.rand(len(E), H.nnz, 1).astype(dtype)
+
+    with dhncSileTBtrans(f, 'w') as sile:
+        H.geom.write(sile)
+    with dhncSileTBtrans(f, 'a') as sile:
+        sile.write_hamiltonian(H)
+        sile.write_delta_stack(H, D, E=E)
+    with dhncSileTBtrans(f, 'r') as sile:
+        names = ['RedH', 'ImdH'] if dtype == np.complex128 else ['dH']
+        for lvl in [1, 3]:
+            for name in names:
+                assert name in sile._get_lvl(lvl).variables
+        assert 'delta' not in sile._get_lvl(1).variables
+        assert np.allclose(sile.read_delta()._csr._D, H._csr._D)
+        for iE, e in enumerate(E):
+            assert np.allclose(sile.read_delta(E=e)._csr._D, D[iE])
@@ -0,0 +1,125 @@
+from __future__ import print_function, division
+
+import pytest
+
+import numpy as np
+
+import sisl
+from sisl.io.tbtrans import tbtsencSileTBtrans
+
+pytestmark = [pytest.mark.io, pytest.mark.tbtrans]
+_dir = 'sisl/io/tbtrans'
+
+Ry2eV = sisl.unit.siesta.unit_convert('Ry', 'eV')
+
+
+def _se_nc(f, nk=3, ne=6):
+    """ Write a small (random data) TBT.SE.nc file of a chain with 2 electrodes
+
+    Returns the pivoting tables and the self-energies (in eV)
+    """
+    import netCDF4
+    np.random.seed(1)
+    geom = sisl.Geometry([[i, 0, 0] for i in range(6)], sisl.Atom(1, R=1.1),
+                         sc=sisl.SuperCell([6, 10, 10], nsc=[1, 1, 1]))
+    pivot = np.array([1, 0, 2, 3, 5, 4])
+    data = {'wk': np.random.rand(nk)}
+    data['wk'] /= data['wk'].sum()
+    with netCDF4.Dataset(f, 'w') as nc:
+        for d, n in [('one', 1), ('xyz', 3), ('na_u', geom.na), ('no_u', geom.no),
+                     ('na_d', geom.na), ('no_d', geom.no), ('nkpt', nk), ('ne', ne)]:
+            nc.createDimension(d, n)
+
+        def var(name, dims, value, dtype='f8', g=nc):
+            v = g.createVariable(name, dtype, dims)
+            v[:] = value
+
+        var('cell', ('xyz', 'xyz'), geom.cell)
+        var('xa', ('na_u', 'xyz'), geom.xyz)
+        var('lasto', ('na_u', ), geom.lasto + 1, 'i4')
+        var('a_dev', ('na_d', ), np.arange(geom.na) + 1, 'i4')
+        var('pivot', ('no_d', ), pivot + 1, 'i4')
+        var('E', ('ne', ), np.linspace(-1, 1, ne) / Ry2eV)
+        var('kpt', ('nkpt', 'xyz'), np.random.rand(nk, 3) - 0.5)
+        var('wkpt', ('nkpt', ), data['wk'])
+        for elec, pvt in [('Left', [1, 0]), ('Right', [5, 4, 3])]:
+            g = nc.createGroup(elec)
+            no = len(pvt)
+            g.createDimension('no_e', no)
+            var('mu', ('one', ), [0.], g=g)
+            var('eta', ('one', ), [1e-4], g=g)
+            var('pivot', ('no_e', ), np.array(pvt) + 1, 'i4', g=g)
+            re = np.random.rand(nk, ne, no, no)
+            im = np.random.rand(nk, ne, no, no)
+            var('ReSelfEnergy', ('nkpt', 'ne', 'no_e', 'no_e'), re, g=g)
+            var('ImSelfEnergy', ('nkpt', 'ne', 'no_e', 'no_e'), im, g=g)
+            data[elec] = (re + 1j * im) * Ry2eV
+    return data
+
+
+def test_se_pivot(sisl_tmp):
+    f = sisl_tmp('pivot.TBT.SE.nc', _dir)
+    _se_nc(f)
+    se = tbtsencSileTBtrans(f)
+    assert se.elecs == ['Left', 'Right']
+    assert np.all(se.pivot() == [1, 0, 2, 3, 5, 4])
+    assert np.all(se.pivot('Right') == [5, 4, 3])
+    assert np.all(se.pivot(1, sort=True) == [3, 4, 5])
+    assert np.all(se.pivot('Right', in_device=True) == [3, 4, 5])
+    # The returned pivoting tables are copies of the cached tables
+    se.pivot('Right')[:] = 0
+    assert np.all(se.pivot('Right') == [5, 4, 3])
+
+
+def test_se_self_energy(sisl_tmp):
+    f = sisl_tmp('self_energy.TBT.SE.nc', _dir)
+    data = _se_nc(f)
+    se = tbtsencSileTBtrans(f)
+    SE = data['Right']
+    idx = np.argsort([5, 4, 3]).reshape(-1, 1)
+    assert np.allclose(se.self_energy('Right', 2, 1), SE[1, 2])
+    assert np.allclose(se.self_energy('Right', 2, 1, sort=True), SE[1, 2][idx, idx.T])
+    SE_avg = np.tensordot(data['wk'], SE, axes=(0, 0))
+    assert np.allclose(se.self_energy_average('Right', 3), SE_avg[3])
+    assert np.allclose(se.self_energy_average(1, 3, sort=True), SE_avg[3][idx, idx.T])
+
+    # Stacks of energies
+    assert np.allclose(se.self_energy_stack('Right', k=0), SE[0])
+    assert np.allclose(se.self_energy_stack('Right'), SE_avg)
+    assert np.allclose(se.self_energy_stack('Right', E=[4, 1, 1], k=2), SE[2, [4, 1, 1]])
+    assert np.allclose(se.self_energy_stack('Right', E=slice(1, None, 2), sort=True),
+                       SE_avg[1::2][:, idx, idx.T])
+    assert np.allclose(se.self_energy_stack('Left', E=se.E[2:4], k=1), data['Left'][1, 2:4])
+
+
+def test_se_iter_self_energy(sisl_tmp):
+    f = sisl_tmp('iter.TBT.SE.nc', _dir)
+    data = _se_nc(f)
+    se = tbtsencSileTBtrans(f)
+    # Force small blocks of energies
+    se.block_bytes = 1
+    SE = data['Right']
+    iE = [5, 0, 2, 2]
+    for i, (E, S) in enumerate(se.iter_self_energy('Right', E=iE, k=1)):
+        assert E == pytest.approx(se.E[iE[i]])
+        assert np.allclose(S, SE[1, iE[i]])
+    assert i == len(iE) - 1
+    se.block_bytes = 2 ** 20
+    SE_avg = np.tensordot(data['wk'], SE, axes=(0, 0))
+    for i, (E, S) in enumerate(se.iter_self_energy('Right')):
+        assert np.allclose(S, SE_avg[i])
+    assert i == se.nE - 1
+
+
+def test_se_self_energy_reversed(sisl_tmp):
+    f = sisl_tmp('reversed.TBT.SE.nc', _dir)
+    data = _se_nc(f)
+    se = tbtsencSileTBtrans(f)
+    SE = data['Left']
+    assert np.allclose(se.self_energy_stack('Left', slice(None, None, -1), k=0), SE[0, ::-1])
+    assert np.allclose(se.self_energy_stack('Left', slice(4, 0, -2), k=1), SE[1, 4:0:-2])
+    iE = np.arange(se.nE)[::-1]
+    for i, (E, S) in enumerate(se.iter_self_energy('Left', slice(None, None, -1), k=0)):
+        assert E == pytest.approx(se.E[iE[i]])
+        assert np.allclose(S, SE[0, iE[i]])
+    assert i == se.nE - 1
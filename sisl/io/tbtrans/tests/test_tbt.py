@@ -10,6 +10,325 @@ import sisl
 pytestmark = [pytest.mark.io, pytest.mark.tbtrans]
 _dir = 'sisl/io/tbtrans'
 
+tbt_eV2Ry = sisl.unit.siesta.unit_convert('eV', 'Ry')
+
+
+def _tbt_nc(f, nk=5, ne=4, chunk=None, seed=1, atom=None):
+    """ Write a small (random data) TBT.nc file of a chain (default 1-orbital atoms) with 2 electrodes
+
+    Returns the geometry and a dictionary with the written (k-resolved) data.
+    """
+    import netCDF4
+    np.random.seed(seed)
+    if atom is None:
+        atom = sisl.Atom(1, R=1.1)
+    geom = sisl.Geometry([[i, 0, 0] for i in range(4)], atom,
+                         sc=sisl.SuperCell([4, 10, 10], nsc=[3, 1, 1]))
+    H = sisl.Hamiltonian(geom)
+    for ia in geom:
+        for io in geom.a2o(ia, all=True):
+            H[io, geom.a2o(geom.close(ia, R=1.1), all=True)] = 1.
+    csr = H._csr
+    ncol = csr.ncol
+    col = np.concatenate([np.sort(csr.col[csr.ptr[i]:csr.ptr[i] + ncol[i]]) for i in range(geom.no)])
+    nnz = len(col)
+    wk = np.random.rand(nk)
+    wk /= wk.sum()
+
+    data = {}
+    with netCDF4.Dataset(f, 'w') as nc:
+        for d, n in [('one', 1), ('xyz', 3), ('n_s', geom.n_s), ('na_u', geom.na), ('no_u', geom.no),
+                     ('na_d', geom.na), ('no_d', geom.no), ('n_btd', 1), ('nkpt', nk),
+                     ('ne', ne), ('nnzs', nnz), ('neig', 2)]:
+            nc.createDimension(d, n)
+
+        def var(name, dims, value, dtype='f8', g=nc):
+            if chunk is not None and len(dims) > 0 and dims[0] == 'nkpt':
+                v = g.createVariable(name, dtype, dims, chunksizes=[chunk] + [len(nc.dimensions[d]) for d in dims[1:]])
+            else:
+                v = g.createVariable(name, dtype, dims)
+            v[:] = value
+            return value
+
+        var('cell', ('xyz', 'xyz'), geom.cell / sisl.unit.siesta.unit_convert('Bohr', 'Ang'))
+        var('nsc', ('xyz', ), geom.nsc, 'i4')
+        var('isc_off', ('n_s', 'xyz'), geom.sc.sc_off, 'i4')
+        var('xa', ('na_u', 'xyz'), geom.xyz / sisl.unit.siesta.unit_convert('Bohr', 'Ang'))
+        var('lasto', ('na_u', ), geom.lasto + 1, 'i4')
+        var('a_dev', ('na_d', ), np.arange(geom.na) + 1, 'i4')
+        var('pivot', ('no_d', ), np.arange(geom.no)[::-1] + 1, 'i4')
+        var('btd', ('n_btd', ), [geom.no], 'i4')
+        var('n_col', ('no_u', ), ncol, 'i4')
+        var('list_col', ('nnzs', ), col + 1, 'i4')
+        var('E', ('ne', ), np.linspace(-1, 1, ne) / sisl.unit.siesta.unit_convert('Ry', 'eV'))
+        var('kpt', ('nkpt', 'xyz'), np.random.rand(nk, 3) - 0.5)
+        var('wkpt', ('nkpt', ), wk)
+        data['DOS'] = var('DOS', ('nkpt', 'ne', 'no_d'), np.random.rand(nk, ne, geom.no))
+        data['COOP'] = var('COOP', ('nkpt', 'ne', 'nnzs'), np.random.rand(nk, ne, nnz) - 0.5)
+        data['COHP'] = var('COHP', ('nkpt', 'ne', 'nnzs'), np.random.rand(nk, ne, nnz) - 0.5)
+        for elec, other in [('Left', 'Right'), ('Right', 'Left')]:
+            g = nc.createGroup(elec)
+            var('mu', ('one', ), [0.], g=g)
+            var('kT', ('one', ), [0.001], g=g)
+            var('eta', ('one', ), [1e-4], g=g)
+            data[elec, 'T'] = var(other + '.T', ('nkpt', 'ne'), np.random.rand(nk, ne), g=g)
+            data[elec, 'T.Eig'] = var(other + '.T.Eig', ('nkpt', 'ne', 'neig'), np.random.rand(nk, ne, 2) / 2, g=g)
+            data[elec, 'ADOS'] = var('ADOS', ('nkpt', 'ne', 'no_d'), np.random.rand(nk, ne, geom.no), g=g)
+            data[elec, 'J'] = var('J', ('nkpt', 'ne', 'nnzs'), np.random.rand(nk, ne, nnz) - 0.5, g=g)
+            data[elec, 'COOP'] = var('COOP', ('nkpt', 'ne', 'nnzs'), np.random.rand(nk, ne, nnz) - 0.5, g=g)
+            data[elec, 'COHP'] = var('COHP', ('nkpt', 'ne', 'nnzs'), np.random.rand(nk, ne, nnz) - 0.5, g=g)
+    data['wk'] = wk
+    data['col'] = col
+    data['ncol'] = ncol
+    return geom, data
+
+
+@pytest.mark.parametrize("chunk", [None, 1, 3])
+def test_tbt_kavg(sisl_tmp, chunk):
+    f = sisl_tmp('kavg.TBT.nc', _dir)
+    nk = 11
+    geom, data = _tbt_nc(f, nk=nk, chunk=chunk)
+    wk = data['wk']
+    tbt = sisl.get_sile(f)
+    assert tbt.elecs == ['Left', 'Right']
+
+    T = data['Left', 'T']
+    for kavg_bytes in [8, 3 * 8 * T.shape[1], 64 * 1024 ** 2]:
+        tbt.kavg_bytes = kavg_bytes
+        tbt.cache_clear()
+        assert np.allclose(tbt.transmission('Left', 'Right'), wk.dot(T))
+        assert np.allclose(tbt.transmission('Left', 'Right', kavg=False), T)
+        assert np.allclose(tbt.transmission('Left', 'Right', kavg=3), T[3] * wk[3])
+        k = [0, 9, 2, 3, 2, 10]
+        assert np.allclose(tbt.transmission('Left', 'Right', kavg=k), (T[k] * wk[k].reshape(-1, 1)).sum(0))
+
+        # DOS is stored in pivoted order
+        DOS = data['Right', 'ADOS'][..., ::-1]
+        assert np.allclose(tbt.ADOS(1, sum=False), np.tensordot(wk, DOS, axes=(0, 0)) * tbt_eV2Ry)
+        assert np.allclose(tbt.ADOS(1, E=2, sum=False), wk.dot(DOS[:, 2]) * tbt_eV2Ry)
+        assert np.allclose(tbt.ADOS(1, E=2, kavg=[1, 2], sum=False),
+                           wk[1:3].dot(DOS[1:3, 2]) * tbt_eV2Ry)
+        assert np.allclose(tbt.DOS(E=1, kavg=False, sum=False), data['DOS'][:, 1, ::-1] * tbt_eV2Ry)
+
+
+def test_tbt_cache(sisl_tmp):
+    f = sisl_tmp('cache.TBT.nc', _dir)
+    geom, data = _tbt_nc(f)
+    wk = data['wk']
+    T = data['Left', 'T']
+    tbt = sisl.get_sile(f)
+    cache = tbt._cache
+
+    t = tbt.transmission('Left', 'Right')
+    assert cache.misses == 1
+    assert cache.hits == 0
+    # Changing the returned array does not change the cached data
+    t[:] = 0.
+    assert np.allclose(tbt.transmission('Left', 'Right'), wk.dot(T))
+    assert cache.hits == 1
+    # kavg=True and kavg=1 are different
+    assert np.allclose(tbt.transmission('Left', 'Right', kavg=1), T[1] * wk[1])
+    assert cache.misses == 2
+    DOS = data['Left', 'ADOS'][..., ::-1]
+    assert np.allclose(tbt.ADOS(0, E=2, sum=False), wk.dot(DOS[:, 2]) * tbt_eV2Ry)
+    assert cache.misses == 3
+    assert len(cache) == 3
+
+    tbt.cache_clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_tbt_cache_lru(sisl_tmp):
+    f = sisl_tmp('cache_lru.TBT.nc', _dir)
+    geom, data = _tbt_nc(f)
+    DOS = data['Left', 'ADOS'][..., ::-1]
+    tbt = sisl.get_sile(f)
+    cache = tbt._cache
+    # Room for two energy slices
+    tbt.cache_bytes = 2 * DOS[0, 0].nbytes
+    for iE in [0, 1, 0, 2]:
+        assert np.allclose(tbt.ADOS(0, E=iE, sum=False), data['wk'].dot(DOS[:, iE]) * tbt_eV2Ry)
+    assert cache.hits == 1
+    assert len(cache) == 2
+    assert cache.nbytes <= tbt.cache_bytes
+    # E-index 1 was least recently used
+    tbt.ADOS(0, E=0)
+    assert cache.hits == 2
+    tbt.ADOS(0, E=1)
+    assert cache.hits == 2
+
+    # Disabled cache
+    tbt.cache_clear()
+    tbt.cache_bytes = 0
+    tbt.transmission('Left', 'Right')
+    tbt.transmission('Left', 'Right')
+    assert cache.hits == 0
+    assert len(cache) == 0
+
+
+def test_tbt_sparse_isc(sisl_tmp):
+    f = sisl_tmp('sparse_isc.TBT.nc', _dir)
+    geom, data = _tbt_nc(f)
+    tbt = sisl.get_sile(f)
+    no = geom.no
+    J = tbt.orbital_current(0, 1).toarray()
+    assert J.shape == (no, no * 3)
+    assert len(tbt._sparse) == 1
+
+    for isc in [[0, 0, 0], [1, 0, 0], [-1, None, None], [None, 0, 0], [0, None, None]]:
+        Jsc = tbt.orbital_current(0, 1, isc=isc).toarray()
+        if isc[0] is None:
+            assert np.allclose(Jsc, J)
+        else:
+            s = geom.sc_index([isc[0], 0, 0])
+            assert np.allclose(Jsc, J[:, s * no:(s + 1) * no])
+    # [None, 0, 0] is the same as all supercells
+    assert len(tbt._sparse) == 4
+
+    # The cached pattern is not changed by the returned matrices
+    J = tbt.orbital_current(0, 1, isc=[1, 0, 0])
+    J.data[:] = 0.
+    J.eliminate_zeros()
+    assert tbt.orbital_current(0, 1, isc=[1, 0, 0]).nnz > 0
+    tbt.cache_clear()
+    assert len(tbt._sparse) == 0
+
+
+@pytest.mark.parametrize("no", [1, 2])
+def test_tbt_sparse_stack(sisl_tmp, no):
+    f = sisl_tmp('sparse_stack.TBT.nc', _dir)
+    geom, data = _tbt_nc(f, ne=6, atom=sisl.Atom(1, R=[1.1] * no))
+    tbt = sisl.get_sile(f)
+
+    def dense(S, i):
+        return S.tocsr(i).toarray()
+
+    for E in [None, slice(1, 4), [4, 1, 2], [-1], [tbt.E[2], tbt.E[0]]]:
+        iE = tbt._E_indices(E)
+        J = tbt.orbital_current_stack('Left', E)
+        assert J.shape == (geom.no, geom.no_s, len(iE))
+        Jp = tbt.orbital_current_stack('Left', E, take='+')
+        COOP = tbt.orbital_COOP_stack(E, kavg=[0, 2])
+        ACOHP = tbt.orbital_ACOHP_stack(1, E, isc=[0, 0, 0])
+        assert ACOHP.shape == (geom.no, geom.no, len(iE))
+        for isc in [None, [1, 0, 0]]:
+            Jab = tbt.bond_current_stack(0, E, isc=isc, sum='all')
+            for i, ie in enumerate(iE):
+                assert np.allclose(dense(Jab, i), tbt.bond_current(0, ie, isc=isc, sum='all').toarray())
+        Jab = tbt.bond_current_stack(0, E, uc=True)
+        Ja = tbt.atom_current_stack(0, E)
+        Jaa = tbt.atom_current_stack(0, E, activity=False)
+        assert Ja.shape == (len(iE), geom.na)
+        for i, ie in enumerate(iE):
+            assert np.allclose(dense(J, i), tbt.orbital_current(0, ie).toarray())
+            assert np.allclose(dense(Jp, i), tbt.orbital_current(0, ie, take='+').toarray())
+            assert np.allclose(dense(COOP, i), tbt.orbital_COOP(ie, kavg=[0, 2]).toarray())
+            assert np.allclose(dense(ACOHP, i), tbt.orbital_ACOHP(1, ie, isc=[0, 0, 0]).toarray())
+            assert np.allclose(dense(Jab, i), tbt.bond_current(0, ie, uc=True).toarray())
+            assert np.allclose(Ja[i], tbt.atom_current(0, ie))
+            assert np.allclose(Jaa[i], tbt.atom_current(0, ie, activity=False))
+
+
+def test_tbt_sparse_stack_indices(sisl_tmp):
+    f = sisl_tmp('sparse_stack_indices.TBT.nc', _dir)
+    geom, data = _tbt_nc(f, ne=6)
+    tbt = sisl.get_sile(f)
+
+    # Only the requested energies are read, and they are not cached
+    J = tbt.orbital_current_stack(0, [5, 0, 5])
+    assert len(tbt._cache) == 0
+    for i, ie in enumerate([5, 0, 5]):
+        assert np.allclose(J.tocsr(i).toarray(), tbt.orbital_current(0, ie).toarray())
+    J = tbt.orbital_current_stack(0, [0, 2], kavg=[1, 0])
+    for i, ie in enumerate([0, 2]):
+        assert np.allclose(J.tocsr(i).toarray(), tbt.orbital_current(0, ie, kavg=[0, 1]).toarray())
+
+
+@pytest.mark.parametrize("no", [1, 2])
+def test_tbt_vector_atom_current(sisl_tmp, no):
+    f = sisl_tmp('vector_current.TBT.nc', _dir)
+    geom, data = _tbt_nc(f, atom=sisl.Atom(1, R=[1.1] * no))
+    tbt = sisl.get_sile(f)
+
+    Jij = tbt.orbital_current(0, 1)
+    Jab = tbt.bond_current(0, 1, sum='all')
+    Ja = np.zeros([geom.na, 3])
+    Jo = np.zeros(geom.na)
+    for ia in range(geom.na):
+        for ja in range(geom.na * geom.n_s):
+            if ia != ja and Jab[ia, ja] != 0:
+                r = geom.Rij(ia, ja)
+                Ja[ia] += Jab[ia, ja] * r / (r ** 2).sum() ** 0.5
+        Jo[ia] = abs(Jij[geom.a2o(ia, all=True), :]).sum()
+    assert np.allclose(tbt.vector_current_from_bond(Jab), Ja)
+    assert np.allclose(tbt.vector_current(0, 1, sum='all'), Ja / 2)
+    Jaa = tbt.atom_current(0, 1, activity=False)
+    assert np.allclose(Jaa, abs(Jab).sum(1).A.ravel() / 2)
+    assert np.allclose(tbt.atom_current(0, 1), (Jaa * Jo / 2) ** 0.5)
+
+
+def test_tbt_current_noise_parameter(sisl_tmp):
+    f = sisl_tmp('current_parameter.TBT.nc', _dir)
+    geom, data = _tbt_nc(f, ne=101)
+    tbt = sisl.get_sile(f)
+    V = np.linspace(0.1, 0.5, 5)
+    kT = np.array([0.001, 0.01]).reshape(-1, 1)
+    e = 1.6021766208e-19
+    h = 4.135667662e-15
+
+    I = tbt.current_parameter(0, V / 2, kT, 1, -V / 2, kT)
+    assert I.shape == (2, 5)
+    assert isinstance(tbt.current_parameter(0, 0.1, 0.01, 1, -0.1, 0.01), float)
+    S = tbt.noise_parameter(0, V / 2, kT, 1, -V / 2, kT)
+    SP = tbt.noise_parameter(0, V / 2, kT, 1, -V / 2, kT, classical=True)
+    assert S.shape == (2, 5)
+
+    E = tbt.E
+    dE = E[1] - E[0]
+    T = tbt.transmission()
+    TE = tbt.transmission_eig()
+    for i in range(2):
+        for j in range(5):
+            assert np.allclose(I[i, j], tbt.current_parameter(0, V[j] / 2, kT[i, 0], 1, -V[j] / 2, kT[i, 0]))
+            nf = sisl.physics.distribution.fermi_dirac(E, kT[i, 0], V[j] / 2)
+            nt = sisl.physics.distribution.fermi_dirac(E, kT[i, 0], -V[j] / 2)
+            assert np.allclose(I[i, j], (T * (nf - nt)).sum() * dE * e / h)
+            assert np.allclose(SP[i, j], 2 * e * I[i, j])
+            s = T * (nf * (1 - nf) + nt * (1 - nt)) + (TE * (1 - TE)).sum(-1) * (nf - nt) ** 2
+            assert np.allclose(S[i, j], 2 * e ** 2 / h * s.sum() * dE)
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_tbt_sparse_stack_kavg_fail(sisl_tmp):
+    f = sisl_tmp('sparse_stack.TBT.nc', _dir)
+    _tbt_nc(f)
+    sisl.get_sile(f).orbital_current_stack(0, kavg=False)
+
+
+def test_tbt_write_negf(sisl_tmp):
+    f = sisl_tmp('negf.TBT.nc', _dir)
+    He = sisl.Hamiltonian(sisl.Geometry([0] * 3, sisl.Atom(1, R=1.1),
+                                        sc=sisl.SuperCell([1, 10, 10], nsc=[3, 1, 1])))
+    He.construct([[0.1, 1.1], [0., -1.]])
+    H = He.tile(6, 0)
+    H.set_nsc([1, 1, 1])
+    negf = sisl.NEGF(H, [('Left', sisl.RecursiveSI(He, '-A'), [0], 0.1),
+                         ('Right', sisl.RecursiveSI(He, '+A'), [5], -0.1)], btd=[3, 3])
+    E = np.linspace(-1, 1, 5)
+    sisl.get_sile(f, mode='w').write_negf(negf, E, k=[[0] * 3, [0] * 3], workers=2)
+    T, DOS, ADOS = negf.calculate(E)
+
+    tbt = sisl.get_sile(f)
+    assert tbt.elecs == ['Left', 'Right']
+    assert np.allclose(tbt.E, E)
+    assert np.allclose(tbt.mu('Left'), 0.1)
+    assert np.allclose(tbt.geometry.xyz, H.geometry.xyz)
+    assert np.allclose(tbt.transmission('Left', 'Right'), T[:, 0, 1])
+    assert np.allclose(tbt.transmission('Right', 'Left'), T[:, 1, 0])
+    assert np.allclose(tbt.DOS(sum=False), DOS)
+    assert np.allclose(tbt.ADOS('Left', sum=False), ADOS[:, 0])
+
 
 @pytest.mark.slow
 def test_1_graphene_all_content(sisl_files):
@@ -98,3 +98,49 @@ def test_imaginary_fail_geometry(sisl_tmp):
     grid2 = Grid(0.3, dtype=np.complex128)
     grid2.write(fi, imag=True)
     grid.read(fr, imag=fi)
+
+
+def test_gzip(sisl_tmp):
+    f = sisl_tmp('GRID.cube.gz', _dir)
+    grid = Grid(0.2, sc=2.0)
+    grid.grid = np.random.rand(*grid.shape) - 0.5
+    grid.write(f)
+    read = grid.read(f)
+    assert np.allclose(grid.grid, read.grid)
+
+
+def test_buffersize_fmt(sisl_tmp):
+    f = sisl_tmp('GRID.cube', _dir)
+    grid = Grid([5, 4, 7])
+    grid.grid = (np.random.rand(*grid.shape) - 0.5) * 1e-30
+    grid.write(f, fmt='.10E', buffersize=17)
+    read = grid.read(f)
+    assert np.allclose(grid.grid, read.grid, rtol=1e-9, atol=0)
+
+
+def test_single_column(sisl_tmp):
+    f = sisl_tmp('GRID.cube', _dir)
+    grid = Grid([3, 4, 5])
+    grid.grid = np.random.rand(*grid.shape)
+    grid.write(f)
+    # Re-write the data with a single value per line
+    with open(f) as fh:
+        lines = fh.readlines()
+    with open(f, 'w') as fh:
+        fh.writelines(lines[:7])
+        fh.write('\n'.join(' '.join(lines[7:]).split()) + '\n')
+    read = grid.read(f)
+    assert np.allclose(grid.grid, read.grid)
+
+
+@pytest.mark.xfail(raises=SislError)
+def test_missing_values(sisl_tmp):
+    f = sisl_tmp('GRID.cube', _dir)
+    grid = Grid([3, 4, 5])
+    grid.grid = np.random.rand(*grid.shape)
+    grid.write(f)
+    with open(f) as fh:
+        lines = fh.readlines()
+    with open(f, 'w') as fh:
+        fh.writelines(lines[:-3])
+    grid.read(f)
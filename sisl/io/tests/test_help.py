@@ -0,0 +1,41 @@
+from __future__ import print_function, division
+
+import pytest
+
+import numpy as np
+
+from sisl.io._help import array_to_text
+
+pytestmark = pytest.mark.io
+
+
+def _format(values, fmt, ncol):
+    strs = [format(v, fmt) for v in values.tolist()]
+    n = len(strs)
+    nfull = n - n % ncol
+    out = ''.join([' '.join(strs[i:i + ncol]) + '\n' for i in range(0, nfull, ncol)])
+    if nfull < n:
+        out += ''.join([v + ' ' for v in strs[nfull:]]) + '\n'
+    return out
+
+
+@pytest.mark.parametrize("fmt", ['.1e', '.5e', '.5E', '15.5e', '3.2e', '.10e', '.16e', '.5f'])
+@pytest.mark.parametrize("ncol", [1, 6])
+def test_array_to_text(fmt, ncol):
+    np.random.seed(1)
+    values = np.concatenate([(np.random.rand(2000) - 0.5) * 10. ** np.random.randint(-320, 308, 2000),
+                             np.random.randint(-1000, 1000, 2000) / 800., np.random.rand(2000),
+                             [0., -0., np.inf, -np.inf, np.nan, 5e-324, 1.7e308, 9.9999999999999]])
+    assert array_to_text(values, fmt, ncol) == _format(values, fmt, ncol)
+    assert array_to_text(values[:13], fmt, ncol) == _format(values[:13], fmt, ncol)
+
+
+def test_array_to_text_ties():
+    assert array_to_text(np.array([0.00125, 1.000005]), '.1e', 2) == '1.3e-03 1.0e+00\n'
+    assert array_to_text(np.array([1.000005]), '.5e') == '1.00001e+00\n'
+
+
+def test_array_to_text_roundtrip():
+    np.random.seed(2)
+    values = np.random.rand(10000) - 0.5
+    assert np.all(np.array(array_to_text(values, '.16e').split(), np.float64) == values)
@@ -44,3 +44,19 @@ def test_imaginary(sisl_tmp):
     grid.grid = np.random.rand(*grid.shape) + 1j*np.random.rand(*grid.shape)
     grid.write(f)
     assert not grid.geometry is None
+
+
+def test_data_format(sisl_tmp):
+    f = sisl_tmp('GRID.xsf', _dir)
+    grid = Grid([4, 5, 6], dtype=np.complex128)
+    grid.grid = (np.random.rand(*grid.shape) - 0.5) + 1j * np.random.rand(*grid.shape)
+    grid.write(f, buffersize=40)
+    with open(f) as fh:
+        lines = fh.readlines()
+    i = [j for j, l in enumerate(lines) if 'BEGIN_DATAGRID_3D' in l]
+    assert len(i) == 2
+    for j, data in zip(i, [grid.grid.real, grid.grid.imag]):
+        # x runs fastest
+        values = np.array([float(l) for l in lines[j + 6:j + 6 + grid.grid.size]])
+        assert np.allclose(values, data.T.ravel(), rtol=1e-5, atol=1e-6)
+        assert lines[j + 6 + grid.grid.size].strip() == 'END_DATAGRID_3D'
@@ -5,6 +5,7 @@ import numpy as np
 
 # Import sile objects
 from .sile import *
+from ._help import array_to_text
 
 # Import the geometry object
 from sisl import Geometry, Atom, SuperCell
@@ -170,7 +171,7 @@ class xsfSile(Sile):
         fmt : str, optional
             floating point format for data (.5e)
         buffersize : int, optional
-            size of the buffer while writing the data, (6144)
+            number of values formatted at a time while writing the data, (393216)
         """
         sile_raise_write(self)
 
@@ -180,7 +181,7 @@ class xsfSile(Sile):
         self.write_geometry(geom)
 
         # Buffer size for writing
-        buffersize = kwargs.get('buffersize', min(6144, args[0].grid.size))
+        buffersize = kwargs.get('buffersize', 6 * 2 ** 16)
 
         # Format for precision
         fmt = kwargs.get('fmt', '.5e')
@@ -191,6 +192,16 @@ class xsfSile(Sile):
         self._write(' ' + name.replace(' ', '_') + '\n')
         _v3 = (('{:' + fmt + '} ') * 3).strip() + '\n'
 
+        def write_data(data):
+            # for z
+            #   for y
+            #     for x
+            #       write...
+            # Whole z-planes are formatted at a time to limit memory usage
+            nz = max(1, buffersize // (data.shape[0] * data.shape[1]))
+            for iz in range(0, data.shape[2], nz):
+                self._write(array_to_text(data[:, :, iz:iz + nz].T, fmt))
+
         def write_cell(grid):
             # Now write the grid
             self._write('  {} {} {}\n'.format(*grid.shape))
@@ -210,14 +221,7 @@ class xsfSile(Sile):
 
             write_cell(grid)
 
-            # for z
-            #   for y
-            #     for x
-            #       write...
-            _fmt = '{:' + fmt + '}\n'
-            for x in np.nditer(np.asarray(grid.grid.real.T, order='C').reshape(-1), flags=['external_loop', 'buffered'],
-                               op_flags=[['readonly']], order='C', buffersize=buffersize):
-                self._write((_fmt * x.shape[0]).format(*x.tolist()))
+            write_data(grid.grid.real)
 
             self._write(' END_DATAGRID_3D\n')
 
@@ -226,9 +230,7 @@ class xsfSile(Sile):
                 continue
             self._write(' BEGIN_DATAGRID_3D_imag_{}\n'.format(name))
             write_cell(grid)
-            for x in np.nditer(np.asarray(grid.grid.imag.T, order='C').reshape(-1), flags=['external_loop', 'buffered'],
-                               op_flags=[['readonly']], order='C', buffersize=buffersize):
-                self._write((_fmt * x.shape[0]).format(*x.tolist()))
+            write_data(grid.grid.imag)
 
             self._write(' END_DATAGRID_3D\n')
 
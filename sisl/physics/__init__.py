@@ -55,6 +55,7 @@ Physical quantites
    SelfEnergy
    SemiInfinite
    RecursiveSI
+   NEGF
 
 
 States
@@ -120,5 +121,6 @@ from .densitymatrix import *
 from .hamiltonian import *
 from .hessian import *
 from .self_energy import *
+from .negf import *
 
 __all__ = [s for s in dir() if not s.startswith('_')]
@@ -0,0 +1,100 @@
+# Enables usage of Cython decorators
+cimport cython
+
+import numpy as np
+# This enables Cython enhanced compatibilities
+cimport numpy as np
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def density_pairs(double[::1] rho, const np.int64_t offset,
+                  const int[::1] pair_a, const int[::1] pair_b,
+                  const np.int64_t[::1] pair_D, const double[::1] D,
+                  const int[::1] no, const np.int64_t[::1] ptr,
+                  const np.int64_t[::1] gidx, const np.int64_t[::1] psi_ptr,
+                  const double[::1] psi):
+    r""" Add the density of atom pairs on grid points ``rho[g - offset] += \sum_{ij} \psi_i(g) D_{ij} \psi_j(g)``
+
+    Each atom (image) ``a`` is defined on the sorted linear grid indices ``gidx[ptr[a]:ptr[a+1]]``
+    and has ``no[a]`` orbitals with values stored in ``psi[psi_ptr[a]:]`` as a C-ordered
+    ``(no[a], ptr[a+1] - ptr[a])`` array.
+    Only grid points common to both atoms in a pair are considered.
+
+    The GIL is released while adding, hence several threads may run concurrently
+    on separate `rho` arrays.
+
+    Parameters
+    ----------
+    rho : np.ndarray(np.float64)
+       density to add to, grid index ``g`` is stored in ``rho[g - offset]``
+    offset : int
+       offset of the linear grid indices in `rho`
+    pair_a, pair_b : np.ndarray(np.int32)
+       atom indices of the pairs
+    pair_D : np.ndarray(np.int64)
+       offset in `D` of the C-ordered ``(no[a], no[b])`` pair coefficients
+    D : np.ndarray(np.float64)
+       pair coefficients (density matrix elements)
+    no : np.ndarray(np.int32)
+       number of orbitals per atom
+    ptr : np.ndarray(np.int64)
+       pointer to the first grid index of each atom in `gidx`
+    gidx : np.ndarray(np.int64)
+       linear grid indices (sorted per atom)
+    psi_ptr : np.ndarray(np.int64)
+       pointer to the first orbital value of each atom in `psi`
+    psi : np.ndarray(np.float64)
+       orbital values
+    """
+    with nogil:
+        _density_pairs(rho, offset, pair_a, pair_b, pair_D, D, no, ptr, gidx, psi_ptr, psi)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.initializedcheck(False)
+@cython.cdivision(True)
+cdef void _density_pairs(double[::1] rho, const np.int64_t offset,
+                         const int[::1] pair_a, const int[::1] pair_b,
+                         const np.int64_t[::1] pair_D, const double[::1] D,
+                         const int[::1] no, const np.int64_t[::1] ptr,
+                         const np.int64_t[::1] gidx, const np.int64_t[::1] psi_ptr,
+                         const double[::1] psi) nogil:
+    cdef Py_ssize_t p, a, b, ia, ib, na, nb, i, j
+    cdef np.int64_t sa, sb, pa, pb, d, g
+    cdef int noa, nob
+    cdef double val, t
+
+    for p in range(pair_a.shape[0]):
+        a = pair_a[p]
+        b = pair_b[p]
+        noa = no[a]
+        nob = no[b]
+        sa = ptr[a]
+        sb = ptr[b]
+        na = ptr[a + 1] - sa
+        nb = ptr[b + 1] - sb
+        pa = psi_ptr[a]
+        pb = psi_ptr[b]
+        d = pair_D[p]
+
+        # Merge the sorted grid indices
+        ia = 0
+        ib = 0
+        while ia < na and ib < nb:
+            g = gidx[sa + ia]
+            if g < gidx[sb + ib]:
+                ia += 1
+            elif gidx[sb + ib] < g:
+                ib += 1
+            else:
+                val = 0.
+                for i in range(noa):
+                    t = 0.
+                    for j in range(nob):
+                        t = t + D[d + i * nob + j] * psi[pb + j * nb + ib]
+                    val = val + psi[pa + i * na + ia] * t
+                rho[g - offset] += val
+                ia += 1
+                ib += 1
@@ -0,0 +1,180 @@
+""" Orbital values on grids with a cache of orbital stencils
+
+Calculating orbital values on a grid (spline evaluation and spherical harmonics) is
+the main cost of projecting density matrices and wavefunctions on grids.
+However, the orbital values of an atom only depend on the position of the atom
+relative to the nearest grid point. Many atoms (e.g. in periodic crystals) are
+at the same sub-grid offset and the orbital values may thus be re-used.
+
+Here the orbital values of an atom are stored as a *stencil*, i.e. the grid index
+offsets (relative to the grid point below the atom) and the orbital values on those
+points. The stencils are kept in a cache with a memory limit where the least recently
+used stencils are discarded.
+"""
+from __future__ import print_function, division
+
+import numpy as np
+from numpy import dot, add
+
+import sisl._array as _a
+from sisl._cache import LRUCache, cache_bytes_env
+from sisl._indices import indices_le
+from sisl._math_small import xyz_to_spherical_cos_phi
+from sisl.messages import warn
+
+
+__all__ = ['OrbitalGridCache', 'orbital_grid_cache', 'orbital_values']
+
+
+class OrbitalGridCache(LRUCache):
+    """ Cache of orbital values on grid points for atoms at specific sub-grid offsets
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+       maximum memory used by the cached stencils, defaults to the environment variable
+       ``SISL_ORBITAL_CACHE_MB`` (in MB) or 256 MB.
+    precision : int, optional
+       the sub-grid offsets are rounded to ``1 / precision`` of the grid spacing
+    """
+
+    def __init__(self, max_bytes=None, precision=10 ** 8):
+        if max_bytes is None:
+            max_bytes = cache_bytes_env('SISL_ORBITAL_CACHE_MB')
+        super(OrbitalGridCache, self).__init__(max_bytes)
+        self.precision = precision
+
+    def stencil(self, atom, dcell, offset):
+        """ Orbital values for `atom` placed at `offset` with respect to the grid point at origo
+
+        Parameters
+        ----------
+        atom : Atom
+           the atom containing the orbitals
+        dcell : numpy.ndarray
+           the voxel vectors of the grid
+        offset : numpy.ndarray of int
+           the sub-grid offset of the atom in units of ``1 / precision`` of `dcell`
+
+        Returns
+        -------
+        idx : numpy.ndarray
+           grid index offsets (``(n, 3)``) in lexicographic order
+        psi : numpy.ndarray
+           orbital values (``(atom.no, n)``)
+        """
+        key = (id(atom), dcell.tobytes(), tuple(offset))
+        entry = self.get(key)
+        if entry is not None:
+            # the atom is stored to ensure that the id is not re-used
+            if entry[0] is atom:
+                return entry[1], entry[2]
+            self.hits -= 1
+            self.misses += 1
+
+        idx, psi = _stencil(atom, dcell, offset / self.precision)
+        self.add(key, (atom, idx, psi), idx.nbytes + psi.nbytes)
+        return idx, psi
+
+
+# The cache shared by all grid projections
+orbital_grid_cache = OrbitalGridCache()
+
+
+def _stencil(atom, dcell, offset):
+    """ Calculate orbital values on grid points for `atom` placed at ``offset . dcell`` """
+    R = atom.maxR()
+
+    # Bounding box of the atomic sphere in grid indices
+    w = R * ((np.linalg.inv(dcell) ** 2).sum(0) ** 0.5)
+    imin = np.floor(offset - w).astype(np.int32)
+    imax = np.ceil(offset + w).astype(np.int32)
+    ix = _a.arangei(imin[0], imax[0] + 1)
+    iy = _a.arangei(imin[1], imax[1] + 1)
+    iz = _a.arangei(imin[2], imax[2] + 1)
+    fx = ix - offset[0]
+    fy = iy - offset[1]
+    fz = iz - offset[2]
+
+    # Real-space coordinates for all points
+    r = add.outer(add.outer(fx * dcell[0, 0], fy * dcell[1, 0]), fz * dcell[2, 0]).ravel()
+    theta = add.outer(add.outer(fx * dcell[0, 1], fy * dcell[1, 1]), fz * dcell[2, 1]).ravel()
+    cos_phi = add.outer(add.outer(fx * dcell[0, 2], fy * dcell[1, 2]), fz * dcell[2, 2]).ravel()
+    xyz_to_spherical_cos_phi(r, theta, cos_phi)
+
+    # Reduce to the points inside the sphere
+    i = indices_le(r, R)
+    r = r[i]
+    theta = theta[i]
+    cos_phi = cos_phi[i]
+    idx = _a.emptyi([len(i), 3])
+    ny, nz = len(iy), len(iz)
+    idx[:, 0] = ix[i // (ny * nz)]
+    idx[:, 1] = iy[(i // nz) % ny]
+    idx[:, 2] = iz[i % nz]
+    del i
+
+    old_err = np.seterr(divide='ignore', invalid='ignore')
+    psi = _a.zerosd([atom.no, len(r)])
+    for io, o in enumerate(atom.orbital):
+        if o.R <= 0.:
+            warn("Orbital '{}' does not have a wave-function, skipping orbital!".format(o))
+        elif R - o.R < 1e-6:
+            psi[io, :] = o.psi_spher(r, theta, cos_phi, cos_phi=True)
+        else:
+            i = indices_le(r, o.R)
+            psi[io, i] = o.psi_spher(r[i], theta[i], cos_phi[i], cos_phi=True)
+    np.seterr(**old_err)
+    return idx, psi
+
+
+def orbital_values(atom, grid, xyz, cache=None):
+    """ Orbital values of `atom` placed at `xyz` on the grid points of `grid`
+
+    Only points inside the grid are returned.
+
+    Parameters
+    ----------
+    atom : Atom
+       the atom containing the orbitals
+    grid : Grid
+       grid to calculate the orbital values on
+    xyz : numpy.ndarray
+       position of the atom with respect to the origo of the grid
+    cache : OrbitalGridCache, optional
+       cache of stencils, defaults to the shared `orbital_grid_cache`.
+
+    Returns
+    -------
+    gidx : numpy.ndarray(np.int64)
+       sorted linear indices of the grid points
+    psi : numpy.ndarray
+       orbital values (``(atom.no, len(gidx))``)
+    """
+    if atom.maxR() <= 0.:
+        warn("Atom '{}' does not have a wave-function, skipping atom.".format(atom))
+        return _a.emptyl([0]), _a.emptyd([atom.no, 0])
+
+    if cache is None:
+        cache = orbital_grid_cache
+    shape = _a.asarrayl(grid.shape)
+    prec = cache.precision
+
+    # Split the grid-coordinate of the atom into an integer and sub-grid part
+    c = dot(grid.icell, xyz) * shape
+    n = np.floor(c).astype(np.int64)
+    offset = np.rint((c - n) * prec).astype(np.int64)
+    n += offset // prec
+    offset %= prec
+
+    idx, psi = cache.stencil(atom, grid.dcell, offset)
+
+    # Reduce to the points inside the grid
+    idx = idx + n.reshape(1, 3)
+    if len(idx) > 0 and (np.any(idx.min(0) < 0) or np.any(shape <= idx.max(0))):
+        i = np.logical_and(idx >= 0, idx < shape.reshape(1, 3)).all(1).nonzero()[0]
+        idx = idx[i, :]
+        psi = psi[:, i]
+
+    gidx = (idx[:, 0] * shape[1] + idx[:, 1]) * shape[2] + idx[:, 2]
+    return gidx, psi
@@ -1,6 +1,8 @@
 from __future__ import print_function, division
 
 from numbers import Integral
+from functools import partial
+from multiprocessing.pool import ThreadPool
 from scipy.sparse import csr_matrix, triu, tril
 from scipy.sparse import hstack as ss_hstack
 import numpy as np
@@ -9,15 +11,13 @@ from numpy import dot, unique
 from sisl.geometry import Geometry
 from sisl.supercell import SuperCell
 import sisl._array as _a
-from sisl._indices import indices_le, indices_fabs_le
-from sisl._math_small import xyz_to_spherical_cos_phi
 from sisl.messages import warn, tqdm_eta
-from sisl._help import _zip as zip, _range as range
+from sisl._help import _zip as zip, _range as range, num_threads
 from sisl.utils.ranges import array_arange
 from .spin import Spin
-from sisl.sparse import SparseCSR
-from sisl.sparse_geometry import SparseOrbital
 from .sparse import SparseOrbitalBZSpin
+from ._density import density_pairs
+from ._orbital_grid import orbital_values
 
 __all__ = ['DensityMatrix']
 
@@ -155,16 +155,15 @@ class DensityMatrix(SparseOrbitalBZSpin):
            the tolerance, they will be treated as strictly zeros.
         eta: bool, optional
            show a progressbar on stdout
-        """
-        try:
-            # Once unique has the axis keyword, we know we can safely
-            # use it in this routine
-            # Otherwise we raise an ImportError
-            unique([[0, 1], [2, 3]], axis=0)
-        except:
-            raise NotImplementedError(self.__class__.__name__ + '.density requires numpy >= 1.13, either update '
-                                      'numpy or do not use this function!')
 
+        Notes
+        -----
+        The products of the orbitals are added to the grid by a compiled routine which runs
+        in parallel using threads. The number of threads defaults to the number of cores and
+        may be set with the environment variable ``SISL_NUM_THREADS``.
+        Each thread adds to a separate buffer spanning its part of the grid, the buffers
+        use at most the memory of the grid (else the values are added without threads).
+        """
         geometry = self.geometry
         # Check that the atomic coordinates, really are all within the intrinsic supercell.
         # If not, it may mean that the DM does not conform to the primary unit-cell paradigm
@@ -180,7 +179,6 @@ class DensityMatrix(SparseOrbitalBZSpin):
 
         # Extract sub variables used throughout the loop
         shape = _a.asarrayi(grid.shape)
-        dcell = grid.dcell
 
         # Sparse matrix data
         csr = self._csr
@@ -303,236 +301,171 @@ class DensityMatrix(SparseOrbitalBZSpin):
         # Retrieve all atoms within the grid supercell
         # (and the neighbours that connect into the cell)
         IA, XYZ, ISC = geometry.within_inf(sc)
+        if len(IA) == 0:
+            np.seterr(**old_err)
+            return
 
         # Retrieve progressbar
         eta = tqdm_eta(len(IA), self.__class__.__name__ + '.density', 'atom', eta)
 
-        cell = geometry.cell
         atom = geometry.atom
-        axyz = geometry.axyz
-        a2o = geometry.a2o
-
-        def xyz2spherical(xyz, offset):
-            """ Calculate the spherical coordinates from indices """
-            rx = xyz[:, 0] - offset[0]
-            ry = xyz[:, 1] - offset[1]
-            rz = xyz[:, 2] - offset[2]
-
-            # Calculate radius ** 2
-            xyz_to_spherical_cos_phi(rx, ry, rz)
-            return rx, ry, rz
-
-        def xyz2sphericalR(xyz, offset, R):
-            """ Calculate the spherical coordinates from indices """
-            rx = xyz[:, 0] - offset[0]
-            idx = indices_fabs_le(rx, R)
-            ry = xyz[idx, 1] - offset[1]
-            ix = indices_fabs_le(ry, R)
-            ry = ry[ix]
-            idx = idx[ix]
-            rz = xyz[idx, 2] - offset[2]
-            ix = indices_fabs_le(rz, R)
-            ry = ry[ix]
-            rz = rz[ix]
-            idx = idx[ix]
-            if len(idx) == 0:
-                return [], [], [], []
-            rx = rx[idx]
-
-            # Calculate radius ** 2
-            ix = indices_le(rx ** 2 + ry ** 2 + rz ** 2, R ** 2)
-            idx = idx[ix]
-            if len(idx) == 0:
-                return [], [], [], []
-            rx = rx[ix]
-            ry = ry[ix]
-            rz = rz[ix]
-            xyz_to_spherical_cos_phi(rx, ry, rz)
-            return idx, rx, ry, rz
-
-        # Looping atoms in the sparse pattern is better since we can pre-calculate
-        # the radial parts and then add them.
-        # First create a SparseOrbital matrix, then convert to SparseAtom
-        spO = SparseOrbital(geometry, dtype=np.int16)
-        spO._csr = SparseCSR(csrDM)
-        spA = spO.toSparseAtom(dtype=np.int16)
-        del spO
         na = geometry.na
-        # Remove the diagonal part of the sparse atom matrix
-        off = na * primary_i_s
-        for ia in range(na):
-            del spA[ia, off + ia]
-
-        # Get pointers and delete the atomic sparse pattern
-        # The below complexity is because we are not finalizing spA
-        csr = spA._csr
-        a_ptr = np.insert(_a.cumsumi(csr.ncol), 0, 0)
-        a_col = csr.col[array_arange(csr.ptr, n=csr.ncol)]
-        del spA, csr
-
-        # Get offset in supercell in orbitals
-        off = geometry.no * primary_i_s
+        na_s = geometry.na_s
+        firsto = geometry.firsto
+        lasto = geometry.lasto
         origo = grid.origo
-        # TODO sum the non-origo atoms to the csrDM matrix
-        #      this would further decrease the loops required.
-
-        # Loop over all atoms in the grid-cell
-        for ia, ia_xyz, isc in zip(IA, XYZ - origo.reshape(1, 3), ISC):
-            # Get current atom
-            ia_atom = atom[ia]
-            IO = a2o(ia)
-            IO_range = range(ia_atom.no)
-            cell_offset = (cell * isc.reshape(3, 1)).sum(0) - origo
-
-            # Extract maximum R
-            R = ia_atom.maxR()
-            if R <= 0.:
-                warn("Atom '{}' does not have a wave-function, skipping atom.".format(ia_atom))
-                eta.update()
-                continue
-
-            # Retrieve indices of the grid for the atomic shape
-            idx = grid.index(ia_atom.toSphere(ia_xyz))
-
-            # Now we have the indices for the largest orbital on the atom
-
-            # Subsequently we have to loop the orbitals and the
-            # connecting orbitals
-            # Then we find the indices that overlap with these indices
-            # First reduce indices to inside the grid-cell
-            idx[idx[:, 0] < 0, 0] = 0
-            idx[shape[0] <= idx[:, 0], 0] = shape[0] - 1
-            idx[idx[:, 1] < 0, 1] = 0
-            idx[shape[1] <= idx[:, 1], 1] = shape[1] - 1
-            idx[idx[:, 2] < 0, 2] = 0
-            idx[shape[2] <= idx[:, 2], 2] = shape[2] - 1
-
-            # Remove duplicates, requires numpy >= 1.13
-            idx = unique(idx, axis=0)
-            if len(idx) == 0:
-                eta.update()
-                continue
-
-            # Get real-space coordinates for the current atom
-            # as well as the radial parts
-            grid_xyz = dot(idx, dcell)
-
-            # Perform loop on connection atoms
-            # Allocate the DM_pj arrays
-            # This will have a size equal to number of elements times number of
-            # orbitals on this atom
-            # In this way we do not have to calculate the psi_j multiple times
-            DM_io = csrDM[IO:IO+ia_atom.no, :].tolil()
-            DM_pj = _a.zerosd([ia_atom.no, grid_xyz.shape[0]])
-
-            # Now we perform the loop on the connections for this atom
-            # Remark that we have removed the diagonal atom (it-self)
-            # As that will be calculated in the end
-            for ja in a_col[a_ptr[ia]:a_ptr[ia+1]]:
-                # Retrieve atom (which contains the orbitals)
-                ja_atom = atom[ja % na]
-                JO = a2o(ja)
-                jR = ja_atom.maxR()
-                # Get actual coordinate of the atom
-                ja_xyz = axyz(ja) + cell_offset
-
-                # Reduce the ia'th grid points to those that connects to the ja'th atom
-                ja_idx, ja_r, ja_theta, ja_cos_phi = xyz2sphericalR(grid_xyz, ja_xyz, jR)
-
-                if len(ja_idx) == 0:
-                    # Quick step
-                    continue
-
-                # Loop on orbitals on this atom
-                for jo in range(ja_atom.no):
-                    o = ja_atom.orbital[jo]
-                    oR = o.R
-
-                    # Downsize to the correct indices
-                    if jR - oR < 1e-6:
-                        ja_idx1 = ja_idx.view()
-                        ja_r1 = ja_r.view()
-                        ja_theta1 = ja_theta.view()
-                        ja_cos_phi1 = ja_cos_phi.view()
-                    else:
-                        ja_idx1 = indices_le(ja_r, oR)
-                        if len(ja_idx1) == 0:
-                            # Quick step
-                            continue
-
-                        # Reduce arrays
-                        ja_r1 = ja_r[ja_idx1]
-                        ja_theta1 = ja_theta[ja_idx1]
-                        ja_cos_phi1 = ja_cos_phi[ja_idx1]
-                        ja_idx1 = ja_idx[ja_idx1]
-
-                    # Calculate the psi_j component
-                    psi = o.psi_spher(ja_r1, ja_theta1, ja_cos_phi1, cos_phi=True)
-
-                    # Now add this orbital to all components
-                    for io in IO_range:
-                        DM_pj[io, ja_idx1] += DM_io[io, JO+jo] * psi
-
-                # Temporary clean up
-                del ja_idx, ja_r, ja_theta, ja_cos_phi
-                del ja_idx1, ja_r1, ja_theta1, ja_cos_phi1, psi
-
-            # Now we have all components for all orbitals connection to all orbitals on atom
-            # ia. We simply need to add the diagonal components
-
-            # Loop on the orbitals on this atom
-            ia_r, ia_theta, ia_cos_phi = xyz2spherical(grid_xyz, ia_xyz)
-            del grid_xyz
-            for io in IO_range:
-                # Only loop halve the range.
-                # This is because: triu + tril(-1).transpose()
-                # removes the lower half of the on-site matrix.
-                for jo in range(io+1, ia_atom.no):
-                    DM = DM_io[io, off+IO+jo]
-
-                    oj = ia_atom.orbital[jo]
-                    ojR = oj.R
-
-                    # Downsize to the correct indices
-                    if R - ojR < 1e-6:
-                        ja_idx1 = slice(None)
-                        ja_r1 = ia_r.view()
-                        ja_theta1 = ia_theta.view()
-                        ja_cos_phi1 = ia_cos_phi.view()
-                    else:
-                        ja_idx1 = indices_le(ia_r, ojR)
-                        if len(ja_idx1) == 0:
-                            # Quick step
-                            continue
-
-                        # Reduce arrays
-                        ja_r1 = ia_r[ja_idx1]
-                        ja_theta1 = ia_theta[ja_idx1]
-                        ja_cos_phi1 = ia_cos_phi[ja_idx1]
-
-                    # Calculate the psi_j component
-                    DM_pj[io, ja_idx1] += DM * oj.psi_spher(ja_r1, ja_theta1, ja_cos_phi1, cos_phi=True)
-
-                # Calculate the psi_i component
-                # Note that this one *also* zeroes points outside the shell
-                # I.e. this step is important because it "nullifies" all but points where
-                # orbital io is defined.
-                psi = ia_atom.orbital[io].psi_spher(ia_r, ia_theta, ia_cos_phi, cos_phi=True)
-                DM_pj[io, :] += DM_io[io, off+IO+io] * psi
-                DM_pj[io, :] *= psi
-
-            # Temporary clean up
-            ja_idx1 = ja_r1 = ja_theta1 = ja_cos_phi1 = None
-            del ia_r, ia_theta, ia_cos_phi, psi, DM_io
-
-            # Now add the density
-            grid.grid[idx[:, 0], idx[:, 1], idx[:, 2]] += DM_pj.sum(0)
-
-            # Clean-up
-            del DM_pj, idx
-
-            eta.update()
+
+        # Convert the csrDM matrix to dense blocks of atomic pairs.
+        # Each block is a C-ordered (no[ia], no[ja]) array stored in a flat array.
+        rows = np.repeat(_a.arangei(no), np.diff(csrDM.indptr))
+        cols = csrDM.indices
+        a_row = np.searchsorted(lasto, rows)
+        a_col = np.searchsorted(lasto, cols % no) + (cols // no) * na
+        pair, inv = unique(a_row.astype(np.int64) * na_s + a_col, return_inverse=True)
+        p_ia = (pair // na_s).astype(np.int32)
+        p_ja = (pair % na_s).astype(np.int32)
+        del pair
+        p_no = geometry.orbitals[p_ia] * geometry.orbitals[p_ja % na]
+        p_off = np.insert(_a.cumsuml(p_no), 0, 0)
+        D = _a.zerosd(p_off[-1])
+        D[p_off[inv] + (rows - firsto[a_row]) * geometry.orbitals[a_col % na] +
+          (cols % no - firsto[a_col % na])] = csrDM.data
+        p_off = p_off[:-1]
+        p_ptr = np.insert(_a.cumsumi(np.bincount(p_ia, minlength=na)), 0, 0)
+        del rows, cols, a_row, a_col, inv, p_no, p_ia, csrDM
+
+        # Order the atoms in the grid-cell such that consecutive atoms are spatially close
+        # This reduces the extent of the grid touched by a block of atoms
+        fxyz = np.floor(dot(XYZ - origo.reshape(1, 3), grid.icell.T) * shape.reshape(1, 3))
+        idx = np.lexsort((fxyz[:, 2], fxyz[:, 1], fxyz[:, 0]))
+        IA = IA[idx]
+        XYZ = XYZ[idx, :]
+        ISC = ISC[idx, :]
+        del fxyz, idx
+        n_img = len(IA)
+
+        # Unique codes for each atom in the grid-cell (atom index + supercell index)
+        nsc = geometry.nsc // 2
+        sc_lo = ISC.min(0) - nsc
+        sc_n = ISC.max(0) + nsc - sc_lo + 1
+
+        def sc_code(ia, isc):
+            isc = (isc - sc_lo.reshape(1, 3)).astype(np.int64)
+            return ((ia * sc_n[0] + isc[:, 0]) * sc_n[1] + isc[:, 1]) * sc_n[2] + isc[:, 2]
+
+        img_code = sc_code(IA, ISC)
+        img_sort = np.argsort(img_code)
+        img_code = img_code[img_sort]
+
+        # Create all pairs between atoms in the grid-cell
+        n = p_ptr[IA + 1] - p_ptr[IA]
+        p = array_arange(p_ptr[IA], n=n)
+        pair_a = np.repeat(_a.arangei(n_img), n)
+        ja = p_ja[p]
+        code = sc_code(ja % na, ISC[pair_a, :] + geometry.sc.sc_off[ja // na, :])
+        pair_b = np.searchsorted(img_code, code).clip(0, n_img - 1)
+        # Only retain pairs where both atoms are in the grid-cell
+        # (others do not contribute)
+        idx = (img_code[pair_b] == code).nonzero()[0]
+        pair_a = pair_a[idx]
+        pair_b = img_sort[pair_b[idx]].astype(np.int32)
+        pair_D = p_off[p[idx]]
+        del n, p, ja, code, idx, img_code, img_sort, p_ptr, p_ja, p_off
+
+        # Now loop the atoms in blocks
+        # All orbital values for atoms required in a block are calculated and kept
+        # until they are no longer needed.
+        block = 256
+        n_blk = (n_img - 1) // block + 1
+        last_blk = np.arange(n_img) // block
+        np.maximum.at(last_blk, pair_b, pair_a // block)
+        blk_ptr = np.searchsorted(pair_a, _a.arangei(0, n_blk * block + 1, block))
+
+        # Add directly to the grid if possible
+        direct = grid.grid.dtype == np.float64 and grid.grid.flags.c_contiguous
+        if direct:
+            rho = grid.grid.reshape(-1)
+        else:
+            rho = _a.zerosd(np.prod(shape))
+        n_threads = num_threads()
+        if n_threads > 1:
+            pool = ThreadPool(n_threads)
+
+        def add_pairs(rho, offset, pa, pb, pD, *args):
+            density_pairs(rho, offset, pa, pb, pD, D, *args)
+            return rho, offset
+
+        def task(job, pa, pb, pD, args):
+            # Each thread adds to a separate buffer spanning
+            # the grid points of the atoms in the thread
+            sl, lo, hi = job
+            return add_pairs(_a.zerosd(hi - lo + 1), lo, pa[sl], pb[sl], pD[sl], *args)
+
+        cache = {}
+        try:
+            for blk in range(n_blk):
+                # Pairs and atoms in this block
+                ps = slice(blk_ptr[blk], blk_ptr[blk + 1])
+                img = np.unique(np.concatenate((_a.arangei(blk * block, min(n_img, (blk + 1) * block)),
+                                                pair_b[ps])))
+                for i in img:
+                    if i not in cache:
+                        cache[i] = orbital_values(atom[IA[i]], grid, XYZ[i] - origo)
+
+                # Create local arrays for the compiled routine
+                gidx = [cache[i][0] for i in img]
+                psi = [cache[i][1].ravel() for i in img]
+                lno = _a.arrayi([atom[IA[i]].no for i in img])
+                ptr = np.insert(_a.cumsuml([len(g) for g in gidx]), 0, 0)
+                psi_ptr = np.insert(_a.cumsuml([len(p) for p in psi]), 0, 0)
+                gidx = np.concatenate(gidx)
+                psi = np.concatenate(psi)
+                pa = np.searchsorted(img, pair_a[ps]).astype(np.int32)
+                pb = np.searchsorted(img, pair_b[ps]).astype(np.int32)
+                pD = pair_D[ps]
+                # Remove pairs with atoms without grid-points
+                idx = np.logical_and(ptr[pa + 1] > ptr[pa], ptr[pb + 1] > ptr[pb]).nonzero()[0]
+                pa = pa[idx]
+                pb = pb[idx]
+                pD = pD[idx]
+                args = (lno, ptr, gidx, psi_ptr, psi)
+
+                jobs = []
+                if n_threads > 1 and len(pa) > n_threads:
+                    # Sort the pairs by the grid points of the first atom, then the threads
+                    # add to (mostly) separate parts of the grid
+                    idx = np.argsort(gidx[ptr[pa]], kind='mergesort')
+                    pa = pa[idx]
+                    pb = pb[idx]
+                    pD = pD[idx]
+                    n = len(pa)
+                    for i in range(n_threads):
+                        sl = slice(i * n // n_threads, (i + 1) * n // n_threads)
+                        jobs.append((sl, gidx[ptr[pa[sl]]].min(), gidx[ptr[pa[sl] + 1] - 1].max()))
+                    # The thread buffers may at most use the memory of the grid
+                    if sum([hi - lo + 1 for _, lo, hi in jobs]) > len(rho):
+                        jobs = []
+                if len(jobs) > 0:
+                    for r, offset in pool.map(partial(task, pa=pa, pb=pb, pD=pD, args=args), jobs):
+                        rho[offset:offset + len(r)] += r
+                elif len(pa) > 0:
+                    add_pairs(rho, 0, pa, pb, pD, *args)
+                del gidx, psi, ptr, psi_ptr, args
+
+                # Remove orbital values which are not needed anymore
+                for i in img[last_blk[img] <= blk]:
+                    del cache[i]
+
+                eta.update(min(n_img, (blk + 1) * block) - blk * block)
+        finally:
+            if n_threads > 1:
+                pool.close()
+                pool.join()
         eta.close()
+        del cache
+
+        if not direct:
+            grid.grid += rho.reshape(shape)
 
         # Reset the error code for division
         np.seterr(**old_err)
@@ -19,6 +19,7 @@ real-space wavefunctions.
    PDOS
    spin_moment
    wavefunction
+   iter_wavefunction
    CoefficientElectron
    StateElectron
    StateCElectron
@@ -30,25 +31,22 @@ real-space wavefunctions.
 from __future__ import print_function, division
 
 import numpy as np
-from numpy import floor, ceil
-from numpy import conj, dot, ogrid
-from numpy import cos, sin, pi, int32
-from numpy import add
+from numpy import conj, dot
 
 from sisl.supercell import SuperCell
 from sisl.geometry import Geometry
-from sisl._indices import indices_le
-from sisl._math_small import xyz_to_spherical_cos_phi
+from sisl.grid import Grid
 import sisl._array as _a
-from sisl.messages import info, warn, tqdm_eta
+from sisl.messages import info, warn, SislError, tqdm_eta
 from sisl._help import dtype_complex_to_real, _range as range
 from .distribution import get_distribution
 from .spin import Spin
 from .sparse import SparseOrbitalBZSpin
 from .state import Coefficient, State, StateC
+from ._orbital_grid import orbital_values
 
 
-__all__ = ['DOS', 'PDOS', 'spin_moment', 'wavefunction']
+__all__ = ['DOS', 'PDOS', 'spin_moment', 'wavefunction', 'iter_wavefunction']
 __all__ += ['CoefficientElectron', 'StateElectron', 'StateCElectron']
 __all__ += ['EigenvalueElectron', 'EigenvectorElectron', 'EigenstateElectron']
 
@@ -333,9 +331,8 @@ def wavefunction(v, grid, geometry=None, k=None, spinor=0, spin=None, eta=False)
 
     where ``spinor in [0, 1]`` determines :math:`\alpha` or :math:`\beta`, respectively.
 
-    Notes
-    -----
-    Currently this method only works for :math:`\Gamma` states
+    To calculate the wavefunctions of many states use `iter_wavefunction` which calculates
+    the orbital values only once for all states.
 
     Parameters
     ----------
@@ -374,114 +371,142 @@ def wavefunction(v, grid, geometry=None, k=None, spinor=0, spin=None, eta=False)
     if v.ndim == 2:
         v = v.sum(0)
 
+    v = _wavefunction_spinor(v, geometry, spinor, spin)
+    k, has_k = _wavefunction_k(k)
+
+    # Check that input/grid makes sense.
+    # If the coefficients are complex valued, then the grid *has* to be
+    # complex valued.
+    # Likewise if a k-point has been passed.
+    is_complex = np.iscomplexobj(v) or has_k
+    if is_complex and not np.iscomplexobj(grid.grid):
+        raise SislError("wavefunction input coefficients are complex, while grid only contains real.")
+
+    # Add directly to the grid if possible
+    direct = grid.grid.flags.c_contiguous
+    if direct:
+        psi = grid.grid.reshape(1, -1)
+    else:
+        psi = np.zeros([1, grid.grid.size], dtype=grid.grid.dtype)
+
+    atoms = _wavefunction_atoms(grid, geometry)
+    eta = tqdm_eta(len(atoms[0]), 'wavefunction', 'atom', eta)
+    _wavefunction_add(v.reshape(1, -1), psi, grid, geometry, k, atoms, eta)
+    eta.close()
+
+    if not direct:
+        grid.grid += psi.reshape(grid.shape)
+
+
+def iter_wavefunction(v, grid, geometry=None, k=None, spinor=0, spin=None, batch=None, eta=False):
+    r""" Iterate the real-space wave-functions of each state in `v`, one `Grid` per state
+
+    Contrary to `wavefunction` (which sums multiple states) this yields a new grid for each
+    state. The orbital values are only calculated once per atom for all states in a batch,
+    hence this is much faster than calling `wavefunction` for each state.
+
+    Each grid is yielded as soon as its batch is done, so they can be written to files one by one:
+
+    >>> for i, g in enumerate(iter_wavefunction(es.state, grid, H.geometry, k=es.info['k'])): # doctest: +SKIP
+    ...     g.write('psi_{}.cube'.format(i)) # doctest: +SKIP
+
+    See `wavefunction` for details on how the wavefunctions are calculated.
+
+    Parameters
+    ----------
+    v : array_like
+       coefficients for the orbital expansion on the real-space grid, one state per row.
+       If `v` is a complex array then the `grid` *must* be complex as well.
+    grid : Grid
+       template grid, the returned grids have the same shape, data-type and cell as this grid.
+       The values in `grid` are not used.
+    geometry : Geometry, optional
+       geometry where the orbitals are defined. This geometry's orbital count must match
+       the number of elements in each state in `v`.
+       If this is ``None`` the geometry associated with `grid` will be used instead.
+    k : array_like, optional
+       k-point associated with the wavefunctions. The Bloch phases are applied for each
+       supercell image of the atoms.
+    spinor : int, optional
+       the spinor for non-collinear/spin-orbit calculations, see `wavefunction`.
+    spin : Spin, optional
+       specification of the spin configuration of the orbital coefficients, see `wavefunction`.
+    batch : int, optional
+       number of states calculated in each sweep over the atoms, defaults to all states.
+       The memory requirement is `batch` grids.
+    eta : bool, optional
+       Display a console progressbar.
+
+    Yields
+    ------
+    Grid
+       the wavefunction of each state in `v`
+    """
+    if geometry is None:
+        geometry = grid.geometry
+        warn('iter_wavefunction was not passed a geometry associated, will use the geometry associated with the Grid.')
+    if geometry is None:
+        raise SislError('iter_wavefunction did not find a usable Geometry through keywords or the Grid!')
+
+    v = np.asarray(v)
+    if v.ndim == 1:
+        v = v.reshape(1, -1)
+    v = _wavefunction_spinor(v, geometry, spinor, spin)
+    k, has_k = _wavefunction_k(k)
+
+    is_complex = np.iscomplexobj(v) or has_k
+    if is_complex and not np.iscomplexobj(grid.grid):
+        raise SislError("iter_wavefunction input coefficients are complex, while grid only contains real.")
+
+    n = len(v)
+    if batch is None:
+        batch = n
+    batch = max(1, min(batch, n))
+
+    atoms = _wavefunction_atoms(grid, geometry)
+    eta = tqdm_eta(len(atoms[0]) * ((n + batch - 1) // batch), 'wavefunction', 'atom', eta)
+    for i in range(0, n, batch):
+        psi = np.zeros([min(batch, n - i), grid.grid.size], dtype=grid.grid.dtype)
+        _wavefunction_add(v[i:i + batch], psi, grid, geometry, k, atoms, eta)
+        for p in psi:
+            g = Grid(grid.shape, bc=grid.bc, sc=grid.sc, dtype=grid.dtype, geometry=grid.geometry)
+            g.grid = p.reshape(grid.shape)
+            yield g
+        del psi
+    eta.close()
+
+
+def _wavefunction_spinor(v, geometry, spinor, spin):
+    """ Select the spinor component of the coefficients (last dimension of `v`) """
     if spin is None:
-        if len(v) // 2 == geometry.no:
+        if v.shape[-1] // 2 == geometry.no:
             # We can see from the input that the vector *must* be a non-collinear calculation
-            v = v.reshape(-1, 2)[:, spinor]
+            v = v.reshape(v.shape[:-1] + (-1, 2))[..., spinor]
             info('wavefunction assumes the input wavefunction coefficients to originate from a non-collinear calculation!')
 
     elif spin.kind > Spin.POLARIZED:
         # For non-collinear cases the user selects the spinor component.
-        v = v.reshape(-1, 2)[:, spinor]
+        v = v.reshape(v.shape[:-1] + (-1, 2))[..., spinor]
 
-    if len(v) != geometry.no:
+    if v.shape[-1] != geometry.no:
         raise ValueError("wavefunction require wavefunction coefficients corresponding to number of orbitals in the geometry.")
+    return v
 
-    # Check for k-points
-    k = _a.asarrayd(k)
-    kl = (k ** 2).sum() ** 0.5
-    has_k = kl > 0.000001
-    if has_k:
-        raise NotImplementedError('wavefunction for k != Gamma does not produce correct wavefunctions!')
 
-    # Check that input/grid makes sense.
-    # If the coefficients are complex valued, then the grid *has* to be
-    # complex valued.
-    # Likewise if a k-point has been passed.
-    is_complex = np.iscomplexobj(v) or has_k
-    if is_complex and not np.iscomplexobj(grid.grid):
-        raise SislError("wavefunction input coefficients are complex, while grid only contains real.")
-
-    if is_complex:
-        psi_init = _a.zerosz
+def _wavefunction_k(k):
+    """ Return k-point and whether it is different from Gamma """
+    if k is None:
+        k = _a.zerosd(3)
     else:
-        psi_init = _a.zerosd
-
-    # Extract sub variables used throughout the loop
-    shape = _a.asarrayi(grid.shape)
-    dcell = grid.dcell
-    ic = grid.sc.icell * shape.reshape(1, -1)
-    geom_shape = dot(ic, geometry.cell.T).T
-
-    # In the following we don't care about division
-    # So 1) save error state, 2) turn off divide by 0, 3) calculate, 4) turn on old error state
-    old_err = np.seterr(divide='ignore', invalid='ignore')
-
-    addouter = add.outer
-    def idx2spherical(ix, iy, iz, offset, dc, R):
-        """ Calculate the spherical coordinates from indices """
-        rx = addouter(addouter(ix * dc[0, 0], iy * dc[1, 0]), iz * dc[2, 0] - offset[0]).ravel()
-        ry = addouter(addouter(ix * dc[0, 1], iy * dc[1, 1]), iz * dc[2, 1] - offset[1]).ravel()
-        rz = addouter(addouter(ix * dc[0, 2], iy * dc[1, 2]), iz * dc[2, 2] - offset[2]).ravel()
-        # Total size of the indices
-        n = rx.shape[0]
-        # Reduce our arrays to where the radius is "fine"
-        idx = indices_le(rx ** 2 + ry ** 2 + rz ** 2, R ** 2)
-        rx = rx[idx]
-        ry = ry[idx]
-        rz = rz[idx]
-        xyz_to_spherical_cos_phi(rx, ry, rz)
-        return n, idx, rx, ry, rz
-
-    # Figure out the max-min indices with a spacing of 1 radian
-    rad1 = pi / 180
-    theta, phi = ogrid[-pi:pi:rad1, 0:pi:rad1]
-    cphi, sphi = cos(phi), sin(phi)
-    ctheta_sphi = cos(theta) * sphi
-    stheta_sphi = sin(theta) * sphi
-    del sphi
-    nrxyz = (theta.size, phi.size, 3)
-    del theta, phi, rad1
-
-    # First we calculate the min/max indices for all atoms
-    idx_mm = _a.emptyi([geometry.na, 2, 3])
-    rxyz = _a.emptyd(nrxyz)
-    rxyz[..., 0] = ctheta_sphi
-    rxyz[..., 1] = stheta_sphi
-    rxyz[..., 2] = cphi
-    # Reshape
-    rxyz.shape = (-1, 3)
-    idx = dot(ic, rxyz.T)
-    idxm = idx.min(1).reshape(1, 3)
-    idxM = idx.max(1).reshape(1, 3)
-    del ctheta_sphi, stheta_sphi, cphi, idx, rxyz, nrxyz
-
-    origo = grid.sc.origo.reshape(1, -1)
-    for atom, ia in geometry.atom.iter(True):
-        if len(ia) == 0:
-            continue
-        R = atom.maxR()
-
-        # Now do it for all the atoms to get indices of the middle of
-        # the atoms
-        # The coordinates are relative to origo, so we need to shift (when writing a grid
-        # it is with respect to origo)
-        xyz = geometry.xyz[ia, :] - origo
-        idx = dot(ic, xyz.T).T
-
-        # Get min-max for all atoms
-        idx_mm[ia, 0, :] = idxm * R + idx
-        idx_mm[ia, 1, :] = idxM * R + idx
-
-    # Now we have min-max for all atoms
-    # When we run the below loop all indices can be retrieved by looking
-    # up in the above table.
-
-    # Before continuing, we can easily clean up the temporary arrays
-    del origo, idx
-
-    aranged = _a.aranged
+        k = _a.asarrayd(k).ravel()
+    return k, (k ** 2).sum() ** 0.5 > 0.000001
+
 
+def _wavefunction_atoms(grid, geometry):
+    """ All atoms (and their supercell offsets) with orbitals reaching into `grid`
+
+    Returns the atomic indices, coordinates with respect to the grid origo and supercell offsets.
+    """
     # In case this grid does not have a Geometry associated
     # We can *perhaps* easily attach a geometry with the given
     # atoms in the unit-cell
@@ -506,120 +531,39 @@ def wavefunction(v, grid, geometry=None, k=None, spinor=0, spin=None, eta=False)
     # Retrieve all atoms within the grid supercell
     # (and the neighbours that connect into the cell)
     IA, XYZ, ISC = geometry.within_inf(sc)
+    return IA, XYZ - grid.origo.reshape(1, 3), ISC
 
-    r_k = dot(geometry.rcell, k)
-    r_k_cell = dot(r_k, geometry.cell)
-    phase = 1
 
-    # Retrieve progressbar
-    eta = tqdm_eta(len(IA), 'wavefunction', 'atom', eta)
+def _wavefunction_add(v, psi, grid, geometry, k, atoms, eta):
+    """ Add the wavefunctions of the states `v` (``(n, no)``) to the flattened grids `psi` (``(n, grid.size)``) """
+    IA, XYZ, ISC = atoms
+
+    # Bloch phases of the supercell images (cell vector gauge, as used for the
+    # matrices at k)
+    r_k_cell = dot(dot(geometry.rcell, k), geometry.cell)
+    if np.allclose(r_k_cell, 0.):
+        phases = np.ones(len(IA))
+    else:
+        phases = np.exp(-1j * dot(ISC, r_k_cell))
 
     # Loop over all atoms in the grid-cell
-    for ia, xyz, isc in zip(IA, XYZ - grid.origo.reshape(1, 3), ISC):
+    for ia, xyz, phase in zip(IA, XYZ, phases):
         # Get current atom
         atom = geometry.atom[ia]
 
-        # Extract maximum R
-        R = atom.maxR()
-        if R <= 0.:
-            warn("Atom '{}' does not have a wave-function, skipping atom.".format(atom))
-            eta.update()
-            continue
-
-        # Get indices in the supercell grid
-        idx = (isc.reshape(3, 1) * geom_shape).sum(0)
-        idxm = floor(idx_mm[ia, 0, :] + idx).astype(int32)
-        idxM = ceil(idx_mm[ia, 1, :] + idx).astype(int32) + 1
-
-        # Fast check whether we can skip this point
-        if idxm[0] >= shape[0] or idxm[1] >= shape[1] or idxm[2] >= shape[2] or \
-           idxM[0] <= 0 or idxM[1] <= 0 or idxM[2] <= 0:
-            eta.update()
-            continue
-
-        # Truncate values
-        if idxm[0] < 0:
-            idxm[0] = 0
-        if idxM[0] > shape[0]:
-            idxM[0] = shape[0]
-        if idxm[1] < 0:
-            idxm[1] = 0
-        if idxM[1] > shape[1]:
-            idxM[1] = shape[1]
-        if idxm[2] < 0:
-            idxm[2] = 0
-        if idxM[2] > shape[2]:
-            idxM[2] = shape[2]
-
-        # Now idxm/M contains min/max indices used
-        # Convert to spherical coordinates
-        n, idx, r, theta, phi = idx2spherical(aranged(idxm[0], idxM[0]),
-                                              aranged(idxm[1], idxM[1]),
-                                              aranged(idxm[2], idxM[2]), xyz, dcell, R)
-
-        # Get initial orbital
-        io = geometry.a2o(ia)
-
-        if has_k:
-            phase = np.exp(-1j * (dot(r_k_cell, isc)))
-            # TODO
-            # Possibly the phase should be an additional
-            # array for the position in the unit-cell!
-            #   + np.exp(-1j * dot(r_k, spher2cart(r, theta, np.arccos(phi)).T) )
-
-        # Allocate a temporary array where we add the psi elements
-        psi = psi_init(n)
-
-        # Loop on orbitals on this atom, grouped by radius
-        for os in atom.iter(True):
-
-            # Get the radius of orbitals (os)
-            oR = os[0].R
-
-            if oR <= 0.:
-                warn("Orbital(s) '{}' does not have a wave-function, skipping orbital!".format(os))
-                # Skip these orbitals
-                io += len(os)
-                continue
-
-            # Downsize to the correct indices
-            if R - oR < 1e-6:
-                idx1 = idx.view()
-                r1 = r.view()
-                theta1 = theta.view()
-                phi1 = phi.view()
+        # Get the orbital values on the grid (only inside the grid)
+        idx, opsi = orbital_values(atom, grid, xyz)
+        if len(idx) > 0:
+            # Add the current atom contribution to the wavefunctions
+            io = geometry.a2o(ia)
+            if len(psi) == 1:
+                psi[0, idx] += dot(v[0, io:io + atom.no] * phase, opsi)
             else:
-                idx1 = indices_le(r, oR)
-                # Reduce arrays
-                r1 = r[idx1]
-                theta1 = theta[idx1]
-                phi1 = phi[idx1]
-                idx1 = idx[idx1]
-
-            # Loop orbitals with the same radius
-            for o in os:
-                # Evaluate psi component of the wavefunction and add it for this atom
-                psi[idx1] += o.psi_spher(r1, theta1, phi1, cos_phi=True) * (v[io] * phase)
-                io += 1
-
-        # Clean-up
-        del idx1, r1, theta1, phi1, idx, r, theta, phi
-
-        # Convert to correct shape and add the current atom contribution to the wavefunction
-        psi.shape = idxM - idxm
-        grid.grid[idxm[0]:idxM[0], idxm[1]:idxM[1], idxm[2]:idxM[2]] += psi
-
-        # Clean-up
-        del psi
+                psi[:, idx] += dot(v[:, io:io + atom.no] * phase, opsi)
 
         # Step progressbar
         eta.update()
 
-    eta.close()
-
-    # Reset the error code for division
-    np.seterr(**old_err)
-
 
 class _common_State(object):
     __slots__ = []
@@ -742,6 +686,32 @@ class _common_State(object):
         wavefunction(self.state, grid, geometry=geometry, k=k, spinor=spinor,
                      spin=spin, eta=eta)
 
+    def iter_wavefunction(self, grid, spinor=0, batch=None, eta=False):
+        r""" Iterate the wavefunction of each state on a new grid with the same shape as `grid`
+
+        The Bloch phases of the k-point (if any) are applied for each supercell image.
+
+        See `sisl.physics.electron.iter_wavefunction` for argument details.
+        """
+        try:
+            spin = self.parent.spin
+        except:
+            spin = None
+
+        if isinstance(self.parent, Geometry):
+            geometry = self.parent
+        else:
+            try:
+                geometry = self.parent.geometry
+            except:
+                geometry = None
+
+        # Retrieve k
+        k = self.info.get('k', _a.zerosd(3))
+
+        return iter_wavefunction(self.state, grid, geometry=geometry, k=k, spinor=spinor,
+                                 spin=spin, batch=batch, eta=eta)
+
     # TODO to be deprecated
     psi = wavefunction
 
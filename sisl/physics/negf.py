@@ -0,0 +1,353 @@
+r""" Non-equilibrium Green function transport calculations
+
+The Green function of a device region coupled to semi-infinite electrodes is
+calculated with the block-tridiagonal (BTD) recursive Green function algorithm.
+The device region is pivoted into a block-tridiagonal matrix, i.e. orbitals in
+block :math:`i` only couple to orbitals in blocks :math:`i-1`, :math:`i` and :math:`i+1`.
+The required blocks of the Green function are then calculated by inverting
+the diagonal blocks only, which scales as :math:`\mathcal O(N_b b^3)` for :math:`N_b` blocks of size :math:`b`
+as opposed to :math:`\mathcal O(N^3)` for the dense inversion.
+"""
+from __future__ import print_function, division
+
+from numbers import Integral
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from numpy import dot, conjugate
+
+import sisl._array as _a
+from sisl._help import num_threads
+from sisl.linalg import inv
+
+
+__all__ = ['NEGF']
+
+
+def _diag_dot(a, b):
+    """ Diagonal of ``dot(a, b)`` """
+    return (a * b.T).sum(1)
+
+
+class NEGF(object):
+    r""" Block-tridiagonal recursive Green function transport calculations of a device region
+
+    The device Green function is
+
+    .. math::
+        \mathbf G(E, \mathbf k) = \big[(E + i\eta)\mathbf S(\mathbf k) - \mathbf H(\mathbf k)
+              - \sum_e \boldsymbol\Sigma_e(E, \mathbf k)\big]^{-1}
+
+    where the self-energies :math:`\boldsymbol\Sigma_e` of the electrodes are added to
+    the orbitals of the electrode atoms in the device region.
+
+    Parameters
+    ----------
+    H : Hamiltonian
+       the Hamiltonian of the full system (device and electrode atoms), it must not have
+       any couplings along the semi-infinite directions.
+    elecs : list of tuple
+       the electrodes, each as ``(name, self_energy, atoms)`` or ``(name, self_energy, atoms, mu, kT)``.
+       `self_energy` is a `SelfEnergy` object (e.g. `RecursiveSI`) whose orbitals correspond to
+       the orbitals of `atoms` in `H`. `mu` and `kT` are the chemical potential and
+       electronic temperature (in eV) of the electrode (only used for writing to files), they default
+       to 0 and 300 K.
+    pivot : array_like, optional
+       the orbitals of the device region in the order of the calculation, defaults to all orbitals.
+       All electrode orbitals must be in the device region. See `Hamiltonian.pivot`.
+    btd : array_like, optional
+       the block sizes of the block-tridiagonal partitioning of the pivoted device region,
+       defaults to a single block. The orbitals of each electrode must be in a single block.
+       See `Hamiltonian.btd`.
+    eta : float, optional
+       the imaginary part of the energy of the device Green function
+    spin : int, optional
+       the spin-component for polarized Hamiltonians
+
+    Examples
+    --------
+    >>> left = RecursiveSI(H_elec, '-A') # doctest: +SKIP
+    >>> right = RecursiveSI(H_elec, '+A') # doctest: +SKIP
+    >>> negf = NEGF(H, [('Left', left, [0]), ('Right', right, [H.na - 1])], btd=[10] * 10) # doctest: +SKIP
+    >>> T = negf.transmission(np.linspace(-1, 1, 100)) # doctest: +SKIP
+    """
+
+    def __init__(self, H, elecs, pivot=None, btd=None, eta=1e-4, spin=0):
+        self.H = H
+        self.eta = eta
+        if H.spin.is_polarized:
+            self._Pk_kwargs = {'spin': spin}
+        elif H.spin.is_unpolarized:
+            self._Pk_kwargs = {}
+        else:
+            raise ValueError(self.__class__.__name__ + ' only implements unpolarized and polarized Hamiltonians.')
+
+        if pivot is None:
+            pivot = _a.arangei(H.no)
+        self.pivot = _a.asarrayi(pivot).ravel()
+        if len(np.unique(self.pivot)) != len(self.pivot):
+            raise ValueError(self.__class__.__name__ + ' pivot contains repeated orbitals.')
+        if btd is None:
+            btd = [len(self.pivot)]
+        self.btd = _a.asarrayi(btd).ravel()
+        if self.btd.sum() != len(self.pivot) or np.any(self.btd <= 0):
+            raise ValueError(self.__class__.__name__ + ' btd block sizes does not sum to the number of device orbitals.')
+        self._btd_ptr = np.insert(_a.cumsumi(self.btd), 0, 0)
+
+        # Position of all orbitals in the pivoted device region
+        ipvt = _a.fulli(H.no, -1)
+        ipvt[self.pivot] = _a.arangei(len(self.pivot))
+
+        self.elecs = []
+        self._elec_se = []
+        self._elec_block = []
+        self._elec_idx = []
+        self.mu = []
+        self.kT = []
+        for elec in elecs:
+            name, se, atoms = elec[:3]
+            mu = 0.
+            kT = 0.025852
+            if len(elec) > 3:
+                mu = elec[3]
+            if len(elec) > 4:
+                kT = elec[4]
+            p = ipvt[H.geometry.a2o(atoms, all=True)]
+            if np.any(p < 0):
+                raise ValueError(self.__class__.__name__ + ' electrode ' + name + ' has orbitals outside the device region.')
+            block = np.searchsorted(self._btd_ptr, p, side='right') - 1
+            if np.any(block != block[0]):
+                raise ValueError(self.__class__.__name__ + ' electrode ' + name + ' spans several BTD blocks.')
+            self.elecs.append(name)
+            self._elec_se.append(se)
+            self._elec_block.append(block[0])
+            self._elec_idx.append(p - self._btd_ptr[block[0]])
+            self.mu.append(mu)
+            self.kT.append(kT)
+
+    def __len__(self):
+        """ Number of orbitals in the device region """
+        return len(self.pivot)
+
+    def _elec(self, elec):
+        """ Index of the electrode `elec` (name or index) """
+        if isinstance(elec, Integral):
+            return elec
+        return self.elecs.index(elec)
+
+    def _blocks(self, M):
+        """ Diagonal, upper and lower blocks of the pivoted sparse matrix `M` """
+        ptr = self._btd_ptr
+        n = len(self.btd)
+        M = M.tocsr()[self.pivot, :][:, self.pivot].tocsr()
+        rows = [M[ptr[i]:ptr[i+1], :].tocsc() for i in range(n)]
+        diag = [rows[i][:, ptr[i]:ptr[i+1]].toarray() for i in range(n)]
+        up = [rows[i][:, ptr[i+1]:ptr[i+2]].toarray() for i in range(n - 1)]
+        down = [rows[i+1][:, ptr[i]:ptr[i+1]].toarray() for i in range(n - 1)]
+        return diag, up, down
+
+    def _green(self, E, k, S=False):
+        """ Recursive Green function blocks at a single energy and k-point
+
+        Returns
+        -------
+        A : list of (diagonal, upper, lower) blocks of the inverse Green function
+        gL, gR : left and right connected Green functions
+        G : diagonal blocks of the Green function
+        gamma : scattering matrices of the electrodes
+        S : (diagonal, upper, lower) blocks of the overlap matrix (only if `S` is true)
+        """
+        H = self.H
+        k = _a.arrayd(k)
+        Z = E + 1j * self.eta
+        Sk = H.Sk(k, dtype=np.complex128)
+        A, Aup, Adown = self._blocks(Sk * Z - H.Hk(k, dtype=np.complex128, **self._Pk_kwargs))
+
+        # Add the self-energies
+        gamma = []
+        for se, b, idx in zip(self._elec_se, self._elec_block, self._elec_idx):
+            SE = se.self_energy(E, k)
+            A[b][idx.reshape(-1, 1), idx.reshape(1, -1)] -= SE
+            gamma.append(1j * (SE - conjugate(SE.T)))
+
+        n = len(A)
+        # Left and right connected Green functions
+        SL = [None] * n
+        SR = [None] * n
+        gL = [None] * n
+        gR = [None] * n
+        gL[0] = inv(A[0])
+        for i in range(1, n):
+            SL[i] = dot(Adown[i-1], dot(gL[i-1], Aup[i-1]))
+            gL[i] = inv(A[i] - SL[i])
+        gR[n-1] = inv(A[n-1])
+        for i in range(n - 2, -1, -1):
+            SR[i] = dot(Aup[i], dot(gR[i+1], Adown[i]))
+            gR[i] = inv(A[i] - SR[i])
+
+        # Diagonal blocks of the Green function
+        G = [None] * n
+        G[0] = gR[0]
+        G[n-1] = gL[n-1]
+        for i in range(1, n - 1):
+            G[i] = inv(A[i] - SL[i] - SR[i])
+
+        if S:
+            return (A, Aup, Adown), gL, gR, G, gamma, self._blocks(Sk)
+        return (A, Aup, Adown), gL, gR, G, gamma
+
+    def _solve(self, E, k):
+        """ Transmissions, DOS and spectral DOS at a single energy and k-point
+
+        Returns
+        -------
+        T : numpy.ndarray
+           ``(nelec, nelec)`` transmissions from electrode `i` to electrode `j`
+        DOS : numpy.ndarray
+           DOS of the pivoted device orbitals
+        ADOS : numpy.ndarray
+           ``(nelec, len(self))`` spectral DOS of the pivoted device orbitals
+        """
+        (A, Aup, Adown), gL, gR, G, gamma, (S, Sup, Sdown) = self._green(E, k, S=True)
+        n = len(A)
+
+        # First off-diagonal blocks of the Green function, G[i, i+1] and G[i+1, i]
+        Gup = [- dot(gL[i], dot(Aup[i], G[i+1])) for i in range(n - 1)]
+        Gdown = [- dot(gR[i+1], dot(Adown[i], G[i])) for i in range(n - 1)]
+
+        # DOS from the Green function (G - G^dagger) S
+        DOS = []
+        for i in range(n):
+            D = _diag_dot(G[i] - conjugate(G[i].T), S[i])
+            if i > 0:
+                D += _diag_dot(Gdown[i-1] - conjugate(Gup[i-1].T), Sup[i-1])
+            if i < n - 1:
+                D += _diag_dot(Gup[i] - conjugate(Gdown[i].T), Sdown[i])
+            DOS.append(D)
+        DOS = - np.concatenate(DOS).imag / (2 * np.pi)
+
+        nelec = len(self.elecs)
+        T = _a.zerosd([nelec, nelec])
+        ADOS = _a.emptyd([nelec, len(self)])
+        for ie in range(nelec):
+            Gc = self._column(ie, G, gL, gR, Aup, Adown)
+            # Spectral function blocks A[i, j] = Gc[i] Gamma Gc[j]^dagger
+            GG = [dot(g, gamma[ie]) for g in Gc]
+            D = []
+            for i in range(n):
+                d = _diag_dot(dot(GG[i], conjugate(Gc[i].T)), S[i])
+                if i > 0:
+                    d += _diag_dot(dot(GG[i], conjugate(Gc[i-1].T)), Sup[i-1])
+                if i < n - 1:
+                    d += _diag_dot(dot(GG[i], conjugate(Gc[i+1].T)), Sdown[i])
+                D.append(d)
+            ADOS[ie, :] = np.concatenate(D).real / (2 * np.pi)
+
+            for je in range(nelec):
+                if ie == je:
+                    continue
+                X = Gc[self._elec_block[je]][self._elec_idx[je], :]
+                T[ie, je] = np.trace(dot(dot(gamma[je], X), dot(gamma[ie], conjugate(X.T)))).real
+
+        return T, DOS, ADOS
+
+    def _column(self, ie, G, gL, gR, Aup, Adown):
+        """ Blocks of the Green function columns of electrode `ie` """
+        b = self._elec_block[ie]
+        n = len(G)
+        Gc = [None] * n
+        Gc[b] = G[b][:, self._elec_idx[ie]]
+        for i in range(b - 1, -1, -1):
+            Gc[i] = - dot(gL[i], dot(Aup[i], Gc[i+1]))
+        for i in range(b + 1, n):
+            Gc[i] = - dot(gR[i], dot(Adown[i-1], Gc[i-1]))
+        return Gc
+
+    def calculate(self, E, k=(0, 0, 0), workers=None):
+        r""" Transmissions, DOS and spectral DOS for all energies (and k-points)
+
+        The energies and k-points are calculated in parallel.
+
+        Parameters
+        ----------
+        E : float or array_like
+           the energies (in eV)
+        k : array_like, optional
+           the k-point, or a list of k-points (in reduced coordinates)
+        workers : int, optional
+           number of threads, defaults to `sisl._help.num_threads`
+
+        Returns
+        -------
+        T : numpy.ndarray
+           ``[nk, ]nE, nelec, nelec`` transmissions, ``T[..., i, j]`` is from electrode `i` to `j`
+        DOS : numpy.ndarray
+           ``[nk, ]nE, len(self)`` DOS (in 1/eV) of the device orbitals (in pivoted order)
+        ADOS : numpy.ndarray
+           ``[nk, ]nE, nelec, len(self)`` spectral DOS (in 1/eV) of the electrodes
+           for the device orbitals (in pivoted order)
+        """
+        E = _a.asarrayd(E)
+        k = _a.asarrayd(k)
+        shape = k.shape[:-1] + E.shape
+        k = k.reshape(-1, 3)
+        E = E.ravel()
+        tasks = [(e, kk) for kk in k for e in E]
+
+        def solve(task):
+            return self._solve(*task)
+
+        if workers is None:
+            workers = num_threads()
+        if workers > 1 and len(tasks) > 1:
+            pool = ThreadPool(min(workers, len(tasks)))
+            try:
+                out = pool.map(solve, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            out = list(map(solve, tasks))
+
+        nelec = len(self.elecs)
+        T = np.array([o[0] for o in out]).reshape(shape + (nelec, nelec))
+        DOS = np.array([o[1] for o in out]).reshape(shape + (len(self), ))
+        ADOS = np.array([o[2] for o in out]).reshape(shape + (nelec, len(self)))
+        return T, DOS, ADOS
+
+    def transmission(self, E, k=(0, 0, 0), elec_from=0, elec_to=1, workers=None):
+        """ Transmission from `elec_from` to `elec_to`, see `calculate` for details """
+        T = self.calculate(E, k, workers)[0]
+        return T[..., self._elec(elec_from), self._elec(elec_to)]
+
+    def DOS(self, E, k=(0, 0, 0), workers=None):
+        """ DOS of the device orbitals (in pivoted order), see `calculate` for details """
+        return self.calculate(E, k, workers)[1]
+
+    def ADOS(self, E, k=(0, 0, 0), elec=0, workers=None):
+        """ Spectral DOS of electrode `elec` on the device orbitals (in pivoted order), see `calculate` for details """
+        return self.calculate(E, k, workers)[2][..., self._elec(elec), :]
+
+    def spectral(self, E, k=(0, 0, 0), elec=0):
+        r""" Spectral function :math:`\mathbf A_e = \mathbf G\boldsymbol\Gamma_e\mathbf G^\dagger` of the device region
+
+        Only the Green function columns of the electrode orbitals are calculated,
+        however the returned matrix is dense.
+
+        Parameters
+        ----------
+        E : float
+           the energy (in eV)
+        k : array_like, optional
+           the k-point
+        elec : str or int, optional
+           the electrode
+
+        Returns
+        -------
+        numpy.ndarray : the spectral function of the device region (in pivoted order)
+        """
+        ie = self._elec(elec)
+        (A, Aup, Adown), gL, gR, G, gamma = self._green(E, k)
+        Gc = np.concatenate(self._column(ie, G, gL, gR, Aup, Adown))
+        return dot(dot(Gc, gamma[ie]), conjugate(Gc.T))
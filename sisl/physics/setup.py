@@ -4,6 +4,10 @@ from __future__ import print_function, division
 def configuration(parent_package='', top_path=None):
     from numpy.distutils.misc_util import Configuration
     config = Configuration('physics', parent_package, top_path)
+
+    # Add Cython extensions
+    config.add_extension('_density', sources=['_density.c'])
+
     config.add_data_dir('tests')
     config.make_config_py()
     return config
@@ -140,6 +140,27 @@ class TestDensityMatrix(object):
         grid = Grid(0.2, geometry=setup.D.geom)
         D.density(grid, eta=True)
 
+    def test_rho_threads(self, setup, monkeypatch):
+        D = setup.D.copy()
+        D.construct(setup.func)
+        grid1 = Grid(0.2, geometry=setup.D.geom)
+        monkeypatch.setenv('SISL_NUM_THREADS', '1')
+        D.density(grid1)
+        grid3 = Grid(0.2, geometry=setup.D.geom)
+        monkeypatch.setenv('SISL_NUM_THREADS', '3')
+        D.density(grid3)
+        assert grid1.grid.sum() > 0.
+        assert np.allclose(grid1.grid, grid3.grid)
+
+    def test_rho_dtype(self, setup):
+        D = setup.D.copy()
+        D.construct(setup.func)
+        grid = Grid(0.2, geometry=setup.D.geom)
+        D.density(grid)
+        grid32 = Grid(0.2, geometry=setup.D.geom, dtype=np.float32)
+        D.density(grid32)
+        assert np.allclose(grid.grid, grid32.grid, atol=1e-5)
+
     def test_rho_smaller_grid1(self, setup):
         D = setup.D.copy()
         D.construct(setup.func)
@@ -922,6 +922,31 @@ class TestHamiltonian(object):
         assert np.allclose(H._csr._D, Hbig._csr._D)
         setup.H2.empty()
 
+    def test_tile_multi(self, setup):
+        def func(self, ia, idxs, idxs_xyz=None):
+            idx = self.geom.close(ia, R=[0.1, 1.43], idx=idxs)
+            io = self.geom.a2o(ia)
+            # Set on-site on first and second orbital
+            odx = self.geom.a2o(idx[0])
+            self[io, odx] = -1.
+            self[io+1, odx+1] = 1.
+
+            # Set connecting (different number of elements per orbital)
+            odx = self.geom.a2o(idx[1])
+            self[io, odx] = 0.2
+            self[io, odx+1] = 0.01
+            self[io+1, odx+1] = 0.3
+
+        setup.H2.construct(func)
+        Hbig = setup.H2.tile(3, 0).tile(2, 1)
+        H = setup.H2.tile((3, 2, 1))
+        assert H.geom == Hbig.geom
+        assert H.spsame(Hbig)
+        H.finalize()
+        Hbig.finalize()
+        assert np.allclose(H._csr._D, Hbig._csr._D)
+        setup.H2.empty()
+
     @pytest.mark.slow
     def test_repeat1(self, setup):
         R, param = [0.1, 1.5], [1., 0.1]
@@ -1007,6 +1032,34 @@ class TestHamiltonian(object):
         assert np.allclose(H._csr._D, Hbig._csr._D)
         setup.H2.empty()
 
+    def test_repeat_multi(self, setup):
+        def func(self, ia, idxs, idxs_xyz=None):
+            idx = self.geom.close(ia, R=[0.1, 1.43], idx=idxs)
+            io = self.geom.a2o(ia)
+            # Set on-site on first and second orbital
+            odx = self.geom.a2o(idx[0])
+            self[io, odx] = -1.
+            self[io+1, odx+1] = 1.
+
+            # Set connecting (different number of elements per orbital)
+            odx = self.geom.a2o(idx[1])
+            self[io, odx] = 0.2
+            self[io, odx+1] = 0.01
+            self[io+1, odx+1] = 0.3
+
+        setup.H2.construct(func)
+        Hbig = setup.H2.repeat((3, 2, 1))
+
+        gbig = setup.H2.geom.repeat(3, 0).repeat(2, 1)
+        H = Hamiltonian(gbig)
+        H.construct(func)
+
+        assert H.spsame(Hbig)
+        H.finalize()
+        Hbig.finalize()
+        assert np.allclose(H._csr._D, Hbig._csr._D)
+        setup.H2.empty()
+
     def test_sub1(self, setup):
         R, param = [0.1, 1.5], [1., 0.1]
 
@@ -1183,3 +1236,47 @@ def test_psi_eta():
     grid = Grid(0.1, dtype=np.complex128, sc=SuperCell([2, 2, 2], origo=[-1] * 3))
     grid.fill(0.)
     ES.sub(0).psi(grid, eta=True)
+
+
+def test_psi_iter():
+    N = 50
+    r = np.linspace(0, 2, N)
+    o1 = SphericalOrbital(0, (r, np.exp(-r) * (2 - r)))
+    G = Geometry([[1] * 3, [2] * 3], Atom(6, o1), sc=[4, 4, 4])
+    H = Hamiltonian(G)
+    R, param = [0.1, 1.5], [1., 0.1]
+    H.construct([R, param])
+    ES = H.eigenstate(dtype=np.float64)
+    grid = Grid(0.2, geometry=H.geom)
+    grids = list(ES.iter_wavefunction(grid, batch=1))
+    assert len(grids) == len(ES)
+    for i, g in enumerate(ES.iter_wavefunction(grid)):
+        ref = Grid(0.2, geometry=H.geom)
+        ES.sub(i).wavefunction(ref)
+        assert g.shape == ref.shape
+        assert np.allclose(g.grid, ref.grid)
+        assert np.allclose(grids[i].grid, ref.grid)
+    # the template is not touched
+    assert np.allclose(grid.grid, 0.)
+
+
+def test_psi_iter_k():
+    N = 50
+    r = np.linspace(0, 2, N)
+    o1 = SphericalOrbital(0, (r, np.exp(-r) * (2 - r)))
+    G = Geometry([[1] * 3, [2] * 3], Atom(6, o1), sc=SuperCell([4, 4, 4], nsc=[3, 3, 3]))
+    H = Hamiltonian(G)
+    R, param = [0.1, 1.5], [1., 0.1]
+    H.construct([R, param])
+    k = [0.25, 0, 0]
+    ES = H.eigenstate(k)
+    # Plot in two cells along the first lattice vector
+    grid = Grid([40, 20, 20], dtype=np.complex128, sc=SuperCell([8, 4, 4]))
+    for i, g in enumerate(ES.iter_wavefunction(grid, batch=1)):
+        # Bloch's theorem (with the phase convention of the cell vector gauge)
+        phase = np.exp(-2j * np.pi * k[0])
+        assert np.allclose(g.grid[20:], g.grid[:20] * phase)
+        assert np.abs(g.grid).max() > 0.
+        ref = grid.copy()
+        ES.sub(i).wavefunction(ref)
+        assert np.allclose(g.grid, ref.grid)
@@ -0,0 +1,125 @@
+from __future__ import print_function, division
+
+import pytest
+
+import numpy as np
+
+from sisl import Geometry, Atom, SuperCell, Hamiltonian, RecursiveSI
+from sisl.physics.negf import NEGF
+
+
+pytestmark = pytest.mark.negf
+
+
+def _chain(n, nsc, orthogonal=True):
+    g = Geometry([[i, 0, 0] for i in range(n)], Atom(1, R=1.1),
+                 sc=SuperCell([n, 10, 10], nsc=nsc))
+    H = Hamiltonian(g, orthogonal=orthogonal)
+    if orthogonal:
+        H.construct([[0.1, 1.1], [0., -1.]])
+    else:
+        H.construct([[0.1, 1.1], [(0., 1.), (-1., 0.1)]])
+    return H
+
+
+@pytest.fixture
+def setup():
+    class t():
+        def __init__(self):
+            self.He = _chain(1, [3, 1, 1])
+            self.H = _chain(10, [1, 1, 1])
+            self.L = RecursiveSI(self.He, '-A')
+            self.R = RecursiveSI(self.He, '+A')
+            self.elecs = [('Left', self.L, [0]), ('Right', self.R, [9])]
+    return t()
+
+
+def _dense(H, elecs, E, eta=1e-4):
+    # Dense reference Green function
+    S = H.Sk(format='array')
+    A = (E + 1j * eta) * S - H.Hk(format='array')
+    Gam = []
+    for _, se, atoms in elecs:
+        o = H.geometry.a2o(atoms, all=True)
+        SE = se.self_energy(E)
+        A[o.reshape(-1, 1), o.reshape(1, -1)] -= SE
+        g = np.zeros_like(A)
+        g[o.reshape(-1, 1), o.reshape(1, -1)] = 1j * (SE - SE.conj().T)
+        Gam.append(g)
+    G = np.linalg.inv(A)
+    return G, S, Gam
+
+
+def test_negf_chain(setup):
+    negf = NEGF(setup.H, setup.elecs, btd=[2, 3, 3, 2])
+    assert len(negf) == 10
+    E = np.linspace(-1.5, 1.5, 5)
+    T, DOS, ADOS = negf.calculate(E, workers=2)
+    assert T.shape == (5, 2, 2)
+    assert DOS.shape == (5, 10)
+    assert ADOS.shape == (5, 2, 10)
+    # Perfect chain
+    assert np.allclose(T[1:-1, 0, 1], 1., atol=1e-2)
+    assert np.allclose(T[:, 0, 1], T[:, 1, 0])
+    for e, dos, ados in zip(E, DOS, ADOS):
+        G, S, Gam = _dense(setup.H, setup.elecs, e)
+        assert np.allclose(dos, -(G.dot(S)).diagonal().imag / np.pi)
+        A = G.dot(Gam[0]).dot(G.conj().T)
+        assert np.allclose(ados[0], (A.dot(S)).diagonal().real / (2 * np.pi))
+        assert np.allclose(negf.spectral(e, elec=0), A)
+
+
+def test_negf_btd_equal(setup):
+    E = np.linspace(-1, 1, 3)
+    T1, DOS1, ADOS1 = NEGF(setup.H, setup.elecs).calculate(E)
+    T2, DOS2, ADOS2 = NEGF(setup.H, setup.elecs, btd=[1] * 10).calculate(E)
+    assert np.allclose(T1, T2)
+    assert np.allclose(DOS1, DOS2)
+    assert np.allclose(ADOS1, ADOS2)
+
+
+def test_negf_pivot(setup):
+    # Reversing the pivot table does not change the results (except the order)
+    E = np.linspace(-1, 1, 3)
+    pivot = np.arange(10)[::-1]
+    T1, DOS1, ADOS1 = NEGF(setup.H, setup.elecs, btd=[5, 5]).calculate(E)
+    T2, DOS2, ADOS2 = NEGF(setup.H, setup.elecs, pivot=pivot, btd=[5, 5]).calculate(E)
+    assert np.allclose(T1, T2)
+    assert np.allclose(DOS1, DOS2[:, ::-1])
+    assert np.allclose(ADOS1, ADOS2[:, :, ::-1])
+
+
+def test_negf_non_orthogonal_k():
+    def square(n, nsc):
+        g = Geometry([[i, 0, 0] for i in range(n)], Atom(1, R=1.15),
+                     sc=SuperCell([n, 1.1, 10], nsc=nsc))
+        H = Hamiltonian(g, orthogonal=False)
+        H.construct([[0.1, 1.15], [(0., 1.), (-1., 0.1)]])
+        return H
+    He = square(1, [3, 3, 1])
+    H = square(6, [1, 3, 1])
+    elecs = [('Left', RecursiveSI(He, '-A'), [0]), ('Right', RecursiveSI(He, '+A'), [5])]
+    negf = NEGF(H, elecs, btd=[2, 2, 2])
+    k = [0, 0.25, 0]
+    E = np.linspace(-0.5, 0.5, 3)
+    T, DOS, ADOS = negf.calculate(E, k=[k, [0] * 3])
+    assert T.shape == (2, 3, 2, 2)
+    for ie, e in enumerate(E):
+        S = H.Sk(k=k, format='array')
+        A = (e + 1e-4j) * S - H.Hk(k=k, format='array')
+        SL = elecs[0][1].self_energy(e, k=k)
+        SR = elecs[1][1].self_energy(e, k=k)
+        A[0, 0] -= SL[0, 0]
+        A[5, 5] -= SR[0, 0]
+        G = np.linalg.inv(A)
+        assert np.allclose(DOS[0, ie], -(G.dot(S)).diagonal().imag / np.pi)
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_negf_btd_fail(setup):
+    NEGF(setup.H, setup.elecs, btd=[2, 3, 3])
+
+
+@pytest.mark.xfail(raises=ValueError)
+def test_negf_elec_block_fail(setup):
+    NEGF(setup.H, [('Left', setup.L, [0, 1])], btd=[1, 9])
@@ -0,0 +1,98 @@
+from __future__ import print_function, division
+
+import pytest
+
+import numpy as np
+
+from sisl import Geometry, Atom, SphericalOrbital, SuperCell
+from sisl import Grid
+from sisl.physics.electron import wavefunction
+from sisl.physics._orbital_grid import OrbitalGridCache, orbital_values
+
+
+@pytest.fixture
+def setup():
+    class t():
+        def __init__(self):
+            r = np.linspace(0, 1.6, 50)
+            orb = SphericalOrbital(1, (r, r * (1.6 - r)))
+            self.atom = Atom(6, orb.toAtomicOrbital())
+            self.g = Geometry([[1.] * 3, [2.5] * 3], self.atom,
+                              sc=SuperCell(4., nsc=[3, 3, 3]))
+    return t()
+
+
+def test_orbital_values(setup):
+    atom = setup.atom
+    grid = Grid(0.2, geometry=setup.g)
+    xyz = setup.g.xyz[1]
+    idx, psi = orbital_values(atom, grid, xyz, cache=OrbitalGridCache(0))
+    assert psi.shape == (atom.no, len(idx))
+    assert np.all(np.diff(idx) > 0)
+    ixyz = np.array(np.unravel_index(idx, grid.shape)).T
+    r = ixyz.dot(grid.dcell) - xyz
+    for io, o in enumerate(atom.orbital):
+        assert np.allclose(psi[io], o.psi(r))
+
+
+def test_orbital_values_outside(setup):
+    # Only points inside the grid are returned
+    atom = setup.atom
+    grid = Grid(0.2, geometry=setup.g)
+    idx, psi = orbital_values(atom, grid, setup.g.xyz[0] - 1.5)
+    assert len(idx) > 0
+    assert idx.min() >= 0
+    assert idx.max() < grid.grid.size
+
+
+def test_cache_hits(setup):
+    cache = OrbitalGridCache()
+    grid = Grid(0.2, geometry=setup.g)
+    xyz = setup.g.xyz[1]
+    idx1, psi1 = orbital_values(setup.atom, grid, xyz - 0.5, cache=cache)
+    assert cache.misses == 1
+    assert cache.hits == 0
+    # Same sub-grid offset, shifted by whole grid points
+    idx2, psi2 = orbital_values(setup.atom, grid, xyz - [0.3, 0.7, 0.3], cache=cache)
+    assert cache.misses == 1
+    assert cache.hits == 1
+    assert len(cache) == 1
+    # The atoms are placed away from the grid edges
+    assert np.allclose(psi1, psi2)
+    assert np.all(idx2 - idx1 == idx2[0] - idx1[0])
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_cache_lru(setup):
+    grid = Grid(0.2, geometry=setup.g)
+    xyz = setup.g.xyz[1]
+    cache = OrbitalGridCache()
+    orbital_values(setup.atom, grid, xyz, cache=cache)
+    nbytes = cache.nbytes
+    # Room for two stencils (of slightly varying size)
+    cache = OrbitalGridCache(int(nbytes * 2.5))
+    orbital_values(setup.atom, grid, xyz, cache=cache)
+    orbital_values(setup.atom, grid, xyz + 0.05, cache=cache)
+    orbital_values(setup.atom, grid, xyz, cache=cache)
+    assert cache.hits == 1
+    orbital_values(setup.atom, grid, xyz + 0.07, cache=cache)
+    assert len(cache) == 2
+    assert cache.nbytes <= cache.max_bytes
+    # xyz + 0.05 was least recently used
+    orbital_values(setup.atom, grid, xyz, cache=cache)
+    assert cache.hits == 2
+    orbital_values(setup.atom, grid, xyz + 0.05, cache=cache)
+    assert cache.hits == 2
+
+
+def test_cache_wavefunction(setup):
+    np.random.seed(1)
+    v = np.random.rand(setup.g.no)
+    grid1 = Grid(0.2, geometry=setup.g)
+    wavefunction(v, grid1, geometry=setup.g)
+    grid2 = Grid(0.2, geometry=setup.g)
+    wavefunction(v, grid2, geometry=setup.g)
+    assert np.allclose(grid1.grid, grid2.grid)
+    assert np.abs(grid1.grid).max() > 0.
@@ -2,6 +2,7 @@ from __future__ import print_function, division
 
 from numbers import Integral
 from collections import Iterable
+from hashlib import sha1
 
 # To speed up the extension algorithm we limit
 # the lookup table
@@ -103,6 +104,14 @@ class SparseCSR(object):
     finalized: boolean
        whether the sparse matrix is finalized and non-set elements
        are removed
+
+    Notes
+    -----
+    The sparsity pattern carries an identity token (which survives `copy`) and a cached
+    fingerprint of ``ptr``, ``ncol`` and ``col``. Element-wise arithmetic between
+    matrices with the same pattern operates directly on the data without aligning the
+    sparsity patterns. Any in-place changes of ``ptr``, ``ncol`` or ``col`` from outside
+    this class should be followed by a re-assignment of the array (or `_pattern_changed`).
     """
 
     def __init__(self, arg1, dim=1, dtype=None, nnzpr=20, nnz=None,
@@ -224,6 +233,78 @@ class SparseCSR(object):
         # Denote that this sparsity pattern hasn't been finalized
         self._finalized = False
 
+    @property
+    def ptr(self):
+        """ Pointer index in the 1D column indices of the corresponding row """
+        return self._ptr
+
+    @ptr.setter
+    def ptr(self, ptr):
+        self._ptr = ptr
+        self._pattern_changed()
+
+    @property
+    def ncol(self):
+        """ Number of entries per row """
+        return self._ncol
+
+    @ncol.setter
+    def ncol(self, ncol):
+        self._ncol = ncol
+        self._pattern_changed()
+
+    @property
+    def col(self):
+        """ Column indices of the sparse elements """
+        return self._col
+
+    @col.setter
+    def col(self, col):
+        self._col = col
+        self._pattern_changed()
+
+    def _pattern_changed(self):
+        """ Signal that the sparsity pattern has changed
+
+        This creates a new identity token and removes the cached fingerprint.
+        """
+        self._pattern_id = object()
+        self._pattern_hash = None
+
+    def _pattern_fingerprint(self):
+        """ Fingerprint of the sparsity pattern (including the layout of the data)
+
+        The fingerprint is cached until the sparsity pattern changes.
+        """
+        if self._pattern_hash is None:
+            if self.finalized:
+                col = self.col
+            else:
+                col = self.col[array_arange(self.ptr[:-1], n=self.ncol)]
+            h = sha1(np.array(self.shape[:2] + (self.nnz, len(self.col)), np.int64))
+            for a in (self.ptr, self.ncol, col):
+                h.update(np.ascontiguousarray(a, dtype=np.int32))
+            self._pattern_hash = h.digest()
+        return self._pattern_hash
+
+    def _pattern_same(self, other):
+        """ Whether `other` has the same sparsity pattern *and* data layout as this object
+
+        If ``True`` element-wise operations may be performed directly on the data arrays.
+        """
+        if self._pattern_id is other._pattern_id:
+            return True
+        if self.shape[:2] != other.shape[:2] or self.nnz != other.nnz or \
+           len(self.col) != len(other.col):
+            return False
+        return self._pattern_fingerprint() == other._pattern_fingerprint()
+
+    def _pattern_data(self):
+        """ Indices (or slice) of the used elements in the data array """
+        if self.finalized:
+            return slice(None)
+        return array_arange(self.ptr[:-1], n=self.ncol)
+
     def diags(self, diagonals, offsets=0, dim=None, dtype=None):
         """ Create a `SparseCSR` with diagonal elements with the same shape as the routine
 
@@ -285,6 +366,7 @@ class SparseCSR(object):
             self._nnz = 0
             # We do not mess with the other arrays
             # they may be obscure data any-way.
+            self._pattern_changed()
 
     @property
     def shape(self):
@@ -389,6 +471,7 @@ class SparseCSR(object):
 
         # Signal that we indeed have finalized the data
         self._finalized = sort
+        self._pattern_changed()
 
     def edges(self, row, exclude=None):
         """ Retrieve edges (connections) of a given `row` or list of `row`'s
@@ -496,6 +579,7 @@ class SparseCSR(object):
 
         # Update number of non-zeroes
         self._nnz = np.sum(ncol)
+        self._pattern_changed()
 
         if not keep_shape:
             shape = list(self.shape)
@@ -533,6 +617,7 @@ class SparseCSR(object):
 
         # Update number of non-zeroes
         self._nnz = np.sum(ncol)
+        self._pattern_changed()
 
         # We are *only* deleting columns, so if it is finalized,
         # it will still be
@@ -573,6 +658,7 @@ class SparseCSR(object):
 
         # After translation, set to not finalized
         self._finalized = False
+        self._pattern_changed()
         if end_clean:
             self._clean_columns()
 
@@ -589,6 +675,8 @@ class SparseCSR(object):
         """
         if self.shape[:2] != other.shape[:2]:
             return False
+        if self._pattern_same(other):
+            return True
 
         sptr = self.ptr.view()
         sncol = self.ncol.view()
@@ -625,6 +713,9 @@ class SparseCSR(object):
 
         if self.shape[:2] != other.shape[:2]:
             raise ValueError('Aligning two sparse matrices requires same shapes')
+        if self._pattern_same(other):
+            # Already aligned
+            return
 
         lsetdiff1d = setdiff1d
         sptr = self.ptr.view()
@@ -794,6 +885,9 @@ class SparseCSR(object):
             # Step the number of non-zero elements
             self._nnz += new_n
 
+        if new_n > 0 or new_nnz > 0:
+            self._pattern_changed()
+
         # Now we have extended the sparse matrix to hold all
         # information that is required...
 
@@ -876,6 +970,7 @@ class SparseCSR(object):
         # finalized...
         self._finalized = False
         self._nnz -= len(index)
+        self._pattern_changed()
 
     def __getitem__(self, key):
         """ Intrinsic sparse matrix retrieval of a non-zero element """
@@ -1075,6 +1170,9 @@ class SparseCSR(object):
 
         # Mark it as the same state as the other one
         new._finalized = self._finalized
+        # and share the sparsity pattern identity
+        new._pattern_id = self._pattern_id
+        new._pattern_hash = self._pattern_hash
 
         return new
 
@@ -1252,6 +1350,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('Adding two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] += other._D[idx, :]
+                return self
+
             # Ensure that a is aligned with b
             self.align(other)
 
@@ -1287,6 +1391,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('Subtracting two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] -= other._D[idx, :]
+                return self
+
             # Ensure that a is aligned with b
             self.align(other)
 
@@ -1315,6 +1425,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('Multiplication of two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] *= other._D[idx, :]
+                return self
+
 
             # Note that for multiplication of these two matrices
             # it is not required that they are aligned...
@@ -1361,6 +1477,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('Division of two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] /= other._D[idx, :]
+                return self
+
 
             # Ensure that a is aligned with b
             self.align(other)
@@ -1388,6 +1510,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('Floor-division of two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] //= other._D[idx, :]
+                return self
+
             # Ensure that a is aligned with b
             self.align(other)
 
@@ -1414,6 +1542,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('True-division of two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] /= other._D[idx, :]
+                return self
+
             # Ensure that a is aligned with b
             self.align(other)
 
@@ -1447,6 +1581,12 @@ class SparseCSR(object):
         if isinstance(other, SparseCSR):
             if self.shape != other.shape:
                 raise ValueError('True-division of two sparse matrices requires the same shape')
+            if self._pattern_same(other):
+                # Same sparsity pattern, operate directly on the data
+                idx = self._pattern_data()
+                self._D[idx, :] **= other._D[idx, :]
+                return self
+
             # Ensure that a is aligned with b
             # 0 ** float == 1.
             self.align(other)
@@ -1,8 +1,9 @@
 from __future__ import print_function, division
 
 import warnings
-import functools as ftool
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, reverse_cuthill_mckee
 
 import sisl._array as _a
 from .messages import warn, SislError, SislWarning, tqdm_eta
@@ -10,10 +11,56 @@ from ._help import get_dtype
 from ._help import _zip as zip, _range as range, _map as map
 from .utils.ranges import array_arange
 from .sparse import SparseCSR
+from .supercell import _reps_per_axis
 
 __all__ = ['SparseAtom', 'SparseOrbital']
 
 
+def _replicate_isc(isc, reps, irep, isc_off, tile):
+    """ Replication and supercell indices of sparse elements when tiling/repeating a sparse geometry
+
+    Parameters
+    ----------
+    isc : numpy.ndarray
+        supercell offsets (``(nnz, 3)``) of the columns of the original sparse elements
+    reps : numpy.ndarray
+        number of replications along each lattice vector
+    irep : numpy.ndarray
+        the (linear) replication indices of the rows
+    isc_off : numpy.ndarray
+        supercell offset to supercell index look-up table of the resulting sparse object
+    tile : bool
+        whether the linear replication index has the first lattice vector running fastest
+        (`Geometry.tile`) or the last lattice vector running fastest (`Geometry.repeat`)
+
+    Returns
+    -------
+    B : numpy.ndarray
+        the linear replication index (``(len(irep), nnz)``) of the columns
+    S : numpy.ndarray
+        the supercell index (``(len(irep), nnz)``) of the columns
+    """
+    if tile:
+        axes = (2, 1, 0)
+    else:
+        axes = (0, 1, 2)
+    r = np.unravel_index(irep, reps[list(axes)])
+    B = 0
+    I = [None] * 3
+    for i, ax in enumerate(axes):
+        C = isc[:, ax].reshape(1, -1) + r[i].reshape(-1, 1)
+        I[ax] = C // reps[ax]
+        B = B * reps[ax] + C % reps[ax]
+    return B, isc_off[I[0], I[1], I[2]]
+
+
+def _replicate_chunks(nrep, nnz):
+    """ Chunks of replications used to limit the size of temporary arrays """
+    step = max(1, 2 ** 20 // max(nnz, 1))
+    for i in range(0, nrep, step):
+        yield _a.arangei(i, min(i + step, nrep))
+
+
 class _SparseGeometry(object):
     """ Sparse object containing sparse elements for a given geometry.
 
@@ -1043,7 +1090,7 @@ class SparseAtom(_SparseGeometry):
 
         return S
 
-    def tile(self, reps, axis):
+    def tile(self, reps, axis=None):
         """ Create a tiled sparse atom object, equivalent to `Geometry.tile`
 
         The already existing sparse elements are extrapolated
@@ -1056,9 +1103,11 @@ class SparseAtom(_SparseGeometry):
 
         Parameters
         ----------
-        reps : int
-            number of repetitions along cell-vector `axis`
-        axis : int
+        reps : int or array_like of int
+            number of repetitions along cell-vector `axis`.
+            If `axis` is ``None`` this should be the repetitions along all 3 cell-vectors
+            which are then performed without creating intermediate sparse objects.
+        axis : int, optional
             0, 1, 2 according to the cell-direction
 
         See Also
@@ -1067,8 +1116,11 @@ class SparseAtom(_SparseGeometry):
         Geometry.repeat: a different ordering of the final geometry
         repeat: a different ordering of the final geometry
         """
+        reps = _reps_per_axis(reps, axis)
+        ntile = reps.prod()
+
         # Create the new sparse object
-        g = self.geometry.tile(reps, axis)
+        g = self.geometry.tile(reps)
         S = self.__class__(g, self.dim, self.dtype, 1, **self._cls_kwargs())
 
         # Now begin to populate it accordingly
@@ -1091,43 +1143,38 @@ class SparseAtom(_SparseGeometry):
         na_n = S.na
         geom_n = S.geom
 
-        # First loop on axis tiling and local
-        # atoms in the geometry
-        sc_index = geom_n.sc_index
+        # Look-up table for the supercell indices
+        isc_off = geom_n.sc.isc_off
 
         # Create new indptr, indices and D
-        ncol = np.tile(ncol, reps)
+        ncol = np.tile(ncol, ntile)
         # Now indptr is complete
         indptr = np.insert(_a.cumsumi(ncol), 0, 0)
         del ncol
         indices = _a.emptyi([indptr[-1]])
-        indices.shape = (reps, -1)
+        indices.shape = (ntile, -1)
 
         # Now we should fill the data
         isc = geom.a2isc(col)
-        # resulting atom in the new geometry (without wrapping
-        # for correct supercell, that will happen below)
-        JA = col % na + na * isc[:, axis] - na
+        # resulting atom in the new geometry (without the tile offset)
+        JA = col % na
 
-        # Create repetitions
-        for rep in range(reps):
-            # Figure out the JA atoms
-            JA += na
-            # Correct the supercell information
-            isc[:, axis] = JA // na_n
-
-            indices[rep, :] = JA % na_n + sc_index(isc) * na_n
+        # Create repetitions (in chunks of tiles)
+        for rep in _replicate_chunks(ntile, len(col)):
+            # Tile and supercell index of the connected atoms
+            T, IS = _replicate_isc(isc, reps, rep, isc_off, True)
+            indices[rep, :] = JA + na * T + IS * na_n
 
         # Clean-up
-        del isc, JA
+        del isc, JA, T, IS
 
         indices.shape = (-1,)
-        S._csr = SparseCSR((np.tile(D, (reps, 1)), indices, indptr),
+        S._csr = SparseCSR((np.tile(D, (ntile, 1)), indices, indptr),
                            shape=(geom_n.na, geom_n.na_s))
 
         return S
 
-    def repeat(self, reps, axis):
+    def repeat(self, reps, axis=None):
         """ Create a repeated sparse atom object, equivalent to `Geometry.repeat`
 
         The already existing sparse elements are extrapolated
@@ -1135,9 +1182,11 @@ class SparseAtom(_SparseGeometry):
 
         Parameters
         ----------
-        reps : int
-            number of repetitions along cell-vector `axis`
-        axis : int
+        reps : int or array_like of int
+            number of repetitions along cell-vector `axis`.
+            If `axis` is ``None`` this should be the repetitions along all 3 cell-vectors
+            which are then performed without creating intermediate sparse objects.
+        axis : int, optional
             0, 1, 2 according to the cell-direction
 
         See Also
@@ -1146,8 +1195,11 @@ class SparseAtom(_SparseGeometry):
         Geometry.tile: a different ordering of the final geometry
         tile: a different ordering of the final geometry
         """
+        reps = _reps_per_axis(reps, axis)
+        nrep = reps.prod()
+
         # Create the new sparse object
-        g = self.geometry.repeat(reps, axis)
+        g = self.geometry.repeat(reps)
         S = self.__class__(g, self.dim, self.dtype, 1, **self._cls_kwargs())
 
         # Now begin to populate it accordingly
@@ -1170,47 +1222,39 @@ class SparseAtom(_SparseGeometry):
         na_n = S.na
         geom_n = S.geom
 
-        # First loop on axis tiling and local
-        # atoms in the geometry
-        sc_index = geom_n.sc_index
+        # Look-up table for the supercell indices
+        isc_off = geom_n.sc.isc_off
 
         # Create new indptr, indices and D
-        ncol = np.repeat(ncol, reps)
-        # Now indptr is complete
-        indptr = np.insert(_a.cumsumi(ncol), 0, 0)
-        del ncol
+        indptr = np.insert(_a.cumsumi(np.repeat(ncol, nrep)), 0, 0)
         indices = _a.emptyi([indptr[-1]])
 
+        # Each atom row is repeated (consecutively) `nrep` times.
+        # Position of the first repetition of each element in the new indices
+        # and the element offset between each repetition.
+        ptr = _a.cumsumi(ncol) - ncol
+        nidx = np.repeat(ncol, ncol)
+        pidx = _a.arangei(len(col)) + np.repeat(ptr * (nrep - 1), ncol)
+        del ptr
+
         # Now we should fill the data
         isc = geom.a2isc(col)
         # resulting atom in the new geometry (without wrapping
         # for correct supercell, that will happen below)
-        JA = (col % na) * reps
-        # Get the offset atoms
-        A = isc[:, axis] - 1
-
-        for rep in range(reps):
+        JA = (col % na) * nrep
 
-            # Update the offset
-            A += 1
-            # Correct supercell information
-            isc[:, axis] = A // reps
-
-            # Create the indices for the repetition
-            idx = array_arange(indptr[rep:-1:reps], n=self._csr.ncol)
-            indices[idx] = JA + A % reps + sc_index(isc) * na_n
+        D_n = np.empty([indptr[-1], D.shape[1]], dtype=D.dtype)
+        # Create repetitions (in chunks of repetitions)
+        for rep in _replicate_chunks(nrep, len(col)):
+            # Repetition and supercell index of the connected atoms
+            R, IS = _replicate_isc(isc, reps, rep, isc_off, False)
+            idx = pidx + rep.reshape(-1, 1) * nidx
+            indices[idx] = JA + R + IS * na_n
+            D_n[idx, :] = D
 
         # Clean-up
-        del isc, JA, A, idx
-
-        # In the repeat we have to tile individual atomic couplings
-        # So we should split the arrays and tile them individually
-        # Now D is made up of D values, per atom
-        if geom.na == 1:
-            D = np.tile(D, (reps, 1))
-        else:
-            ntile = ftool.partial(np.tile, reps=(reps, 1))
-            D = np.vstack(map(ntile, np.split(D, _a.cumsumi(self._csr.ncol[:-1]), axis=0)))
+        del isc, JA, R, IS, idx, pidx, nidx
+        D = D_n
 
         S._csr = SparseCSR((D, indices, indptr),
                            shape=(geom_n.na, geom_n.na_s))
@@ -1337,6 +1381,213 @@ class SparseOrbital(_SparseGeometry):
             for i, j in self._csr.iter_nnz():
                 yield i, j
 
+    def _orbital_graph(self, orbital, n=None):
+        """ Symmetric connectivity graph of `orbital` with supercell connections folded into the unit-cell
+
+        Vertex ``i`` of the graph is ``orbital[i]``, couplings to orbitals not in `orbital` are discarded.
+
+        Parameters
+        ----------
+        orbital : array_like of int
+           the (unique) orbitals of the graph
+        n : int, optional
+           number of vertices in the graph, defaults to ``len(orbital)``. Additional
+           vertices have no connections.
+        """
+        csr = self._csr
+        no = self.no
+        orbital = _a.asarrayi(orbital).ravel()
+        if n is None:
+            n = len(orbital)
+        ncol = csr.ncol[orbital]
+        col = csr.col[array_arange(csr.ptr[orbital], n=ncol)] % no
+        row = np.repeat(_a.arangei(len(orbital)), ncol)
+
+        # Convert to graph vertices
+        vertex = _a.fulli(no, -1)
+        vertex[orbital] = _a.arangei(len(orbital))
+        col = vertex[col]
+        idx = (col >= 0).nonzero()[0]
+        row = row[idx]
+        col = col[idx]
+        del idx
+        g = csr_matrix((np.ones(len(row), dtype=np.int8), (row, col)), shape=(n, n))
+        return (g + g.T).tocsr()
+
+    def pivot(self, atom=None, elec=None):
+        """ Bandwidth-reducing pivoting table of the orbitals on `atom`
+
+        Without electrodes the reverse Cuthill-McKee ordering is used.
+        With electrodes the orbitals are ordered by a breadth-first search starting from
+        all the orbitals of the first electrode, i.e. orbitals are sorted by their
+        graph distance to the first electrode.
+        Supercell connections are folded into the unit-cell.
+
+        The returned pivoting table is equivalent to `~sisl.io.tbtrans._devncSileTBtrans.pivot`.
+
+        Parameters
+        ----------
+        atom : array_like of int, optional
+           the atoms in the device region, defaults to all atoms
+        elec : list of array_like, optional
+           atoms of each electrode, the search starts from the first electrode
+
+        Returns
+        -------
+        numpy.ndarray
+           orbital indices of the device region in the pivoted order
+
+        See Also
+        --------
+        btd : block-tridiagonal partitioning of the pivoted orbitals
+        """
+        geom = self.geometry
+        if atom is None:
+            orbital = _a.arangei(geom.no)
+        else:
+            orbital = np.unique(geom.a2o(atom, all=True)).astype(np.int32)
+        n = len(orbital)
+
+        if elec is None or len(elec) == 0:
+            return orbital[reverse_cuthill_mckee(self._orbital_graph(orbital), symmetric_mode=True)]
+
+        # The first electrode orbitals in the device
+        vertex = _a.fulli(geom.no, -1)
+        vertex[orbital] = _a.arangei(n)
+        start = vertex[geom.a2o(elec[0], all=True)]
+        if np.any(start < 0):
+            raise ValueError(self.__class__.__name__ + '.pivot requires the electrode atoms to be in the device region.')
+
+        # An additional vertex connected to the electrode orbitals makes the search
+        # start from all electrode orbitals simultaneously
+        g = self._orbital_graph(orbital, n + 1)
+        g = g + csr_matrix((np.ones(len(start), dtype=np.int8), (_a.fulli(len(start), n), np.sort(start))),
+                           shape=(n + 1, n + 1))
+        pvt = breadth_first_order(g, n, directed=True, return_predecessors=False)[1:]
+
+        if len(pvt) < n:
+            # Disconnected orbitals are appended
+            rest = np.setdiff1d(_a.arangei(n), pvt)
+            g = self._orbital_graph(orbital[rest])
+            pvt = np.concatenate((pvt, rest[reverse_cuthill_mckee(g, symmetric_mode=True)]))
+        return orbital[pvt]
+
+    def btd(self, pivot=None, elec=None):
+        r""" Block-tridiagonal partitioning of the pivoted orbitals
+
+        The block sizes :math:`b_i` are chosen to minimize :math:`\sum_i b_i^3` (the cost of
+        the block-tridiagonal inversion) under the constraint that the orbitals in
+        block :math:`i` only couple to orbitals in blocks :math:`i-1`, :math:`i` and :math:`i+1`.
+        The orbitals of each electrode are kept in a single block.
+
+        The partitioning is found by dynamic programming over the possible block
+        boundaries. For large devices (more than 10000 orbitals) the block boundaries are restricted
+        to every ``len(pivot) // 10000`` orbital and the boundaries of the smallest possible blocks
+        (merged to at least ``len(pivot) // 10000`` orbitals), hence the blocks of quasi one-dimensional
+        devices are then larger than strictly required.
+
+        The returned block sizes are equivalent to `~sisl.io.tbtrans._devncSileTBtrans.btd`.
+
+        Parameters
+        ----------
+        pivot : array_like of int, optional
+           orbitals of the device region in the pivoted order, defaults to ``self.pivot(elec=elec)``
+        elec : list of array_like, optional
+           atoms of each electrode
+
+        Returns
+        -------
+        numpy.ndarray
+           the block sizes, ``btd.sum() == len(pivot)``
+
+        See Also
+        --------
+        pivot : bandwidth-reducing pivoting table
+        """
+        geom = self.geometry
+        if pivot is None:
+            pivot = self.pivot(elec=elec)
+        pivot = _a.asarrayi(pivot).ravel()
+        n = len(pivot)
+        if n == 0:
+            return _a.arrayi([])
+
+        # Ensure all rows are non-empty by adding the diagonal
+        g = self._orbital_graph(pivot)
+        g = (g + csr_matrix((np.ones(n, dtype=np.int8), (_a.arangei(n), _a.arangei(n))), shape=(n, n))).tocsr()
+        g.sort_indices()
+        # R[s] is the first pivot position not coupled to by any position before s.
+        # Hence a block starting at s has to end at R[s] or later.
+        R = _a.zerosi(n + 1)
+        R[1:] = np.maximum.accumulate(g.indices[g.indptr[1:] - 1] + 1)
+        del g
+
+        # Disallow boundaries inside the electrodes
+        allowed = np.ones(n + 1, dtype=np.bool_)
+        if elec is not None:
+            vertex = _a.fulli(geom.no, -1)
+            vertex[pivot] = _a.arangei(n)
+            for atom in elec:
+                p = vertex[geom.a2o(atom, all=True)]
+                if np.any(p < 0):
+                    raise ValueError(self.__class__.__name__ + '.btd requires the electrode atoms to be in the pivoting table.')
+                allowed[p.min() + 1:p.max() + 1] = False
+        idx_allowed = allowed.nonzero()[0]
+        # next allowed boundary
+        nxt = idx_allowed[np.searchsorted(idx_allowed, _a.arangei(n + 1))]
+
+        # The smallest possible blocks (a valid partitioning), i.e. the path from 0 of
+        # the (monotone) jump to the end of the smallest block starting at s.
+        # The path is calculated by repeated squaring of the jumps.
+        jump = _a.emptyi(n + 1)
+        jump[:n] = nxt[np.maximum(R[:n], _a.arangei(1, n + 1))]
+        jump[n] = n
+        t = _a.arangei(n + 1)
+        cuts = _a.zerosi(n + 1)
+        while t.any():
+            i = (t & 1).nonzero()[0]
+            cuts[i] = jump[cuts[i]]
+            t >>= 1
+            jump = jump[jump]
+        del jump, t
+        cuts = cuts[:np.searchsorted(cuts, n) + 1]
+
+        # Candidate block boundaries, for large devices the smallest blocks are merged
+        # to (at least) step orbitals which keeps the number of candidates below ~20000
+        step = max(1, n // 10000)
+        if step > 1:
+            cuts = cuts[np.concatenate(([True], np.diff(cuts // step) > 0))]
+            if cuts[-1] != n:
+                cuts = np.append(cuts, n)
+        W = 2 * np.diff(cuts).max()
+        C = np.union1d(cuts, _a.arangei(0, n + 1, step))
+        C = C[allowed[C]]
+        RC = R[C]
+        # Possible block starts for each end are the range [lo, hi)
+        lo = np.searchsorted(C, C - W)
+        hi = np.minimum(np.searchsorted(RC, C, side='right'), _a.arangei(len(C)))
+
+        cost = np.full(len(C), np.inf)
+        cost[0] = 0.
+        prev = _a.zerosi(len(C))
+        Cf = C.astype(np.float64)
+        for j in range(1, len(C)):
+            l, h = lo[j], hi[j]
+            if l >= h:
+                continue
+            c = cost[l:h] + (Cf[j] - Cf[l:h]) ** 3
+            i = c.argmin()
+            cost[j] = c[i]
+            prev[j] = l + i
+
+        # Back-track the boundaries
+        j = len(C) - 1
+        cuts = [C[j]]
+        while j > 0:
+            j = prev[j]
+            cuts.append(C[j])
+        return np.diff(_a.arrayi(cuts[::-1]))
+
     def set_nsc(self, *args, **kwargs):
         """ Reset the number of allowed supercells in the sparse orbital
 
@@ -1501,7 +1752,7 @@ class SparseOrbital(_SparseGeometry):
 
         return S
 
-    def tile(self, reps, axis):
+    def tile(self, reps, axis=None):
         """ Create a tiled sparse orbital object, equivalent to `Geometry.tile`
 
         The already existing sparse elements are extrapolated
@@ -1509,9 +1760,11 @@ class SparseOrbital(_SparseGeometry):
 
         Parameters
         ----------
-        reps : int
-            number of repetitions along cell-vector `axis`
-        axis : int
+        reps : int or array_like of int
+            number of repetitions along cell-vector `axis`.
+            If `axis` is ``None`` this should be the repetitions along all 3 cell-vectors
+            which are then performed without creating intermediate sparse objects.
+        axis : int, optional
             0, 1, 2 according to the cell-direction
 
         See Also
@@ -1520,8 +1773,11 @@ class SparseOrbital(_SparseGeometry):
         Geometry.repeat: a different ordering of the final geometry
         repeat: a different ordering of the final geometry
         """
+        reps = _reps_per_axis(reps, axis)
+        ntile = reps.prod()
+
         # Create the new sparse object
-        g = self.geometry.tile(reps, axis)
+        g = self.geometry.tile(reps)
         S = self.__class__(g, self.dim, self.dtype, 1, **self._cls_kwargs())
 
         # Now begin to populate it accordingly
@@ -1544,43 +1800,38 @@ class SparseOrbital(_SparseGeometry):
         no_n = S.no
         geom_n = S.geom
 
-        # First loop on axis tiling and local
-        # atoms in the geometry
-        sc_index = geom_n.sc_index
+        # Look-up table for the supercell indices
+        isc_off = geom_n.sc.isc_off
 
         # Create new indptr, indices and D
-        ncol = np.tile(ncol, reps)
+        ncol = np.tile(ncol, ntile)
         # Now indptr is complete
         indptr = np.insert(_a.cumsumi(ncol), 0, 0)
         del ncol
         indices = _a.emptyi([indptr[-1]])
-        indices.shape = (reps, -1)
+        indices.shape = (ntile, -1)
 
         # Now we should fill the data
         isc = geom.o2isc(col)
-        # resulting atom in the new geometry (without wrapping
-        # for correct supercell, that will happen below)
-        JO = col % no + no * isc[:, axis] - no
-
-        # Create repetitions
-        for rep in range(reps):
-            # Figure out the JO orbitals
-            JO += no
-            # Correct the supercell information
-            isc[:, axis] = JO // no_n
+        # resulting orbital in the new geometry (without the tile offset)
+        JO = col % no
 
-            indices[rep, :] = JO % no_n + sc_index(isc) * no_n
+        # Create repetitions (in chunks of tiles)
+        for rep in _replicate_chunks(ntile, len(col)):
+            # Tile and supercell index of the connected orbitals
+            T, IS = _replicate_isc(isc, reps, rep, isc_off, True)
+            indices[rep, :] = JO + no * T + IS * no_n
 
         # Clean-up
-        del isc, JO
+        del isc, JO, T, IS
 
         indices.shape = (-1,)
-        S._csr = SparseCSR((np.tile(D, (reps, 1)), indices, indptr),
+        S._csr = SparseCSR((np.tile(D, (ntile, 1)), indices, indptr),
                            shape=(geom_n.no, geom_n.no_s))
 
         return S
 
-    def repeat(self, reps, axis):
+    def repeat(self, reps, axis=None):
         """ Create a repeated sparse orbital object, equivalent to `Geometry.repeat`
 
         The already existing sparse elements are extrapolated
@@ -1588,9 +1839,11 @@ class SparseOrbital(_SparseGeometry):
 
         Parameters
         ----------
-        reps : int
-            number of repetitions along cell-vector `axis`
-        axis : int
+        reps : int or array_like of int
+            number of repetitions along cell-vector `axis`.
+            If `axis` is ``None`` this should be the repetitions along all 3 cell-vectors
+            which are then performed without creating intermediate sparse objects.
+        axis : int, optional
             0, 1, 2 according to the cell-direction
 
         See Also
@@ -1599,8 +1852,11 @@ class SparseOrbital(_SparseGeometry):
         Geometry.tile: a different ordering of the final geometry
         tile: a different ordering of the final geometry
         """
+        reps = _reps_per_axis(reps, axis)
+        nrep = reps.prod()
+
         # Create the new sparse object
-        g = self.geometry.repeat(reps, axis)
+        g = self.geometry.repeat(reps)
         S = self.__class__(g, self.dim, self.dtype, 1, **self._cls_kwargs())
 
         # Now begin to populate it accordingly
@@ -1623,16 +1879,28 @@ class SparseOrbital(_SparseGeometry):
         no_n = S.no
         geom_n = S.geom
 
-        # First loop on axis tiling and local
-        # orbitals in the geometry
-        sc_index = geom_n.sc_index
+        # Look-up table for the supercell indices
+        isc_off = geom_n.sc.isc_off
+
+        # The orbitals of each atom are tiled (in the order of the repetitions)
+        # while the atoms are repeated.
+        # `orb` is the originating orbital for each orbital in the new structure
+        orb = array_arange(np.repeat(geom.firsto[:geom.na], nrep), np.repeat(geom.lasto + 1, nrep))
 
         # Create new indptr, indices and D
-        ncol = np.repeat(ncol, reps)
-        # Now indptr is complete
-        indptr = np.insert(_a.cumsumi(ncol), 0, 0)
-        del ncol
+        indptr = np.insert(_a.cumsumi(ncol[orb]), 0, 0)
         indices = _a.emptyi([indptr[-1]])
+        del orb
+
+        # All elements of the orbitals on an atom are repeated (consecutively) `nrep` times.
+        # Position of the first repetition of each element in the new indices
+        # and the element offset between each repetition.
+        ptr = np.insert(_a.cumsumi(ncol), 0, 0)[geom.firsto]
+        ncol = np.diff(ptr)
+        ptr = ptr[:-1]
+        nidx = np.repeat(ncol, ncol)
+        pidx = _a.arangei(len(col)) + np.repeat(ptr * (nrep - 1), ncol)
+        del ptr, ncol
 
         # Now we should fill the data
         isc = geom.o2isc(col)
@@ -1641,55 +1909,27 @@ class SparseOrbital(_SparseGeometry):
         JO = col % no
         # Get number of orbitals per atom (lasto - firsto + 1)
         # This is faster than the direct call
-
         ja = geom.o2a(JO)
         oJ = geom.firsto[ja]
         oA = geom.lasto[ja] + 1 - oJ
         # Shift the orbitals corresponding to the
         # repetitions of all previous atoms
-        JO += oJ * (reps - 1)
-        # Get the offset orbitals
-        O = isc[:, axis] - 1
-        # We need to create and indexable atomic array
-        # This is required for multi-orbital cases where
-        # we should tile atomic orbitals, and repeat the atoms (only).
-        # 'A' is now the first (non-repeated) atom in the new structure
-        A = _a.arangei(geom.na) * reps
-        AO = geom_n.lasto[A] - geom_n.firsto[A] + 1
-        # subtract AO for first iteration in repetition loop
-        OA = geom_n.firsto[A] - AO
-
-        # Clean
-        del ja, oJ, A
-
-        # Get view of ncol
-        ncol = self._csr.ncol.view()
-
-        # Create repetitions
-        for _ in range(reps):
-
-            # Update atomic offset
-            OA += AO
-            # Update the offset
-            O += 1
-            # Correct supercell information
-            isc[:, axis] = O // reps
-
-            # Create the indices for the repetition
-            idx = array_arange(indptr[array_arange(OA, n=AO)], n=ncol)
-            indices[idx] = JO + oA * (O % reps) + sc_index(isc) * no_n
+        JO += oJ * (nrep - 1)
+        del ja, oJ
+
+        D_n = np.empty([indptr[-1], D.shape[1]], dtype=D.dtype)
+        # Create repetitions (in chunks of repetitions)
+        for rep in _replicate_chunks(nrep, len(col)):
+            # Repetition and supercell index of the connected orbitals
+            R, IS = _replicate_isc(isc, reps, rep, isc_off, False)
+            idx = pidx + rep.reshape(-1, 1) * nidx
+            indices[idx] = JO + oA * R + IS * no_n
+            D_n[idx, :] = D
 
         # Clean-up
-        del isc, JO, O, OA, AO, idx
+        del isc, JO, oA, R, IS, idx, pidx, nidx
+        D = D_n
 
-        # In the repeat we have to tile individual atomic couplings
-        # So we should split the arrays and tile them individually
-        # Now D is made up of D values, per atom
-        if geom.na == 1:
-            D = np.tile(D, (reps, 1))
-        else:
-            ntile = ftool.partial(np.tile, reps=(reps, 1))
-            D = np.vstack(map(ntile, np.split(D, _a.cumsumi(ncol)[geom.lasto[:geom.na-1]], axis=0)))
         S._csr = SparseCSR((D, indices, indptr),
                            shape=(geom_n.no, geom_n.no_s))
 
@@ -21,6 +21,36 @@ from ._supercell import cell_invert, cell_reciprocal
 __all__ = ['SuperCell', 'SuperCellChild']
 
 
+def _reps_per_axis(reps, axis=None):
+    """ Convert `reps` and `axis` arguments to the number of repetitions along each lattice vector
+
+    Parameters
+    ----------
+    reps : int or array_like of int
+        number of repetitions, if `axis` is ``None`` this should be one per lattice vector
+    axis : int or array_like of int, optional
+        lattice vector(s) along which the repetitions are performed
+
+    Returns
+    -------
+    numpy.ndarray
+        repetitions along all 3 lattice vectors (1 for lattice vectors not repeated)
+    """
+    if axis is None:
+        reps = _a.arrayi(reps).ravel()
+        if reps.size != 3:
+            raise ValueError('Repetitions without an axis requires one repetition per lattice vector')
+        if np.any(reps < 1):
+            raise ValueError('Repetitions must be above 0')
+        return reps
+    R = _a.onesi(3)
+    for r, ax in zip(np.atleast_1d(reps), np.atleast_1d(axis)):
+        if r < 1:
+            raise ValueError('Repetitions must be above 0')
+        R[ax] *= r
+    return R
+
+
 class SuperCell(object):
     r""" A cell class to retain lattice vectors and a supercell structure
 
@@ -607,7 +637,7 @@ class SuperCell(object):
         """
         return self.copy(self.cell * scale)
 
-    def tile(self, reps, axis):
+    def tile(self, reps, axis=None):
         """ Extend the unit-cell `reps` times along the `axis` lattice vector
 
         Notes
@@ -616,21 +646,23 @@ class SuperCell(object):
 
         Parameters
         ----------
-        reps : int
-            number of times the unit-cell is repeated along the specified lattice vector
-        axis : int
+        reps : int or array_like of int
+            number of times the unit-cell is repeated along the specified lattice vector.
+            If `axis` is ``None`` this should be the repetitions along all 3 lattice vectors.
+        axis : int, optional
             the lattice vector along which the repetition is performed
         """
         cell = np.copy(self.cell)
         nsc = np.copy(self.nsc)
         origo = np.copy(self.origo)
-        cell[axis, :] *= reps
-        # Only reduce the size if it is larger than 5
-        if nsc[axis] > 3 and reps > 1:
-            nsc[axis] = max(1, nsc[axis] // 2 - (reps - 1)) * 2 + 1
+        for axis, reps in enumerate(_reps_per_axis(reps, axis)):
+            cell[axis, :] *= reps
+            # Only reduce the size if it is larger than 5
+            if nsc[axis] > 3 and reps > 1:
+                nsc[axis] = max(1, nsc[axis] // 2 - (reps - 1)) * 2 + 1
         return self.__class__(cell, nsc=nsc, origo=origo)
 
-    def repeat(self, reps, axis):
+    def repeat(self, reps, axis=None):
         """ Extend the unit-cell `reps` times along the `axis` lattice vector
 
         Notes
@@ -639,9 +671,10 @@ class SuperCell(object):
 
         Parameters
         ----------
-        reps : int
-            number of times the unit-cell is repeated along the specified lattice vector
-        axis : int
+        reps : int or array_like of int
+            number of times the unit-cell is repeated along the specified lattice vector.
+            If `axis` is ``None`` this should be the repetitions along all 3 lattice vectors.
+        axis : int, optional
             the lattice vector along which the repetition is performed
         """
         return self.tile(reps, axis)
@@ -154,6 +154,15 @@ class TestGeometry(object):
         t = setup.g.tile(2, 0).tile(2, 2)
         assert np.allclose(t[:len(setup.g), :], setup.g.xyz)
 
+    def test_tile_multi(self, setup):
+        t = setup.g.tile(2, 0).tile(3, 1).tile(2, 2)
+        assert t == setup.g.tile((2, 3, 2))
+        assert t == setup.g.tile([2, 3], [0, 1]).tile(2, 2)
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_tile_multi0(self, setup):
+        t = setup.g.tile((2, 0, 1))
+
     @pytest.mark.xfail(raises=ValueError)
     def test_repeat0(self, setup):
         t = setup.g.repeat(0, 0)
@@ -211,6 +220,11 @@ class TestGeometry(object):
         t = setup.g.repeat(2, 0).repeat(2, 2)
         assert np.allclose(t.xyz[::4, :], setup.g.xyz)
 
+    def test_repeat_multi(self, setup):
+        t = setup.g.repeat(2, 0).repeat(3, 1).repeat(2, 2)
+        assert t == setup.g.repeat((2, 3, 2))
+        assert t == setup.g.repeat([2, 3], [0, 1]).repeat(2, 2)
+
     def test_a2o1(self, setup):
         assert 0 == setup.g.a2o(0)
         assert setup.g.atom[0].no == setup.g.a2o(1)
@@ -654,6 +668,29 @@ class TestGeometry(object):
         assert len(i[0]) == 1
         assert len(i[1]) == 3
 
+    def test_close_many1(self, setup):
+        g = setup.g.tile(3, 0).tile(2, 1)
+        for R in [0.1, 1.5, 3.]:
+            ptr, idx, xyz, rij = g.close_many(range(g.na), R, ret_xyz=True, ret_rij=True, chunk=7)
+            assert len(ptr) == g.na + 1
+            for ia in range(g.na):
+                i, x, d = g.close(ia, R, ret_xyz=True, ret_rij=True)
+                s = slice(ptr[ia], ptr[ia+1])
+                assert np.allclose(i, idx[s])
+                assert np.allclose(x, xyz[s])
+                assert np.allclose(d, rij[s])
+
+    def test_close_many2(self, setup):
+        g = setup.g.tile(3, 0).tile(2, 1)
+        xyz = np.random.rand(10, 3) * 4
+        ptr, idx = g.close_many(xyz, 2., idx=[0, 2, 4])
+        for i in range(len(xyz)):
+            assert np.allclose(g.close(xyz[i], 2., idx=[0, 2, 4]), idx[ptr[i]:ptr[i+1]])
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_close_many_fail(self, setup):
+        setup.g.close_many(range(2), R=(0.1, 1.5))
+
     def test_close_within1(self, setup):
         three = range(3)
         for ia in setup.mol:
@@ -872,6 +909,15 @@ class TestGeometry(object):
     def test_sparserij1(self, setup):
         rij = setup.g.sparserij()
 
+    def test_sparserij2(self, setup):
+        g = setup.g.tile(3, 0)
+        g.xyz += np.random.rand(*g.xyz.shape) * 0.05
+        rij = g.sparserij()
+        for ia in g:
+            idx, r = g.close(ia, R=(0.1, g.maxR()), ret_rij=True)
+            assert np.allclose(rij[ia, idx[1]], r[1])
+            assert rij._csr.ncol[ia] == len(idx[1])
+
     def test_bond_correct(self, setup):
         # Create ribbon
         rib = setup.g.tile(2, 1)
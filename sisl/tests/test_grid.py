@@ -8,7 +8,7 @@ from scipy.sparse import csr_matrix
 
 from sisl import SuperCell, SphericalOrbital, Atom, Geometry
 from sisl import Grid
-from sisl import Ellipsoid, Cuboid
+from sisl import Ellipsoid, Sphere, Cuboid, NullShape
 
 
 @pytest.fixture
@@ -59,6 +59,11 @@ class TestGrid(object):
     def test_dcell(self, setup):
         assert np.all(setup.g.dcell*setup.g.cell >= 0)
 
+    def test_dcell_shape(self):
+        g = Grid([10, 20, 30], sc=SuperCell([[1., 0.5, 0.], [0., 2., 0.], [0., 0.1, 3.]]))
+        assert np.allclose(g.dcell * np.array(g.shape).reshape(-1, 1), g.cell)
+        assert np.allclose(g.index2xyz([10, 20, 30]), g.cell.sum(0))
+
     def test_dvolume(self, setup):
         assert setup.g.dvolume > 0
 
@@ -118,6 +123,62 @@ class TestGrid(object):
         g /= setup.g
         assert np.allclose(g.grid, setup.g.grid)
 
+    def test_op_shared(self, setup):
+        g = Grid([10, 11, 12], geometry=Geometry([0] * 3, Atom(1), sc=2.))
+        g.grid = np.random.rand(*g.shape)
+        for r in [g + g, g - 1., g * g, g / 2., abs(g)]:
+            assert r.geometry is g.geometry
+            assert r.sc is g.sc
+            assert r.grid is not g.grid
+        assert (g * 1j).dtype == np.complex128
+        assert abs(g * 1j).dtype == np.float64
+
+    def test_apply(self, setup):
+        np.random.seed(2)
+        g1, g2, g3 = [Grid([10, 11, 12], sc=2.) for _ in range(3)]
+        for g in [g1, g2, g3]:
+            g.grid = np.random.rand(*g.shape)
+        # chunks of 3 planes
+        g1.chunk_bytes = 3 * 11 * 12 * 8
+        ref = 2 * g1.grid + 3 * g2.grid - g3.grid
+        g = g1.apply(lambda x, y, z: 2 * x + 3 * y - z, g2, g3)
+        assert np.allclose(g.grid, ref)
+        assert g.sc is g1.sc
+        g = g1.apply(np.multiply, 1j)
+        assert g.dtype == np.complex128
+        assert np.allclose(g.grid, g1.grid * 1j)
+
+        # in-place
+        out = g1.copy()
+        assert g1.apply(lambda x, y, z: 2 * x + 3 * y - z, g2, g3, out=out) is out
+        assert np.allclose(out.grid, ref)
+        assert out.apply(lambda x, y: x - y, g1, out=out) is out
+        assert np.allclose(out.grid, ref - g1.grid)
+
+    def test_apply_array(self, setup):
+        np.random.seed(3)
+        g = Grid([10, 11, 12], sc=2.)
+        g.grid = np.random.rand(*g.shape)
+        # chunks of 3 planes
+        g.chunk_bytes = 3 * 11 * 12 * 8
+        a = np.random.rand(*g.shape)
+        assert np.allclose((g + a).grid, g.grid + a)
+        assert np.allclose((g - a).grid, g.grid - a)
+        assert np.allclose((g * a).grid, g.grid * a)
+        assert np.allclose((g / a).grid, g.grid / a)
+        # Broadcasting arrays
+        b = np.random.rand(12)
+        assert np.allclose(g.apply(np.multiply, b).grid, g.grid * b)
+        assert np.allclose(g.apply(np.add, a[:1]).grid, g.grid + a[:1])
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_apply_fail(self, setup):
+        setup.g.apply(np.add, Grid(np.array(setup.g.shape) // 2 + 1))
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_apply_fail_kwargs(self, setup):
+        setup.g.apply(np.add, setup.g, output=setup.g)
+
     def test_swapaxes(self, setup):
         g = setup.g.swapaxes(0, 1)
         assert np.allclose(setup.g.cell[0, :], g.cell[1, :])
@@ -133,6 +194,58 @@ class TestGrid(object):
         # grid... Perhaps this is ok, but not good... :(
         assert np.allclose(setup.g.grid, g1.grid)
 
+    def _interp_func(self, shape):
+        x, y, z = np.meshgrid(*[np.arange(n) / n for n in shape], indexing='ij')
+        return np.cos(2 * np.pi * x) + np.sin(4 * np.pi * y) * np.cos(2 * np.pi * z)
+
+    def test_interp_fourier(self):
+        g = Grid([10, 11, 12], sc=2., dtype=np.complex128)
+        g.grid = self._interp_func(g.shape) * (1 + 0.5j)
+        for shape in [[20, 21, 25], [6, 7, 8], [10, 30, 5]]:
+            r = g.interp(shape, 'fourier')
+            assert r.dtype == np.complex128
+            assert np.allclose(r.grid, self._interp_func(shape) * (1 + 0.5j))
+        g.grid = g.grid.real.copy()
+        r = g.interp([20, 21, 25], 'fourier')
+        assert r.dtype == np.float64
+        assert np.allclose(r.grid, self._interp_func(r.shape))
+
+    def test_interp_fourier_nyquist(self):
+        g = Grid([1, 1, 16])
+        z = np.arange(16) / 16
+        g.grid[0, 0, :] = np.cos(8 * np.pi * z) + 0.5 * np.sin(2 * np.pi * z)
+        # down- and up-sample to the Nyquist frequency
+        r = g.interp([1, 1, 8], 'fourier')
+        assert np.allclose(r.grid.ravel(), g.grid.ravel()[::2])
+        assert np.allclose(r.interp([1, 1, 16], 'fourier').grid, g.grid)
+
+    def test_interp_methods(self):
+        geom = Geometry([0] * 3, Atom(1), sc=2.)
+        g = Grid([10, 11, 12], geometry=geom)
+        g.grid = self._interp_func(g.shape)
+        shape = [20, 22, 24]
+        ref = self._interp_func(shape)
+        for method, tol in [('nearest', 1.), ('linear', 0.3), ('cubic', 0.02)]:
+            r = g.interp(shape, method)
+            assert r.shape == tuple(shape)
+            # the original grid points are retained
+            assert np.allclose(r.grid[::2, ::2, ::2], g.grid)
+            assert np.abs(r.grid - ref).max() < tol
+            assert np.allclose(r.grid, g.interp(shape, method, workers=3).grid)
+        assert r.geometry == geom
+        assert np.allclose(r.cell, g.cell)
+
+    def test_interp_bc(self):
+        g = Grid([2, 1, 1])
+        g.grid[:, 0, 0] = [1., 2.]
+        assert np.allclose(g.interp([4, 1, 1]).grid.ravel(), [1., 1.5, 2., 1.5])
+        g.set_bc(a=Grid.DIRICHLET)
+        assert np.allclose(g.interp([4, 1, 1]).grid.ravel(), [1., 1.5, 2., 2.])
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_interp_fail(self, setup):
+        setup.g.interp([2, 2, 2], 'spline')
+
     def test_index_ndim1(self, setup):
         mid = np.array(setup.g.shape, np.int32) // 2 - 1
         v = [0.001, 0., 0.001]
@@ -208,6 +321,44 @@ class TestGrid(object):
             assert len(idx1) == len(idx0)
             assert np.all(idx0 == idx1 - idx.reshape(1, 3))
 
+    def _index_brute(self, g, shape):
+        idx = np.array(np.meshgrid(*[np.arange(-10, n + 10) for n in g.shape], indexing='ij')).reshape(3, -1).T
+        return idx[shape.within_index(g.index2xyz(idx))]
+
+    def test_index_shape_brute(self):
+        g = Grid([30, 25, 20], sc=SuperCell([3, 3, 3, 80, 70, 95]))
+        shapes = [Ellipsoid(0.6, center=[1.1, 1.4, 0.9]),
+                  Ellipsoid([[0.8, 0.1, 0.], [-0.1, 0.5, 0.], [0., 0., 0.3]], center=[2.9, 0.2, 1.]),
+                  Cuboid([[1., 0.2, 0.], [0.3, 0.8, 0.1], [0., 0.1, 0.7]], center=[1.5] * 3),
+                  Sphere(0.7, center=[1.5] * 3) - Sphere(0.3, center=[1.6] * 3),
+                  Sphere(0.7, center=[1.5] * 3) & Cuboid(1., center=[1.9] * 3)]
+        for s in shapes:
+            idx = g.index(s)
+            assert len(idx) > 0
+            assert np.all(idx == self._index_brute(g, s))
+
+    def test_index_shape_null(self, setup):
+        assert len(setup.g.index(NullShape())) == 0
+        assert setup.g.index(NullShape()).shape == (0, 3)
+        s = Sphere(0.5, center=[1.] * 3) & Sphere(0.5, center=[3.] * 3)
+        assert len(setup.g.index(s)) == 0
+
+    def test_index_shapes(self):
+        g = Grid([30, 25, 20], sc=SuperCell([3, 3, 3, 80, 70, 95]))
+        shapes = [Sphere(0.6, center=[1.1, 1.4, 0.9]), Sphere(0.5, center=[1.5, 1.2, 1.1]),
+                  Cuboid(0.8, center=[1.3, 1.3, 1.])]
+        union = g.index(shapes)
+        assert np.all(union == self._index_brute(g, shapes[0] | shapes[1] | shapes[2]))
+        inter = g.index(shapes, op='and')
+        assert len(inter) > 0
+        assert np.all(inter == self._index_brute(g, shapes[0] & shapes[1] & shapes[2]))
+        assert len(g.index(shapes + [NullShape()], op='and')) == 0
+        assert np.all(g.index(shapes + [NullShape()]) == union)
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_index_shapes_fail(self, setup):
+        setup.g.index([Sphere(1.), Sphere(1.)], op='xor')
+
     def test_sum(self, setup):
         for i in range(3):
             assert setup.g.sum(i).shape[i] == 1
@@ -285,6 +436,60 @@ class TestGrid(object):
     def test_argumentparser(self, setup):
         setup.g.ArgumentParser()
 
+    def _poisson_grid(self, sc, bc=None, dtype=None):
+        g = Grid([20, 24, 30], bc=bc, sc=sc, dtype=dtype)
+        idx = np.indices(g.shape).reshape(3, -1).T
+        return g, g.index2xyz(idx)
+
+    def test_poisson_periodic(self):
+        sc = SuperCell([[3., 0, 0], [1., 4., 0], [0.5, 0.3, 5.]])
+        g, xyz = self._poisson_grid(sc)
+        G = sc.rcell[0] + 2 * sc.rcell[1] - sc.rcell[2]
+        g.grid = np.cos(xyz.dot(G)).reshape(g.shape) + 2.
+        V = g.poisson()
+        assert V.shape == g.shape
+        assert np.allclose(V.cell, g.cell)
+        # constant part is removed
+        assert np.allclose(V.grid, (g.grid - 2.) / G.dot(G))
+
+    def test_poisson_periodic_complex(self):
+        sc = SuperCell([[3., 0, 0], [1., 4., 0], [0.5, 0.3, 5.]])
+        g, xyz = self._poisson_grid(sc, dtype=np.complex128)
+        G = sc.rcell[1] - sc.rcell[2]
+        g.grid = np.exp(1j * xyz.dot(G)).reshape(g.shape)
+        V = g.poisson(workers=1)
+        assert V.dtype == np.complex128
+        assert np.allclose(V.grid, g.grid / G.dot(G))
+
+    def test_poisson_dirichlet(self):
+        sc = SuperCell([[3., 0, 0], [1., 4., 0], [0., 0., 5.]])
+        g, xyz = self._poisson_grid(sc, bc=[[Grid.PERIODIC] * 2, [Grid.PERIODIC] * 2, [Grid.DIRICHLET] * 2])
+        G = sc.rcell[0]
+        k = 2 * np.pi / 5.
+        g.grid = (np.cos(xyz.dot(G)) * np.sin(k * xyz[:, 2])).reshape(g.shape)
+        V = g.poisson()
+        assert np.allclose(V.grid, g.grid / (G.dot(G) + k ** 2))
+        assert np.allclose(V.grid[:, :, 0], 0.)
+
+    def test_poisson_dirichlet_all(self):
+        sc = SuperCell([3., 4., 5.])
+        g, xyz = self._poisson_grid(sc, bc=Grid.DIRICHLET)
+        k = np.pi / sc.cell.diagonal()
+        g.grid = np.prod(np.sin(xyz * k), axis=1).reshape(g.shape)
+        V = g.poisson()
+        assert np.allclose(V.grid, g.grid / (k ** 2).sum())
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_poisson_fail_bc(self):
+        g = Grid([4, 4, 4], bc=[[Grid.PERIODIC] * 2, [Grid.PERIODIC] * 2, [Grid.NEUMANN] * 2], sc=SuperCell(2.))
+        g.poisson()
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_poisson_fail_cell(self):
+        sc = SuperCell([[3., 0, 0], [1., 4., 0], [0.5, 0., 5.]])
+        g = Grid([4, 4, 4], bc=[[Grid.PERIODIC] * 2, [Grid.PERIODIC] * 2, [Grid.DIRICHLET] * 2], sc=sc)
+        g.poisson()
+
     def test_pyamg1(self, setup):
         g = setup.g.copy()
         g.set_bc(g.PERIODIC) # periodic boundary conditions
@@ -320,3 +525,82 @@ class TestGrid(object):
         A = csr_matrix((n, n))
         b = np.zeros(A.shape[0])
         g.pyamg_boundary_condition(A, b)
+
+
+@pytest.mark.grid
+class TestGridMemmap(object):
+
+    def _grids(self, sisl_tmp):
+        np.random.seed(5)
+        sc = SuperCell([2., 3., 4.])
+        g = Grid([21, 10, 12], sc=sc)
+        g.grid = np.random.rand(*g.shape)
+        m = g.copy(sisl_tmp('grid.npy', 'sisl/grid'))
+        # chunks of 2 planes
+        m.chunk_bytes = 2 * 10 * 12 * 8
+        return g, m
+
+    def test_memmap_apply(self, sisl_tmp):
+        g, m = self._grids(sisl_tmp)
+        out = Grid.memmap(sisl_tmp('out.npy', 'sisl/grid'), g.shape, sc=g.sc)
+        assert m.apply(lambda x, y: x * y + 1, g, out=out) is out
+        assert np.allclose(out.grid, g.grid ** 2 + 1)
+        assert not (m + m).is_memmap
+        assert np.allclose((m - g).grid, 0.)
+
+    def test_memmap_create(self, sisl_tmp):
+        f = sisl_tmp('new.npy', 'sisl/grid')
+        m = Grid.memmap(f, [4, 5, 6], sc=SuperCell(2.), dtype=np.complex128)
+        assert m.is_memmap
+        assert m.shape == (4, 5, 6)
+        assert m.dtype == np.complex128
+        m.fill(1j)
+        m.flush()
+        del m
+        m = Grid.memmap(f, mode='r', sc=SuperCell(2.))
+        assert m.shape == (4, 5, 6)
+        assert np.allclose(m.grid, 1j)
+        assert not m.copy().is_memmap
+
+    @pytest.mark.xfail(raises=ValueError)
+    def test_memmap_no_shape(self, sisl_tmp):
+        Grid.memmap(sisl_tmp('new.npy', 'sisl/grid'))
+
+    def test_memmap_chunks(self, sisl_tmp):
+        g, m = self._grids(sisl_tmp)
+        assert m.is_memmap
+        assert not g.is_memmap
+        assert len(list(m._chunks())) == 11
+        assert len(list(g._chunks())) == 1
+        assert np.allclose(g.grid, m.grid)
+
+    def test_memmap_sum(self, sisl_tmp):
+        g, m = self._grids(sisl_tmp)
+        for axis in range(3):
+            assert np.allclose(g.sum(axis).grid, m.sum(axis).grid)
+            assert np.allclose(g.average(axis).grid, m.average(axis).grid)
+            assert not m.sum(axis).is_memmap
+
+    def test_memmap_sub(self, sisl_tmp):
+        g, m = self._grids(sisl_tmp)
+        for axis in range(3):
+            assert np.allclose(g.sub([1, 3, 4], axis).grid, m.sub([1, 3, 4], axis).grid)
+            assert np.allclose(g.cross_section(2, axis).grid, m.cross_section(2, axis).grid)
+
+    def test_memmap_iop(self, sisl_tmp):
+        g, m = self._grids(sisl_tmp)
+        g2 = g.copy()
+        g2 += g
+        g2 *= 2.
+        g2 -= 1.
+        g2 /= g
+        m2 = m.copy(sisl_tmp('grid2.npy', 'sisl/grid'))
+        m2.chunk_bytes = m.chunk_bytes
+        m2 += m
+        m2 *= 2.
+        m2 -= 1.
+        m2 /= g
+        assert m2.is_memmap
+        assert np.allclose(g2.grid, m2.grid)
+        m2.flush()
+        assert np.allclose(np.load(sisl_tmp('grid2.npy', 'sisl/grid')), g2.grid)
@@ -378,6 +378,44 @@ class TestSparseCSR(object):
         setup.s1.align(setup.s2)
         assert setup.s1.spsame(setup.s2)
 
+    def test_pattern_same1(self, setup):
+        setup.s1d[0, [1, 2, 3]] = 1.
+        setup.s1d[3, [1, 4]] = 2.
+        s = setup.s1d.copy()
+        assert setup.s1d._pattern_same(s)
+        # Changing the values does not change the pattern
+        s[0, 1] = 3.
+        assert setup.s1d._pattern_same(s)
+        s[0, 4] = 3.
+        assert not setup.s1d._pattern_same(s)
+        del s[0, 4]
+        assert not s._pattern_id is setup.s1d._pattern_id
+        # But the fingerprint is the same
+        assert setup.s1d._pattern_same(s)
+        s.finalize()
+        assert not setup.s1d._pattern_same(s)
+        setup.s1d.empty()
+
+    def test_pattern_same_op(self, setup):
+        for i in range(10):
+            setup.s1d[i, [i, i + 10, i + 20]] = i
+        s = setup.s1d.copy()
+        s._D[:, :] = 2.
+        # Ensure different identities of the patterns
+        s._pattern_changed()
+        assert setup.s1d._pattern_same(s)
+        t = setup.s1d + s
+        assert np.allclose(t.tocsr().toarray(), setup.s1d.tocsr().toarray() + s.tocsr().toarray())
+        t = setup.s1d * s
+        assert np.allclose(t.tocsr().toarray(), setup.s1d.tocsr().toarray() * 2)
+        t = setup.s1d - s
+        assert np.allclose(t.tocsr().toarray(), setup.s1d.tocsr().toarray() - s.tocsr().toarray())
+        t = setup.s1d / s
+        assert np.allclose(t.tocsr().toarray(), setup.s1d.tocsr().toarray() / 2)
+        t = setup.s1d ** s
+        assert np.allclose(t.tocsr().toarray(), setup.s1d.tocsr().toarray() ** 2)
+        setup.s1d.empty()
+
     def test_delete_col1(self, setup):
         s1 = setup.s1.copy()
         nc = s1.shape[1]
@@ -226,6 +226,17 @@ class TestSparseAtom(object):
         assert np.allclose(s1._csr._D, setup.s1._csr._D)
         setup.s1.empty()
 
+    def test_tile_multi(self, setup):
+        setup.s1.construct([[0.1, 1.5], [1, 2]])
+        s1 = setup.s1.tile((2, 3, 1))
+        s2 = SparseAtom(setup.g * [2, 3, 1])
+        s2.construct([[0.1, 1.5], [1, 2]])
+        assert s1.spsame(s2)
+        s1.finalize()
+        s2.finalize()
+        assert np.allclose(s1._csr._D, s2._csr._D)
+        setup.s1.empty()
+
     def test_repeat1(self, setup):
         setup.s1.construct([[0.1, 1.5], [1, 2]])
         s1 = setup.s1.repeat(2, 0).repeat(2, 1)
@@ -249,6 +260,18 @@ class TestSparseAtom(object):
         s2.finalize()
         assert np.allclose(s1._csr._D, s2._csr._D)
 
+    def test_repeat_multi(self, setup):
+        setup.s1.construct([[0.1, 1.5], [1, 2]])
+        setup.s1.finalize()
+        s1 = setup.s1.repeat((2, 3, 1))
+        setup.s1.empty()
+        s2 = SparseAtom(setup.g * ([2, 3, 1], 'r'))
+        s2.construct([[0.1, 1.5], [1, 2]])
+        assert s1.spsame(s2)
+        s1.finalize()
+        s2.finalize()
+        assert np.allclose(s1._csr._D, s2._csr._D)
+
     def test_supercell_poisition1(self, setup):
         g1 = setup.g.copy()
         g2 = setup.g.translate([100, 100, 100])
@@ -355,3 +378,93 @@ class TestSparseAtom(object):
 
         # Ensure that one does not mix everything.
         SparseAtom.fromsp(setup.g.copy(), [csr1, csr2])
+
+
+def _square_lattice(nx, ny, no=1):
+    # Square lattice with `no` orbitals per atom, randomly ordered atoms
+    from sisl import Geometry, SuperCell
+    atom = Atom(1, R=[1.1] * no)
+    g = Geometry([[0] * 3], atom, sc=SuperCell([1, 1, 10], nsc=[3, 3, 1]))
+    g = g.tile(nx, 0).tile(ny, 1)
+    np.random.seed(1)
+    g = g.sub(np.random.permutation(g.na))
+    g.set_nsc([1, 1, 1])
+    s = SparseOrbital(g)
+    for ia in g:
+        for io in g.a2o(ia, all=True):
+            s[io, g.a2o(g.close(ia, R=1.1), all=True)] = 1.
+    return s
+
+
+def _is_btd(s, pivot, btd):
+    A = s.tocsr(0).toarray()[:, :s.no]
+    A = A[pivot, :][:, pivot]
+    ptr = np.cumsum(np.insert(btd, 0, 0))
+    blk = np.searchsorted(ptr, np.arange(len(pivot)), side='right') - 1
+    i, j = A.nonzero()
+    return np.all(np.abs(blk[i] - blk[j]) <= 1)
+
+
+@pytest.mark.sparse
+@pytest.mark.sparse_geometry
+@pytest.mark.parametrize("no", [1, 2])
+def test_sparse_orbital_pivot_btd(no):
+    s = _square_lattice(8, 5, no)
+    xyz = s.geometry.xyz
+    elec = [(xyz[:, 0] < 0.1).nonzero()[0], (xyz[:, 0] > 6.9).nonzero()[0]]
+    pivot = s.pivot(elec=elec)
+    assert np.all(np.sort(pivot) == np.arange(s.no))
+    btd = s.btd(pivot, elec=elec)
+    assert np.all(btd == 5 * no)
+    assert _is_btd(s, pivot, btd)
+    # The first electrode orbitals are first
+    assert np.all(np.sort(pivot[:5 * no]) == np.sort(s.geometry.a2o(elec[0], all=True)))
+
+    # Reverse Cuthill-McKee of all orbitals
+    pivot = s.pivot()
+    btd = s.btd(pivot)
+    assert btd.sum() == s.no
+    assert _is_btd(s, pivot, btd)
+    # Better than the electrode ordering
+    assert (btd ** 3).sum() < 8 * (5 * no) ** 3
+
+
+@pytest.mark.sparse
+@pytest.mark.sparse_geometry
+def test_sparse_orbital_pivot_device():
+    s = _square_lattice(6, 3)
+    xyz = s.geometry.xyz
+    atom = (xyz[:, 0] < 3.9).nonzero()[0]
+    elec = [(xyz[:, 0] < 0.1).nonzero()[0], np.logical_and(2.9 < xyz[:, 0], xyz[:, 0] < 3.1).nonzero()[0]]
+    pivot = s.pivot(atom, elec=elec)
+    assert np.all(np.sort(pivot) == np.sort(s.geometry.a2o(atom, all=True)))
+    assert np.all(s.btd(pivot, elec=elec) == 3)
+    # The electrodes are kept in one block
+    elec[1] = [elec[1][0], elec[0][0]]
+    btd = s.btd(pivot, elec=elec)
+    assert _is_btd(s, pivot, btd)
+    assert btd[0] > np.nonzero(pivot == elec[1][0])[0][0]
+
+
+@pytest.mark.sparse
+@pytest.mark.sparse_geometry
+def test_sparse_orbital_btd_chain():
+    # Large devices merge the smallest blocks to (at least) n // 10000 orbitals
+    from sisl import Geometry, SuperCell
+    n = 20000
+    g = Geometry([[0] * 3], Atom(1, R=1.1), sc=SuperCell([1, 10, 10], nsc=[3, 1, 1])).tile(n, 0)
+    g.set_nsc([1, 1, 1])
+    s = SparseOrbital(g, nnzpr=3)
+    for io in range(n):
+        s[io, [max(io - 1, 0), io, min(io + 1, n - 1)]] = 1.
+    btd = s.btd(np.arange(n))
+    assert btd.sum() == n
+    assert np.all(btd == 2)
+
+
+@pytest.mark.sparse
+@pytest.mark.sparse_geometry
+@pytest.mark.xfail(raises=ValueError)
+def test_sparse_orbital_pivot_elec_fail():
+    s = _square_lattice(6, 3)
+    s.pivot(atom=[0, 1], elec=[[2]])